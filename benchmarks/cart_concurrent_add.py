@@ -0,0 +1,111 @@
+"""Bắn song song hàng trăm lượt POST /cart cùng 1 món và kiểm tra số lượng cuối cùng.
+
+Cách dùng (docker-compose đang chạy, đã chạy init_data.py để có tài khoản khach1@gmail.com):
+    python benchmarks/cart_concurrent_add.py
+    python benchmarks/cart_concurrent_add.py --adds 1000 --concurrency 200 --food-id 3 --branch-id 1
+
+Gọi thẳng cart_service (không qua rate limit của gateway). Giỏ của user bị xóa trước khi chạy.
+Thoát với mã 1 nếu số lượng cuối khác tổng đã cộng, giỏ có dòng trùng food_id,
+hoặc lượt thêm món của chi nhánh khác không bị từ chối (409).
+"""
+import argparse
+import asyncio
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def login(args) -> str:
+    async with httpx.AsyncClient(timeout=10) as client:
+        res = await client.post(f"{args.user_url}/login", json={"email": args.email, "password": args.password})
+        res.raise_for_status()
+        return res.json()["access_token"]
+
+
+async def add(client, args, branch_id, semaphore, latencies):
+    async with semaphore:
+        started = time.perf_counter()
+        try:
+            res = await client.post(f"{args.url}/cart", json={
+                "food_id": args.food_id, "branch_id": branch_id, "quantity": args.quantity,
+            })
+        except httpx.HTTPError as e:
+            return type(e).__name__
+        latencies.append(time.perf_counter() - started)
+        return res.status_code
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8005")
+    parser.add_argument("--user-url", default="http://localhost:8001")
+    parser.add_argument("--email", default="khach1@gmail.com")
+    parser.add_argument("--password", default="Admin@123")
+    parser.add_argument("--adds", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--quantity", type=int, default=1)
+    parser.add_argument("--food-id", type=int, default=1)
+    parser.add_argument("--branch-id", type=int, default=1)
+    # Số lượt thêm món của chi nhánh khác xen vào, tất cả phải bị 409
+    parser.add_argument("--conflicts", type=int, default=20)
+    args = parser.parse_args()
+
+    headers = {"Authorization": f"Bearer {await login(args)}"}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(headers=headers, limits=limits, timeout=30) as client:
+        (await client.delete(f"{args.url}/cart")).raise_for_status()
+        # Món đầu tiên tạo giỏ ở branch_id, sau đó mới bắn song song
+        first = await client.post(f"{args.url}/cart", json={
+            "food_id": args.food_id, "branch_id": args.branch_id, "quantity": args.quantity,
+        })
+        first.raise_for_status()
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies = []
+        branches = [args.branch_id] * (args.adds - 1) + [args.branch_id + 1] * args.conflicts
+        started = time.perf_counter()
+        results = await asyncio.gather(*(add(client, args, branch_id, semaphore, latencies)
+                                         for branch_id in branches))
+        elapsed = time.perf_counter() - started
+
+        cart = (await client.get(f"{args.url}/cart")).json()
+
+    same_branch = Counter(status for status, b in zip(results, branches) if b == args.branch_id)
+    other_branch = Counter(status for status, b in zip(results, branches) if b != args.branch_id)
+    expected = (1 + same_branch[200]) * args.quantity
+    lines = [line for line in cart if line["food_id"] == args.food_id]
+    quantity = sum(line["quantity"] for line in lines)
+
+    print(f"🚀 {len(branches)} request trong {elapsed:.2f}s | {len(branches) / elapsed:.1f} req/s | "
+          f"p50={percentile(latencies, 0.5) * 1000:.1f}ms p99={percentile(latencies, 0.99) * 1000:.1f}ms")
+    print(f"📊 Cùng chi nhánh: {dict(same_branch)} | khác chi nhánh: {dict(other_branch)}")
+    print(f"🛒 Số lượng trong giỏ: {quantity} (mong đợi {expected}), {len(lines)} dòng cho món {args.food_id}")
+
+    failures = []
+    if same_branch[200] != args.adds - 1:
+        failures.append(f"{args.adds - 1 - same_branch[200]} lượt thêm cùng chi nhánh không thành công")
+    if quantity != expected:
+        failures.append(f"mất lượt cộng: {quantity} != {expected}")
+    if len(lines) != 1:
+        failures.append(f"món {args.food_id} có {len(lines)} dòng trong giỏ (phải là 1)")
+    if other_branch and set(other_branch) != {409}:
+        failures.append(f"thêm món chi nhánh khác không bị chặn: {dict(other_branch)}")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        sys.exit(1)
+    print("🎉 Không mất lượt cộng, không có dòng trùng")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""Đo throughput của POST /checkout với giỏ 1 / 10 / 50 món.
+
+Cách dùng (docker-compose đang chạy, gọi thẳng order_service để không bị rate limit của gateway):
+    python benchmarks/checkout_throughput.py
+    python benchmarks/checkout_throughput.py --sizes 1 10 50 --concurrency 20 --duration 15
+
+Mỗi cỡ giỏ chạy --duration giây với --concurrency kết nối đồng thời. order_service tự tính giá
+từ bảng giá nên giỏ phải là món thật: lấy danh sách món của --branch-id từ restaurant_service
+(giỏ lớn hơn số món thì lặp lại món). Đơn tạo ra có customer_name "Benchmark" để dễ xóa sau khi đo.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def build_payload(size, branch_id, food_ids):
+    # Mỗi món 1 dòng: giỏ lớn hơn thực đơn thì cộng dồn số lượng vào các món đã có
+    quantities = {}
+    for i in range(size):
+        food_id = food_ids[i % len(food_ids)]
+        quantities[food_id] = quantities.get(food_id, 0) + 1 + i % 3
+    return {
+        "user_id": 1,
+        "branch_id": branch_id,
+        "customer_name": "Benchmark",
+        "customer_phone": "0900000000",
+        "delivery_address": "benchmark",
+        "items": [{"food_id": food_id, "quantity": quantity} for food_id, quantity in quantities.items()],
+    }
+
+
+async def worker(client, url, payload, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            res = await client.post(url, json=payload)
+            if res.status_code != 200:
+                errors.append(res.status_code)
+                continue
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(client, args, size, food_ids):
+    payload = build_payload(size, args.branch_id, food_ids)
+    latencies, errors = [], []
+    deadline = time.perf_counter() + args.duration
+    await asyncio.gather(*(worker(client, args.url, payload, deadline, latencies, errors)
+                           for _ in range(args.concurrency)))
+    print(f"🛒 {size:>3} món | {len(latencies) / args.duration:8.1f} đơn/s | "
+          f"p50={percentile(latencies, 0.5) * 1000:7.1f}ms p99={percentile(latencies, 0.99) * 1000:7.1f}ms | "
+          f"lỗi: {len(errors)}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8003/checkout")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--restaurant-url", default="http://localhost:8002")
+    parser.add_argument("--branch-id", type=int, default=1)
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        foods = (await client.get(f"{args.restaurant_url}/foods", params={"branch_id": args.branch_id})).json()
+        food_ids = [food["id"] for food in foods]
+        if not food_ids:
+            raise SystemExit(f"❌ Chi nhánh {args.branch_id} chưa có món nào")
+        print(f"🚀 POST {args.url} | {args.concurrency} kết nối | {args.duration:.0f}s mỗi cỡ giỏ")
+        for size in args.sizes:
+            await run(client, args, size, food_ids)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
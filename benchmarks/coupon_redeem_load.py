@@ -0,0 +1,132 @@
+"""Bắn đồng thời nhiều lượt redeem cùng 1 mã và kiểm tra không vượt giới hạn.
+
+Cách dùng (docker-compose đang chạy, gọi thẳng restaurant_service vì /coupons/redeem là API nội bộ):
+    SECRET_KEY=<như trong .env> python benchmarks/coupon_redeem_load.py
+    SECRET_KEY=<như trong .env> python benchmarks/coupon_redeem_load.py --requests 1000 --users 200 --max-uses 100 --per-user-limit 2
+
+/coupons/redeem chỉ nhận request nội bộ có token dịch vụ + danh tính user đã ký, nên script tự ký
+bằng common/auth.py (cần SECRET_KEY hoặc IDENTITY_SIGNING_KEY giống các dịch vụ, và cài fastapi, python-jose).
+
+Mỗi lần chạy tạo 1 mã mới BENCH-xxxx ở chi nhánh --branch-id, bắn --requests lượt redeem với
+order_id khác nhau từ --users user, đồng thời gửi lại --replays order_id đầu tiên lần nữa.
+Thoát với mã 1 nếu:
+  - số lượt thành công vượt max_uses hoặc 1 user vượt per_user_limit
+  - used_count trong DB khác số order redeem thành công
+  - gửi lại cùng order_id cho kết quả khác lần đầu
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import auth  # noqa: E402
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def redeem(client, args, code, user_id, order_id, latencies):
+    started = time.perf_counter()
+    try:
+        # Giống order_service: token dịch vụ + danh tính user đã ký
+        headers = auth.service_headers({"id": user_id, "role": "buyer", "exp": time.time() + 3600})
+        res = await client.post(f"{args.url}/coupons/redeem", headers=headers, json={
+            "code": code, "order_id": order_id, "branch_id": args.branch_id,
+        })
+    except httpx.HTTPError as e:
+        return order_id, user_id, type(e).__name__
+    latencies.append(time.perf_counter() - started)
+    return order_id, user_id, res.status_code
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8002")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--max-uses", type=int, default=50)
+    parser.add_argument("--per-user-limit", type=int, default=1)
+    parser.add_argument("--replays", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--branch-id", type=int, default=1)
+    args = parser.parse_args()
+    if not auth.SERVICE_TOKEN:
+        raise SystemExit("❌ Cần SECRET_KEY (hoặc IDENTITY_SIGNING_KEY) giống các dịch vụ để ký request nội bộ")
+
+    code = f"BENCH-{uuid.uuid4().hex[:8].upper()}"
+    # order_id giả, đủ lớn để không đụng đơn thật
+    base_order = random.randint(10 ** 8, 2 * 10 ** 9)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        now = datetime.utcnow()
+        res = await client.post(f"{args.url}/coupons", json={
+            "code": code, "discount_percent": 10, "branch_id": args.branch_id,
+            "start_date": (now - timedelta(minutes=1)).isoformat(),
+            "end_date": (now + timedelta(hours=1)).isoformat(),
+            "max_uses": args.max_uses, "per_user_limit": args.per_user_limit,
+        })
+        res.raise_for_status()
+        print(f"🎟️ Mã {code}: max_uses={args.max_uses}, per_user_limit={args.per_user_limit}")
+
+        latencies = []
+        jobs = [(random.randint(1, args.users), base_order + i) for i in range(args.requests)]
+        # Gửi lại 1 số order_id ngay trong cùng đợt để thử idempotency khi 2 request chạy song song
+        jobs += jobs[:args.replays]
+        random.shuffle(jobs)
+        started = time.perf_counter()
+        results = await asyncio.gather(*(redeem(client, args, code, user_id, order_id, latencies)
+                                         for user_id, order_id in jobs))
+        elapsed = time.perf_counter() - started
+
+        # Lượt thứ 2 (tuần tự) cho các order đã gửi lặp: phải ra đúng kết quả như lần đầu
+        replayed = await asyncio.gather(*(redeem(client, args, code, user_id, order_id, latencies)
+                                          for user_id, order_id in jobs[:args.replays]))
+
+        coupons = (await client.get(f"{args.url}/coupons", params={"branch_id": args.branch_id})).json()
+        used_count = next(c.get("used_count") for c in coupons if c["code"] == code)
+
+    statuses = Counter(status for _, _, status in results)
+    redeemed = {order_id: user_id for order_id, user_id, status in results if status == 200}
+    per_user = Counter(redeemed.values())
+    first = {order_id: status for order_id, _, status in results}
+
+    print(f"🚀 {len(jobs)} request trong {elapsed:.2f}s | {len(jobs) / elapsed:.1f} req/s | "
+          f"p50={percentile(latencies, 0.5) * 1000:.1f}ms p99={percentile(latencies, 0.99) * 1000:.1f}ms")
+    print(f"📊 Trạng thái: {dict(statuses)} | order redeem thành công: {len(redeemed)} | used_count DB: {used_count}")
+
+    failures = []
+    if len(redeemed) > args.max_uses:
+        failures.append(f"{len(redeemed)} lượt thành công > max_uses {args.max_uses}")
+    if per_user and max(per_user.values()) > args.per_user_limit:
+        failures.append(f"user dùng {max(per_user.values())} lượt > per_user_limit {args.per_user_limit}")
+    if used_count != len(redeemed):
+        failures.append(f"used_count {used_count} != {len(redeemed)} order thành công")
+    mismatched = [order_id for order_id, _, status in replayed
+                  if (status == 200) != (order_id in redeemed) or (status != 200 and status != first[order_id])]
+    if mismatched:
+        failures.append(f"{len(mismatched)} order gửi lại cho kết quả khác lần đầu")
+    errors = sum(count for status, count in statuses.items() if status not in (200, 404, 409))
+    if errors:
+        failures.append(f"{errors} request lỗi (5xx/timeout)")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        sys.exit(1)
+    print("🎉 Không vượt giới hạn, redeem lặp lại idempotent")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
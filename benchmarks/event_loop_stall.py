@@ -0,0 +1,141 @@
+"""Đo thời gian event loop bị chặn (stall) của 1 dịch vụ khi chịu tải đồng thời.
+
+Cách dùng (docker-compose đang chạy):
+    python benchmarks/event_loop_stall.py --url http://localhost:8005/cart
+    python benchmarks/event_loop_stall.py --url http://localhost:8003/checkout --method POST --body '{...}'
+
+Chạy 1 lần ở commit cũ (route async + SessionLocal sync) và 1 lần ở commit hiện tại
+(AsyncSessionLocal) rồi so sánh. Số liệu stall lấy từ histogram event_loop_lag_seconds
+trên /metrics của chính dịch vụ đó (hiệu số trước/sau khi bắn tải). Bản cũ chưa có
+histogram này thì so bằng độ trễ của probe: 1 request nhẹ gửi đều đặn trong lúc bắn tải,
+loop bị chặn bao lâu thì probe chờ bấy lâu.
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import httpx
+from jose import jwt
+
+# --- CẤU HÌNH ---
+SECRET_KEY = "supersecretkey123"
+ALGORITHM = "HS256"
+LAG_METRIC = "event_loop_lag_seconds"
+
+
+# --- HÀM HỖ TRỢ ---
+def create_headers(user_id=1, role="customer"):
+    payload = {"sub": f"bench_{user_id}", "id": user_id, "role": role,
+               "exp": datetime.utcnow() + timedelta(minutes=30)}
+    token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def scrape_lag(client, metrics_url):
+    """Trả về (các bucket tích lũy {le: count}, tổng giây, số mẫu) của histogram độ trễ loop."""
+    text = (await client.get(metrics_url)).text
+    buckets, total, count = {}, 0.0, 0
+    for line in text.splitlines():
+        if line.startswith(f"{LAG_METRIC}_bucket"):
+            le = line.split('le="')[1].split('"')[0]
+            buckets[le] = float(line.rsplit(" ", 1)[1])
+        elif line.startswith(f"{LAG_METRIC}_sum"):
+            total = float(line.rsplit(" ", 1)[1])
+        elif line.startswith(f"{LAG_METRIC}_count"):
+            count = int(float(line.rsplit(" ", 1)[1]))
+    return buckets, total, count
+
+
+def quantile_from_buckets(buckets, count, q):
+    # Ước lượng theo cận trên của bucket đầu tiên đạt tới phân vị q
+    if count <= 0:
+        return 0.0
+    for le, cumulative in sorted(buckets.items(), key=lambda kv: float(kv[0])):
+        if cumulative >= q * count:
+            return float(le)
+    return float("inf")
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def probe(client, url, deadline, latencies, interval=0.05):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            await client.get(url)
+            latencies.append(time.perf_counter() - started)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(interval)
+
+
+async def worker(client, args, headers, deadline, latencies, errors):
+    body = json.loads(args.body) if args.body else None
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            res = await client.request(args.method, args.url, headers=headers, json=body)
+            if res.status_code >= 500:
+                errors.append(res.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8005/cart")
+    parser.add_argument("--metrics-url", help="mặc định: <scheme>://<host>/metrics của --url")
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--body", help="JSON body cho POST/PUT")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20)
+    args = parser.parse_args()
+
+    parts = urlsplit(args.url)
+    metrics_url = args.metrics_url or f"{parts.scheme}://{parts.netloc}/metrics"
+    headers = create_headers()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        # Gọi thử 1 lần để dịch vụ bật bộ đo độ trễ loop
+        await client.get(metrics_url)
+        await asyncio.sleep(1)
+        before = await scrape_lag(client, metrics_url)
+
+        latencies, errors, probes = [], [], []
+        deadline = time.perf_counter() + args.duration
+        print(f"🚀 {args.method} {args.url} | {args.concurrency} kết nối | {args.duration:.0f}s")
+        # Probe đi kết nối riêng để không phải xếp hàng sau các worker trong pool của client
+        async with httpx.AsyncClient(timeout=30) as probe_client:
+            await asyncio.gather(probe(probe_client, metrics_url, deadline, probes),
+                                 *(worker(client, args, headers, deadline, latencies, errors)
+                                   for _ in range(args.concurrency)))
+        after = await scrape_lag(client, metrics_url)
+
+    buckets = {le: after[0].get(le, 0) - before[0].get(le, 0) for le in after[0]}
+    lag_total, lag_count = after[1] - before[1], after[2] - before[2]
+
+    print(f"📊 Requests: {len(latencies)} ({len(latencies) / args.duration:.0f} req/s), lỗi: {len(errors)}")
+    print(f"   Latency p50={percentile(latencies, 0.5) * 1000:.1f}ms p99={percentile(latencies, 0.99) * 1000:.1f}ms")
+    print(f"🩺 Probe {metrics_url}: p50={percentile(probes, 0.5) * 1000:.1f}ms "
+          f"p99={percentile(probes, 0.99) * 1000:.1f}ms max={max(probes, default=0) * 1000:.1f}ms")
+    if lag_count <= 0:
+        print(f"⚠️ Dịch vụ chưa xuất {LAG_METRIC}, chỉ so sánh được bằng probe")
+        return
+    print(f"⏱️  Event loop stall: tổng {lag_total:.3f}s trong {args.duration:.0f}s "
+          f"({lag_total / args.duration * 100:.1f}% thời gian), "
+          f"trung bình {lag_total / max(lag_count, 1) * 1000:.2f}ms/lần đo, "
+          f"p99 <= {quantile_from_buckets(buckets, lag_count, 0.99) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
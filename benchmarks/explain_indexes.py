@@ -0,0 +1,98 @@
+"""Chạy EXPLAIN cho các truy vấn nóng và kiểm tra MySQL có dùng index hay không.
+
+Cách dùng (docker-compose đang chạy, các dịch vụ đã khởi động 1 lần để chạy migration):
+    python benchmarks/explain_indexes.py
+    MYSQL_HOST=127.0.0.1 MYSQL_PORT=3307 python benchmarks/explain_indexes.py
+
+Thoát với mã 1 nếu có truy vấn quét toàn bảng (type=ALL) trên bảng đủ lớn.
+Bảng gần như rỗng thì optimizer hay chọn quét thẳng; khi đó chỉ yêu cầu index mong đợi
+nằm trong possible_keys.
+"""
+import os
+import sys
+
+import pymysql
+
+# --- CẤU HÌNH ---
+MYSQL_HOST = os.getenv("MYSQL_HOST", "127.0.0.1")
+MYSQL_PORT = int(os.getenv("MYSQL_PORT", 3307))
+MYSQL_USER = os.getenv("MYSQL_USER", "root")
+MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "123456")
+SMALL_TABLE_ROWS = 1000
+
+# (database, mô tả, câu SQL giống truy vấn của dịch vụ, các index chấp nhận)
+QUERIES = [
+    ("order_db", "GET /orders?branch_id",
+     "SELECT * FROM orders WHERE branch_id = 1 ORDER BY created_at DESC, id DESC LIMIT 51",
+     {"ix_orders_branch_created"}),
+    ("order_db", "GET /orders?branch_id&cursor",
+     "SELECT * FROM orders WHERE branch_id = 1 AND (created_at < '2030-01-01' "
+     "OR (created_at = '2030-01-01' AND id < 100)) ORDER BY created_at DESC, id DESC LIMIT 51",
+     {"ix_orders_branch_created"}),
+    ("order_db", "GET /orders?user_id",
+     "SELECT * FROM orders WHERE user_id = 1 ORDER BY created_at DESC, id DESC LIMIT 51",
+     {"ix_orders_user_created"}),
+    ("order_db", "GET /orders",
+     "SELECT * FROM orders ORDER BY created_at DESC, id DESC LIMIT 51",
+     {"ix_orders_created"}),
+    ("order_db", "Dashboard: đơn theo trạng thái",
+     "SELECT * FROM orders WHERE branch_id = 1 AND status = 'PENDING'",
+     {"ix_orders_branch_status", "ix_orders_branch_created"}),
+    ("order_db", "selectinload(Order.items)",
+     "SELECT * FROM order_items WHERE order_id IN (1, 2, 3)",
+     {"ix_order_items_order_id"}),
+    ("cart_db", "PUT /cart",
+     "SELECT * FROM cart_items WHERE user_id = 1 AND food_id = 1",
+     {"uq_cart_items_user_food"}),
+    ("restaurant_db", "GET /foods?branch_id",
+     "SELECT * FROM foods WHERE branch_id = 1",
+     {"ix_foods_branch_id"}),
+    ("restaurant_db", "GET /coupons/check/{code}",
+     "SELECT * FROM coupons WHERE code = 'SALE10' AND is_active = 1 AND end_date > NOW() LIMIT 1",
+     {"ix_coupons_code_active_end"}),
+]
+
+
+def explain(cursor, sql):
+    cursor.execute(f"EXPLAIN {sql}")
+    columns = [c[0] for c in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def main():
+    failures = 0
+    connections = {}
+    try:
+        for database, label, sql, expected in QUERIES:
+            if database not in connections:
+                connections[database] = pymysql.connect(
+                    host=MYSQL_HOST, port=MYSQL_PORT, user=MYSQL_USER,
+                    password=MYSQL_PASSWORD, database=database,
+                )
+            with connections[database].cursor() as cursor:
+                plan = explain(cursor, sql)[0]
+
+            key = plan.get("key")
+            possible = set((plan.get("possible_keys") or "").split(","))
+            rows = plan.get("rows") or 0
+            if key in expected:
+                print(f"✅ {label}: dùng {key} (type={plan.get('type')}, rows~{rows})")
+            elif key:
+                print(f"⚠️ {label}: dùng {key}, không phải {', '.join(sorted(expected))} (rows~{rows})")
+            elif rows < SMALL_TABLE_ROWS and possible & expected:
+                print(f"✅ {label}: bảng nhỏ ({rows} dòng) nên quét thẳng, index sẵn sàng: {', '.join(sorted(possible & expected))}")
+            else:
+                failures += 1
+                print(f"❌ {label}: KHÔNG dùng index (type={plan.get('type')}, rows~{rows}, possible_keys={plan.get('possible_keys')})")
+    finally:
+        for connection in connections.values():
+            connection.close()
+
+    if failures:
+        print(f"❌ {failures} truy vấn không dùng index")
+        sys.exit(1)
+    print("🎉 Tất cả truy vấn nóng đều có index")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,78 @@
+import asyncio
 import httpx
-from fastapi import FastAPI, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
-from database import SessionLocal, engine, Base
-import models
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Request
+from pydantic import BaseModel
+from database import AsyncSessionLocal, engine, async_engine, run_migrations, warm_up, warm_up_async
+from menu import menu_cache, run_refresher
+from store import BRANCH_CONFLICT, CartError, create_cart_store, run_maintenance
+from common import auth
+from common import metrics
+from common import tracing
 
 # Tạo lại bảng
-Base.metadata.create_all(bind=engine)
+run_migrations()
 
-app = FastAPI()
+# Kho giỏ hàng chọn theo CART_STORE (sql | memory | redis), xem store.py
+cart_store = create_cart_store(AsyncSessionLocal)
+CART_BATCH_MAX_OPERATIONS = 100
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Mở sẵn kết nối DB trước khi nhận request
+    warm_up()
+    await warm_up_async()
+    if hasattr(cart_store, "load"):
+        await cart_store.load()
+    maintenance = None
+    # Kho RAM cần dọn giỏ hết hạn, write-behind cần flush định kỳ
+    if hasattr(cart_store, "flush") or hasattr(cart_store, "sweep"):
+        maintenance = asyncio.create_task(run_maintenance(cart_store))
+    # Snapshot giá món từ restaurant_service, làm mới định kỳ bằng ETag
+    menu_refresher = asyncio.create_task(run_refresher(menu_cache))
+    yield
+    menu_refresher.cancel()
+    if maintenance:
+        maintenance.cancel()
+    await menu_cache.aclose()
+    if hasattr(cart_store, "aclose"):
+        await cart_store.aclose()
+    await auth.aclose()
+    await async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
+
+# --- METRICS (/metrics) ---
+metrics.instrument(app, engines=[engine, async_engine])
+
+# --- TRACING (traceparent W3C) ---
+tracing.instrument(app, "cart_service")
 
 # --- AUTH HELPER ---
 async def get_user_id(request: Request):
-    token = request.headers.get("Authorization")
-    if not token:
-        raise HTTPException(status_code=401, detail="Missing Token")
     try:
-        # Gọi User Service xác thực (qua Gateway hoặc trực tiếp)
-        async with httpx.AsyncClient() as client:
-            res = await client.get("http://user_service:8001/verify", headers={"Authorization": token})
-            if res.status_code != 200:
-                raise HTTPException(status_code=401, detail="Invalid Token")
-            return res.json()['id']
-    except Exception as e:
+        # Dùng danh tính gateway đã ký; không có thì tự giải mã JWT (có cache)
+        claims = await auth.get_identity(request)
+    except httpx.RequestError as e:
         raise HTTPException(status_code=401, detail=str(e))
+    return claims['id']
+
+class CartOperation(BaseModel):
+    op: str  # add | set | remove
+    food_id: int
+    quantity: int = 1
+    branch_id: Optional[int] = None
+
+class CartBatch(BaseModel):
+    operations: List[CartOperation]
 
 # ==========================================
 # API GIỎ HÀNG THÔNG MINH
 # ==========================================
 
 @app.post("/cart")
-async def add_to_cart(item: dict, request: Request, db: Session = Depends(get_db)):
+async def add_to_cart(item: dict, request: Request):
     user_id = await get_user_id(request)
     
     # Nhận dữ liệu từ UI
@@ -47,59 +83,51 @@ async def add_to_cart(item: dict, request: Request, db: Session = Depends(get_db
     if not b_id:
         raise HTTPException(status_code=400, detail="Missing branch_id")
 
-    # 1. Kiểm tra giỏ hàng hiện tại
-    existing_items = db.query(models.CartItem).filter(models.CartItem.user_id == user_id).all()
-    
-    if existing_items:
-        # Lấy branch_id của món đầu tiên trong giỏ
-        current_branch = existing_items[0].branch_id
-        
-        # Nếu khác branch -> Báo lỗi ngay
-        if current_branch != b_id:
-             raise HTTPException(status_code=409, detail=f"Giỏ hàng đang chứa món của quán khác. Vui lòng xóa giỏ hàng cũ trước!")
-            
-        # Nếu cùng branch -> Cộng dồn số lượng nếu trùng món
-        found = False
-        for cart_item in existing_items:
-            if cart_item.food_id == f_id:
-                cart_item.quantity += qty
-                found = True
-                break
-        
-        if not found:
-            new_item = models.CartItem(user_id=user_id, food_id=f_id, quantity=qty, branch_id=b_id)
-            db.add(new_item)
-            
-    else:
-        # Giỏ trống -> Thêm mới
-        new_item = models.CartItem(user_id=user_id, food_id=f_id, quantity=qty, branch_id=b_id)
-        db.add(new_item)
-
-    db.commit()
+    # Cộng dồn nguyên tử trong kho; giỏ đang chứa món của branch khác -> báo lỗi
+    if not await cart_store.add(user_id, f_id, qty, b_id):
+        raise HTTPException(status_code=409, detail=BRANCH_CONFLICT)
     return {"message": "Added"}
 
 @app.get("/cart")
-async def get_my_cart(request: Request, db: Session = Depends(get_db)):
+async def get_my_cart(request: Request):
     user_id = await get_user_id(request)
-    return db.query(models.CartItem).filter(models.CartItem.user_id == user_id).all()
+    # Dòng đã gắn tên/giá từ snapshot + tạm tính, frontend không phải gọi /foods/{id} cho từng món
+    return await menu_cache.price(await cart_store.items(user_id))
 
 @app.put("/cart")
-async def update_cart(item: dict, request: Request, db: Session = Depends(get_db)):
+async def update_cart(item: dict, request: Request):
     user_id = await get_user_id(request)
     f_id = item.get('food_id')
     qty = item.get('quantity')
     
-    cart_item = db.query(models.CartItem).filter(models.CartItem.user_id == user_id, models.CartItem.food_id == f_id).first()
-    if cart_item:
-        if qty <= 0: db.delete(cart_item)
-        else: cart_item.quantity = qty
-        db.commit()
+    if await cart_store.set_quantity(user_id, f_id, qty):
         return {"message": "Updated"}
     raise HTTPException(status_code=404, detail="Item not found")
 
 @app.delete("/cart")
-async def clear_cart(request: Request, db: Session = Depends(get_db)):
+async def clear_cart(request: Request):
+    user_id = await get_user_id(request)
+    await cart_store.clear(user_id)
+    return {"message": "Cleared"}
+
+@app.patch("/cart/batch")
+async def batch_update_cart(payload: CartBatch, request: Request):
+    """Áp nhiều thao tác add/set/remove trong 1 request, 1 lần xác thực, 1 transaction.
+    Thao tác nào lỗi thì cả lô không được áp. Trả về giỏ sau khi áp."""
     user_id = await get_user_id(request)
-    db.query(models.CartItem).filter(models.CartItem.user_id == user_id).delete()
-    db.commit()
-    return {"message": "Cleared"}
\ No newline at end of file
+    if len(payload.operations) > CART_BATCH_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {CART_BATCH_MAX_OPERATIONS} operations per batch")
+    for op in payload.operations:
+        if op.op not in ("add", "set", "remove"):
+            raise HTTPException(status_code=400, detail=f"Unknown operation: {op.op}")
+        if op.op == "add" and not op.branch_id:
+            raise HTTPException(status_code=400, detail="Missing branch_id")
+
+    try:
+        lines = await cart_store.apply(user_id, [
+            {"op": op.op, "food_id": op.food_id, "quantity": op.quantity, "branch_id": op.branch_id}
+            for op in payload.operations
+        ])
+    except CartError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return await menu_cache.price(lines)
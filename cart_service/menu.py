@@ -0,0 +1,102 @@
+import asyncio
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+from common import tracing
+
+# --- CẤU HÌNH SNAPSHOT THỰC ĐƠN ---
+# Bản sao giá/tên món lấy từ restaurant_service, để GET /cart trả luôn dòng đã tính tiền
+RESTAURANT_MENU_URL = os.getenv("RESTAURANT_MENU_URL", "http://restaurant_service:8002/foods/snapshot")
+MENU_REFRESH_SECONDS = float(os.getenv("CART_MENU_REFRESH_SECONDS", 15))
+# Gặp food_id chưa có trong snapshot (món vừa tạo) thì hỏi lại, nhưng không dày hơn mức này
+MENU_MISS_REFRESH_SECONDS = float(os.getenv("CART_MENU_MISS_REFRESH_SECONDS", 2))
+
+
+class MenuCache:
+    """food_id -> {name, price, discount, final_price, image_url, branch_id}. Làm mới bằng
+    If-None-Match: thực đơn không đổi thì restaurant_service trả 304, không tải lại."""
+
+    def __init__(self, url: str = RESTAURANT_MENU_URL):
+        self.url = url
+        self.foods: Dict[int, dict] = {}
+        self.etag: Optional[str] = None
+        self.version: Optional[str] = None
+        self.refreshed_at = 0.0
+        self.not_modified = 0
+        self.lock: Optional[asyncio.Lock] = None
+        self.client: Optional[httpx.AsyncClient] = None
+
+    async def refresh(self):
+        # Tạo lock/client trong event loop đang chạy, không tạo lúc import module
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        started = self.refreshed_at
+        async with self.lock:
+            # Trong lúc chờ lock đã có lần làm mới khác xong -> dùng luôn kết quả đó, không tải lại
+            if self.refreshed_at != started:
+                return
+            if self.client is None:
+                self.client = httpx.AsyncClient(timeout=5, transport=tracing.httpx_transport())
+            headers = {"If-None-Match": self.etag} if self.etag else {}
+            res = await self.client.get(self.url, headers=headers)
+            self.refreshed_at = time.monotonic()
+            if res.status_code == 304:
+                self.not_modified += 1
+                return
+            res.raise_for_status()
+            data = res.json()
+            # Đổi cả dict 1 lần, request đang đọc bản cũ không thấy trạng thái dở dang
+            self.foods = {food["id"]: food for food in data["foods"]}
+            self.version = data["version"]
+            self.etag = res.headers.get("etag")
+
+    async def ensure(self, food_ids: Iterable[int]):
+        """Snapshot thiếu món nào thì làm mới ngay (có giới hạn tần suất), lỗi thì dùng bản đang có."""
+        if all(food_id in self.foods for food_id in food_ids):
+            return
+        if time.monotonic() - self.refreshed_at < MENU_MISS_REFRESH_SECONDS:
+            return
+        try:
+            await self.refresh()
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            print(f"⚠️ Menu snapshot refresh error: {e}")
+
+    async def price(self, lines: List[dict]) -> dict:
+        """Gắn tên/giá/ảnh vào từng dòng giỏ và tính tạm tính."""
+        await self.ensure(line["food_id"] for line in lines)
+        priced, subtotal = [], 0
+        for line in lines:
+            food = self.foods.get(line["food_id"])
+            if food is None:
+                # Món đã bị xóa khỏi thực đơn
+                priced.append({**line, "name": "Món đã xóa", "price": 0, "original_price": 0, "discount": 0,
+                               "image_url": None, "line_total": 0, "available": False})
+                continue
+            line_total = food["final_price"] * line["quantity"]
+            subtotal += line_total
+            priced.append({**line, "name": food["name"], "price": food["final_price"],
+                           "original_price": food["price"], "discount": food["discount"],
+                           "image_url": food["image_url"], "line_total": line_total, "available": True})
+        return {"items": priced, "subtotal": subtotal, "menu_version": self.version}
+
+    def stats(self) -> dict:
+        return {"foods": len(self.foods), "version": self.version, "not_modified": self.not_modified}
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+
+
+menu_cache = MenuCache()
+
+
+async def run_refresher(cache: MenuCache, interval: float = MENU_REFRESH_SECONDS):
+    while True:
+        try:
+            await cache.refresh()
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            print(f"⚠️ Menu snapshot refresh error: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,26 @@
+from alembic import context
+
+from database import Base, SQLALCHEMY_DATABASE_URL, engine
+import models  # noqa: F401  (nạp model để Base.metadata có đủ bảng cho --autogenerate)
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline():
+    # alembic upgrade head --sql: chỉ in ra SQL, không kết nối DB
+    context.configure(url=SQLALCHEMY_DATABASE_URL, target_metadata=target_metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
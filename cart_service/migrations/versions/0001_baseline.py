@@ -0,0 +1,39 @@
+"""Baseline: schema cart_db như khi còn tạo bằng Base.metadata.create_all.
+
+DB cũ đã có bảng thì bỏ qua, chỉ ghi nhận revision.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001_baseline"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def create_table(name, *columns, indexes=()):
+    if sa.inspect(op.get_bind()).has_table(name):
+        return
+    op.create_table(name, *columns)
+    for index_name, index_columns, unique in indexes:
+        op.create_index(index_name, name, index_columns, unique=unique)
+
+
+def upgrade():
+    create_table(
+        "cart_items",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer()),
+        sa.Column("food_id", sa.Integer()),
+        sa.Column("quantity", sa.Integer()),
+        sa.Column("branch_id", sa.Integer()),
+        indexes=[("ix_cart_items_id", ["id"], False), ("ix_cart_items_user_id", ["user_id"], False)],
+    )
+
+
+def downgrade():
+    op.drop_table("cart_items")
@@ -0,0 +1,31 @@
+"""Composite index cho các truy vấn nóng: PUT /cart (user_id, food_id).
+
+Revision ID: 0002_hot_path_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002_hot_path_indexes"
+down_revision = "0001_baseline"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    # PUT /cart: WHERE user_id = ? AND food_id = ?
+    ("ix_cart_items_user_food", "cart_items", ["user_id", "food_id"]),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in INDEXES:
+        # Bỏ qua index đã tạo tay trên DB trước đó
+        if name not in {index["name"] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,40 @@
+"""Unique (user_id, food_id) cho cart_items để thêm món bằng 1 câu INSERT ... ON DUPLICATE KEY UPDATE.
+
+Revision ID: 0003_cart_items_unique
+Revises: 0002_hot_path_indexes
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003_cart_items_unique"
+down_revision = "0002_hot_path_indexes"
+branch_labels = None
+depends_on = None
+
+DUPLICATES = """
+SELECT user_id, food_id, MIN(id) AS keep_id, SUM(quantity) AS total
+FROM cart_items GROUP BY user_id, food_id HAVING COUNT(*) > 1
+"""
+
+
+def upgrade():
+    # Gộp các dòng trùng do add_to_cart cũ chạy song song: dồn số lượng vào dòng có id nhỏ nhất
+    op.execute(f"""
+        UPDATE cart_items c JOIN ({DUPLICATES}) d ON c.id = d.keep_id
+        SET c.quantity = d.total
+    """)
+    op.execute(f"""
+        DELETE c FROM cart_items c JOIN ({DUPLICATES}) d
+        ON c.user_id = d.user_id AND c.food_id = d.food_id AND c.id <> d.keep_id
+    """)
+
+    inspector = sa.inspect(op.get_bind())
+    if "ix_cart_items_user_food" in {index["name"] for index in inspector.get_indexes("cart_items")}:
+        op.drop_index("ix_cart_items_user_food", table_name="cart_items")
+    op.create_index("uq_cart_items_user_food", "cart_items", ["user_id", "food_id"], unique=True)
+
+
+def downgrade():
+    op.drop_index("uq_cart_items_user_food", table_name="cart_items")
+    op.create_index("ix_cart_items_user_food", "cart_items", ["user_id", "food_id"])
@@ -1,8 +1,10 @@
-from sqlalchemy import Column, Integer
+from sqlalchemy import Column, Integer, Index
 from database import Base
 
 class CartItem(Base):
     __tablename__ = "cart_items"
+    # Khớp migration 0003_cart_items_unique: mỗi món chỉ 1 dòng trong giỏ
+    __table_args__ = (Index("uq_cart_items_user_food", "user_id", "food_id", unique=True),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, index=True)
@@ -0,0 +1,441 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Set
+
+from sqlalchemy import delete, insert, literal, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.exc import OperationalError
+
+import models
+
+# --- CẤU HÌNH KHO GIỎ HÀNG ---
+# sql (mặc định, MySQL như trước) | memory (RAM của 1 process) | redis (dùng chung giữa các replica)
+CART_STORE = os.getenv("CART_STORE", "sql").lower()
+CART_REDIS_URL = os.getenv("CART_REDIS_URL", "redis://redis:6379/0")
+# Giỏ không được đụng tới quá thời gian này thì tự hết hạn (chỉ áp dụng cho memory/redis)
+CART_TTL_SECONDS = int(os.getenv("CART_TTL_SECONDS", 3 * 24 * 3600))
+# Ghi dồn (write-behind) giỏ từ memory/redis xuống MySQL định kỳ
+CART_WRITE_BEHIND = os.getenv("CART_WRITE_BEHIND", "false").lower() == "true"
+CART_FLUSH_INTERVAL = float(os.getenv("CART_FLUSH_INTERVAL", 2))
+DEADLOCK_RETRIES = 3
+
+
+BRANCH_CONFLICT = "Giỏ hàng đang chứa món của quán khác. Vui lòng xóa giỏ hàng cũ trước!"
+
+
+class CartError(Exception):
+    """Lỗi nghiệp vụ khi áp 1 lô thao tác, main.py đổi thành HTTPException cùng status_code."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def cart_line(user_id: int, food_id: int, quantity: int, branch_id: int) -> dict:
+    return {"user_id": user_id, "food_id": food_id, "quantity": quantity, "branch_id": branch_id}
+
+
+class SqlCartStore:
+    """Giỏ hàng lưu trong bảng cart_items (cách làm cũ)."""
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+
+    @staticmethod
+    def _add_stmt(user_id: int, food_id: int, quantity: int, branch_id: int):
+        # 1 câu lệnh, 1 round trip, không đọc-rồi-ghi nên 2 request song song không mất lượt cộng:
+        #   INSERT INTO cart_items (...) SELECT :u, :f, :q, :b FROM DUAL
+        #   WHERE NOT EXISTS (món của chi nhánh khác trong giỏ)
+        #   ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)
+        # Unique (user_id, food_id) biến INSERT thành cộng dồn; bị chặn vì khác chi nhánh thì 0 dòng.
+        other_branch = (
+            select(models.CartItem.id)
+            .where(models.CartItem.user_id == user_id, models.CartItem.branch_id != branch_id)
+            .exists()
+        )
+        stmt = mysql_insert(models.CartItem).from_select(
+            ["user_id", "food_id", "quantity", "branch_id"],
+            select(literal(user_id), literal(food_id), literal(quantity), literal(branch_id)).where(~other_branch),
+        )
+        return stmt.on_duplicate_key_update(quantity=models.CartItem.quantity + stmt.inserted.quantity)
+
+    @staticmethod
+    def _set_stmt(user_id: int, food_id: int, quantity: int):
+        where = (models.CartItem.user_id == user_id, models.CartItem.food_id == food_id)
+        if quantity <= 0:
+            stmt = delete(models.CartItem).where(*where)
+        else:
+            stmt = update(models.CartItem).where(*where).values(quantity=quantity)
+        # rowcount = số dòng khớp WHERE (driver bật CLIENT_FOUND_ROWS), kể cả khi số lượng không đổi
+        return stmt.execution_options(synchronize_session=False)
+
+    async def _retry_deadlock(self, work):
+        for attempt in range(DEADLOCK_RETRIES):
+            try:
+                async with self.session_factory() as db:
+                    return await work(db)
+            except OperationalError as e:
+                # Nhiều upsert song song trên cùng khóa unique có thể bị InnoDB chọn làm nạn nhân deadlock
+                if e.orig.args[0] not in (1205, 1213) or attempt == DEADLOCK_RETRIES - 1:
+                    raise
+
+    async def add(self, user_id: int, food_id: int, quantity: int, branch_id: int) -> bool:
+        """Cộng dồn số lượng. False nếu giỏ đang chứa món của chi nhánh khác."""
+        async def work(db):
+            result = await db.execute(self._add_stmt(user_id, food_id, quantity, branch_id))
+            await db.commit()
+            return result.rowcount > 0
+        return await self._retry_deadlock(work)
+
+    async def items(self, user_id: int) -> List[dict]:
+        async with self.session_factory() as db:
+            return await self._items(db, user_id)
+
+    async def _items(self, db, user_id: int) -> List[dict]:
+        result = await db.execute(
+            select(models.CartItem).where(models.CartItem.user_id == user_id).order_by(models.CartItem.id)
+        )
+        return [cart_line(i.user_id, i.food_id, i.quantity, i.branch_id) for i in result.scalars()]
+
+    async def set_quantity(self, user_id: int, food_id: int, quantity: int) -> bool:
+        """Đặt số lượng (<= 0 là xóa món). False nếu món không có trong giỏ."""
+        async with self.session_factory() as db:
+            result = await db.execute(self._set_stmt(user_id, food_id, quantity))
+            await db.commit()
+        return result.rowcount > 0
+
+    async def apply(self, user_id: int, operations: List[dict]) -> List[dict]:
+        """Áp cả lô add/set/remove trong 1 transaction (lỗi ở thao tác nào thì rollback hết),
+        trả về giỏ sau khi áp."""
+        async def work(db):
+            for op in operations:
+                if op["op"] == "add":
+                    result = await db.execute(self._add_stmt(user_id, op["food_id"], op["quantity"], op["branch_id"]))
+                    if result.rowcount == 0:
+                        await db.rollback()
+                        raise CartError(409, BRANCH_CONFLICT)
+                elif op["op"] == "set":
+                    result = await db.execute(self._set_stmt(user_id, op["food_id"], op["quantity"]))
+                    if result.rowcount == 0:
+                        await db.rollback()
+                        raise CartError(404, "Item not found")
+                else:
+                    await db.execute(self._set_stmt(user_id, op["food_id"], 0))
+            lines = await self._items(db, user_id)
+            await db.commit()
+            return lines
+        return await self._retry_deadlock(work)
+
+    async def clear(self, user_id: int):
+        async with self.session_factory() as db:
+            await db.execute(delete(models.CartItem).where(models.CartItem.user_id == user_id))
+            await db.commit()
+
+    async def replace(self, user_id: int, lines: List[dict]):
+        """Ghi đè cả giỏ trong 1 transaction (dùng cho write-behind)."""
+        async with self.session_factory() as db:
+            await db.execute(delete(models.CartItem).where(models.CartItem.user_id == user_id))
+            if lines:
+                await db.execute(insert(models.CartItem).values(lines))
+            await db.commit()
+
+    async def all_items(self) -> List[dict]:
+        async with self.session_factory() as db:
+            result = await db.execute(select(models.CartItem).order_by(models.CartItem.id))
+            return [cart_line(i.user_id, i.food_id, i.quantity, i.branch_id) for i in result.scalars()]
+
+
+class InMemoryCartStore:
+    """user_id -> {branch_id, items{food_id: quantity}} trong RAM. Mọi thao tác chạy trọn trong
+    event loop (không await giữa đọc và ghi) nên tự nguyên tử."""
+
+    def __init__(self, ttl: int = CART_TTL_SECONDS):
+        self.ttl = ttl
+        # user_id -> (branch_id, {food_id: quantity}, hết hạn lúc), xếp theo lần đụng gần nhất
+        self.carts: "OrderedDict[int, tuple]" = OrderedDict()
+
+    def _get(self, user_id: int):
+        cart = self.carts.get(user_id)
+        if cart is None:
+            return None
+        if cart[2] <= time.monotonic():
+            del self.carts[user_id]
+            return None
+        return cart
+
+    def _touch(self, user_id: int, branch_id: int, items: Dict[int, int]):
+        if not items:
+            self.carts.pop(user_id, None)
+            return
+        self.carts[user_id] = (branch_id, items, time.monotonic() + self.ttl)
+        self.carts.move_to_end(user_id)
+
+    async def add(self, user_id: int, food_id: int, quantity: int, branch_id: int) -> bool:
+        cart = self._get(user_id)
+        if cart is not None and cart[0] != branch_id:
+            return False
+        items = cart[1] if cart else {}
+        items[food_id] = items.get(food_id, 0) + quantity
+        self._touch(user_id, branch_id, items)
+        return True
+
+    async def items(self, user_id: int) -> List[dict]:
+        cart = self._get(user_id)
+        if cart is None:
+            return []
+        branch_id, items, _ = cart
+        return [cart_line(user_id, food_id, quantity, branch_id) for food_id, quantity in items.items()]
+
+    async def set_quantity(self, user_id: int, food_id: int, quantity: int) -> bool:
+        cart = self._get(user_id)
+        if cart is None or food_id not in cart[1]:
+            return False
+        branch_id, items, _ = cart
+        if quantity <= 0:
+            del items[food_id]
+        else:
+            items[food_id] = quantity
+        self._touch(user_id, branch_id, items)
+        return True
+
+    async def apply(self, user_id: int, operations: List[dict]) -> List[dict]:
+        cart = self._get(user_id)
+        # Áp lên bản sao, chỉ ghi lại khi cả lô hợp lệ
+        branch_id, items = (cart[0], dict(cart[1])) if cart else (None, {})
+        for op in operations:
+            food_id = op["food_id"]
+            if op["op"] == "add":
+                if items and branch_id != op["branch_id"]:
+                    raise CartError(409, BRANCH_CONFLICT)
+                branch_id = op["branch_id"]
+                items[food_id] = items.get(food_id, 0) + op["quantity"]
+            elif op["op"] == "set":
+                if food_id not in items:
+                    raise CartError(404, "Item not found")
+                if op["quantity"] <= 0:
+                    del items[food_id]
+                else:
+                    items[food_id] = op["quantity"]
+            else:
+                items.pop(food_id, None)
+        self._touch(user_id, branch_id, items)
+        return await self.items(user_id)
+
+    async def clear(self, user_id: int):
+        self.carts.pop(user_id, None)
+
+    def sweep(self) -> List[int]:
+        """Xóa các giỏ đã hết hạn, trả về user_id bị xóa."""
+        now, expired = time.monotonic(), []
+        # carts xếp theo lần đụng gần nhất nên hạn tăng dần: gặp giỏ còn hạn là dừng
+        for user_id, (_, _, expires_at) in self.carts.items():
+            if expires_at > now:
+                break
+            expired.append(user_id)
+        for user_id in expired:
+            del self.carts[user_id]
+        return expired
+
+
+class RedisCartStore:
+    """Mỗi giỏ là 1 hash cart:{user_id} gồm field 'branch' và 'f:{food_id}' -> số lượng.
+    Kiểm tra chi nhánh + HINCRBY + gia hạn TTL gói trong Lua script nên nguyên tử giữa các replica."""
+
+    ADD_SCRIPT = """
+local branch = redis.call('HGET', KEYS[1], 'branch')
+if branch and branch ~= ARGV[3] then
+  return 0
+end
+redis.call('HSET', KEYS[1], 'branch', ARGV[3])
+redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+    SET_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+  return 0
+end
+if tonumber(ARGV[2]) <= 0 then
+  redis.call('HDEL', KEYS[1], ARGV[1])
+  if redis.call('HLEN', KEYS[1]) <= 1 then
+    redis.call('DEL', KEYS[1])
+    return 1
+  end
+else
+  redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+    # ARGV = ttl, rồi từng bộ 4 (op, food_id, quantity, branch_id). Áp lên bản sao trong Lua,
+    # gặp lỗi thì trả mã lỗi mà không ghi gì
+    APPLY_SCRIPT = """
+local data = redis.call('HGETALL', KEYS[1])
+local cart, branch = {}, nil
+for i = 1, #data, 2 do
+  if data[i] == 'branch' then branch = data[i + 1] else cart[data[i]] = tonumber(data[i + 1]) end
+end
+for i = 2, #ARGV, 4 do
+  local op, field, qty = ARGV[i], 'f:' .. ARGV[i + 1], tonumber(ARGV[i + 2])
+  if op == 'add' then
+    if next(cart) ~= nil and branch ~= ARGV[i + 3] then
+      return 'conflict'
+    end
+    branch = ARGV[i + 3]
+    cart[field] = (cart[field] or 0) + qty
+  elseif op == 'set' then
+    if cart[field] == nil then
+      return 'not_found'
+    end
+    if qty <= 0 then cart[field] = nil else cart[field] = qty end
+  else
+    cart[field] = nil
+  end
+end
+redis.call('DEL', KEYS[1])
+if next(cart) ~= nil then
+  local args = {'branch', branch}
+  for field, qty in pairs(cart) do
+    args[#args + 1] = field
+    args[#args + 1] = qty
+  end
+  redis.call('HSET', KEYS[1], unpack(args))
+  redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return 'ok'
+"""
+
+    def __init__(self, url: str = CART_REDIS_URL, ttl: int = CART_TTL_SECONDS, client=None):
+        # client truyền vào được (vd fakeredis.aioredis.FakeRedis()) để chạy không cần Redis thật
+        if client is None:
+            # Chỉ cần gói redis khi thật sự bật CART_STORE=redis
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+        self.add_script = client.register_script(self.ADD_SCRIPT)
+        self.set_script = client.register_script(self.SET_SCRIPT)
+        self.apply_script = client.register_script(self.APPLY_SCRIPT)
+
+    async def add(self, user_id: int, food_id: int, quantity: int, branch_id: int) -> bool:
+        added = await self.add_script(keys=[f"cart:{user_id}"], args=[f"f:{food_id}", quantity, branch_id, self.ttl])
+        return bool(int(added))
+
+    async def items(self, user_id: int) -> List[dict]:
+        data = await self.client.hgetall(f"cart:{user_id}")
+        fields = {k.decode() if isinstance(k, bytes) else k: int(v) for k, v in data.items()}
+        branch_id = fields.pop("branch", None)
+        return [cart_line(user_id, int(field[2:]), quantity, branch_id) for field, quantity in fields.items()]
+
+    async def set_quantity(self, user_id: int, food_id: int, quantity: int) -> bool:
+        found = await self.set_script(keys=[f"cart:{user_id}"], args=[f"f:{food_id}", quantity, self.ttl])
+        return bool(int(found))
+
+    async def apply(self, user_id: int, operations: List[dict]) -> List[dict]:
+        args = [self.ttl]
+        for op in operations:
+            args += [op["op"], op["food_id"], op["quantity"], op.get("branch_id") or ""]
+        status = await self.apply_script(keys=[f"cart:{user_id}"], args=args)
+        status = status.decode() if isinstance(status, bytes) else status
+        if status == "conflict":
+            raise CartError(409, BRANCH_CONFLICT)
+        if status == "not_found":
+            raise CartError(404, "Item not found")
+        return await self.items(user_id)
+
+    async def clear(self, user_id: int):
+        await self.client.delete(f"cart:{user_id}")
+
+    async def aclose(self):
+        await self.client.close()
+
+
+class WriteBehindCartStore:
+    """Đọc/ghi vào kho nhanh (memory/redis), đánh dấu giỏ bị đổi rồi định kỳ ghi dồn xuống MySQL.
+    Giỏ đổi nhiều lần giữa 2 lần flush chỉ tốn 1 transaction."""
+
+    def __init__(self, store, sql_store: SqlCartStore):
+        self.store = store
+        self.sql_store = sql_store
+        self.dirty: Set[int] = set()
+        self.flushed = 0
+
+    async def add(self, user_id: int, food_id: int, quantity: int, branch_id: int) -> bool:
+        added = await self.store.add(user_id, food_id, quantity, branch_id)
+        if added:
+            self.dirty.add(user_id)
+        return added
+
+    async def items(self, user_id: int) -> List[dict]:
+        return await self.store.items(user_id)
+
+    async def set_quantity(self, user_id: int, food_id: int, quantity: int) -> bool:
+        found = await self.store.set_quantity(user_id, food_id, quantity)
+        if found:
+            self.dirty.add(user_id)
+        return found
+
+    async def apply(self, user_id: int, operations: List[dict]) -> List[dict]:
+        lines = await self.store.apply(user_id, operations)
+        self.dirty.add(user_id)
+        return lines
+
+    async def clear(self, user_id: int):
+        await self.store.clear(user_id)
+        self.dirty.add(user_id)
+
+    async def load(self):
+        """Kho RAM trống sau khi restart: nạp lại giỏ đã ghi xuống MySQL."""
+        if not isinstance(self.store, InMemoryCartStore):
+            return
+        for line in await self.sql_store.all_items():
+            await self.store.add(line["user_id"], line["food_id"], line["quantity"], line["branch_id"])
+
+    async def flush(self):
+        if isinstance(self.store, InMemoryCartStore):
+            self.dirty.update(self.store.sweep())
+        dirty, self.dirty = self.dirty, set()
+        for user_id in dirty:
+            try:
+                await self.sql_store.replace(user_id, await self.store.items(user_id))
+                self.flushed += 1
+            except Exception as e:
+                # Lỗi thì giữ lại để lần flush sau ghi tiếp
+                self.dirty.add(user_id)
+                print(f"⚠️ Cart write-behind error (user {user_id}): {e}")
+
+    async def aclose(self):
+        await self.flush()
+        if hasattr(self.store, "aclose"):
+            await self.store.aclose()
+
+
+def create_cart_store(session_factory):
+    sql_store = SqlCartStore(session_factory)
+    if CART_STORE == "memory":
+        store = InMemoryCartStore()
+    elif CART_STORE == "redis":
+        store = RedisCartStore()
+    else:
+        return sql_store
+    if CART_WRITE_BEHIND:
+        return WriteBehindCartStore(store, sql_store)
+    return store
+
+
+async def run_maintenance(store, interval: float = CART_FLUSH_INTERVAL):
+    """Vòng nền: flush write-behind, dọn giỏ hết hạn của kho RAM."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if hasattr(store, "flush"):
+                await store.flush()
+            elif hasattr(store, "sweep"):
+                store.sweep()
+        except Exception as e:
+            print(f"⚠️ Cart maintenance error: {e}")
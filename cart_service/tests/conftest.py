@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Các module của dịch vụ import phẳng (vd "import menu") như khi chạy uvicorn main:app
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+# Module dùng chung (common/) nằm ở thư mục gốc repo
+sys.path.insert(1, os.path.dirname(SERVICE_DIR))
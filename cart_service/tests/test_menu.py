@@ -0,0 +1,35 @@
+import asyncio
+
+import httpx
+
+from menu import MenuCache
+
+SNAPSHOT = {"version": "v1", "foods": [{"id": 1, "name": "Phở Bò", "price": 50000, "discount": 0,
+                                        "final_price": 50000, "image_url": None, "branch_id": 1}]}
+
+
+def test_concurrent_refreshes_fetch_once():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        # Giữ request lâu 1 chút để các lần refresh khác phải chờ lock
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json=SNAPSHOT, headers={"etag": '"v1"'})
+
+    async def run():
+        cache = MenuCache("http://restaurant/foods/snapshot")
+        cache.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            await asyncio.gather(*(cache.refresh() for _ in range(10)))
+            # Lần làm mới sau (không chồng lên lần nào) vẫn hỏi lại restaurant_service
+            await cache.refresh()
+        finally:
+            await cache.aclose()
+        return cache
+
+    cache = asyncio.run(run())
+
+    assert len(calls) == 2
+    assert calls[1].headers["if-none-match"] == '"v1"'
+    assert cache.version == "v1" and 1 in cache.foods
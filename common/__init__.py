@@ -0,0 +1,3 @@
+# Module dùng chung cho mọi dịch vụ (metrics, tracing).
+# Docker: build context là thư mục gốc repo, mỗi Dockerfile copy common/ vào /app/common.
+# Chạy ngoài Docker: thêm thư mục gốc repo vào PYTHONPATH (vd PYTHONPATH=.. uvicorn main:app).
@@ -0,0 +1,186 @@
+import hashlib
+import hmac
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from urllib.parse import quote, unquote
+
+from fastapi import HTTPException
+from jose import JWTError, jwt
+
+# --- CẤU HÌNH XÁC THỰC ---
+# Dùng chung SECRET_KEY/ALGORITHM với user_service (create_access_token) để tự giải mã token.
+# Không có SECRET_KEY -> quay về gọi /verify của user_service như trước.
+SECRET_KEY = os.getenv("SECRET_KEY")
+ALGORITHM = os.getenv("ALGORITHM", "HS256")
+USER_SERVICE_VERIFY_URL = os.getenv("USER_SERVICE_VERIFY_URL", "http://user_service:8001/verify")
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+
+# --- HEADER DANH TÍNH ĐÃ KÝ ---
+# Gateway giải mã bearer token 1 lần rồi ký các header này gửi xuống backend (mặc định dùng luôn SECRET_KEY)
+IDENTITY_SIGNING_KEY = os.getenv("IDENTITY_SIGNING_KEY") or SECRET_KEY
+# Thứ tự field là thứ tự trong chữ ký
+IDENTITY_FIELDS = ("x-user-id", "x-user-role", "x-user-branch-id", "x-user-seller-mode", "x-user-exp",
+                   "x-user-name")
+SIGNATURE_HEADER = "x-identity-signature"
+# API nội bộ (vd /coupons/redeem) chỉ nhận request có token này. Mặc định suy ra từ khóa ký
+# nên các dịch vụ dùng chung .env không phải cấu hình thêm
+SERVICE_TOKEN_HEADER = "x-service-token"
+SERVICE_TOKEN = os.getenv("SERVICE_TOKEN") or (
+    hmac.new(IDENTITY_SIGNING_KEY.encode("utf-8"), b"service-token", hashlib.sha256).hexdigest()
+    if IDENTITY_SIGNING_KEY else None
+)
+# Gateway bỏ các header này nếu client tự gửi lên
+IDENTITY_HEADER_NAMES = set(IDENTITY_FIELDS) | {SIGNATURE_HEADER, SERVICE_TOKEN_HEADER}
+
+
+class ClaimsCache:
+    """LRU cache token -> claims, mỗi entry tự hết hạn theo 'exp' của token."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def get(self, token: str) -> Optional[dict]:
+        entry = self.entries.get(token)
+        if entry is None:
+            return None
+        claims, exp = entry
+        if exp <= time.time():
+            del self.entries[token]
+            return None
+        self.entries.move_to_end(token)
+        return claims
+
+    def put(self, token: str, claims: dict):
+        exp = claims.get("exp")
+        # Token không có exp thì không cache (không biết khi nào hết hạn)
+        if not isinstance(exp, (int, float)):
+            return
+        self.entries[token] = (claims, exp)
+        self.entries.move_to_end(token)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+claims_cache = ClaimsCache(AUTH_CACHE_SIZE)
+
+
+def sign(values: List[str]) -> str:
+    message = "\n".join(values).encode("utf-8")
+    return hmac.new(IDENTITY_SIGNING_KEY.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+
+def identity_headers(claims: dict) -> Dict[str, str]:
+    """claims -> header danh tính kèm chữ ký (chỉ gồm ký tự ASCII)."""
+    values = [
+        "" if claims.get(key) is None else str(claims.get(key))
+        for key in ("id", "role", "branch_id", "seller_mode", "exp")
+    ]
+    # Token cũ chưa có claim "name" thì dùng email (sub). Percent-encode vì header chỉ nên chứa ASCII
+    values.append(quote(str(claims.get("name") or claims.get("sub") or ""), safe=""))
+    headers = dict(zip(IDENTITY_FIELDS, values))
+    headers[SIGNATURE_HEADER] = sign(values)
+    return headers
+
+
+def identity_from_headers(headers) -> Optional[dict]:
+    """Đọc danh tính gateway đã xác thực. Thiếu/sai chữ ký hoặc hết hạn -> None."""
+    signature = headers.get(SIGNATURE_HEADER)
+    if not signature or not IDENTITY_SIGNING_KEY:
+        return None
+    values = [headers.get(name, "") for name in IDENTITY_FIELDS]
+    if not hmac.compare_digest(signature, sign(values)):
+        return None
+
+    user_id, role, branch_id, seller_mode, exp, name = values
+    try:
+        if not user_id or float(exp) <= time.time():
+            return None
+        return {
+            "id": int(user_id),
+            "role": role or None,
+            "branch_id": int(branch_id) if branch_id else None,
+            "seller_mode": seller_mode or None,
+            "exp": float(exp),
+            "name": unquote(name) or None,
+        }
+    except ValueError:
+        return None
+
+
+# --- GỌI NỘI BỘ GIỮA CÁC DỊCH VỤ ---
+def service_headers(identity: Optional[dict] = None) -> Dict[str, str]:
+    """Header cho request nội bộ: token dịch vụ, kèm danh tính đã ký của user (nếu gọi thay user)."""
+    headers = identity_headers(identity) if identity else {}
+    if SERVICE_TOKEN:
+        headers[SERVICE_TOKEN_HEADER] = SERVICE_TOKEN
+    return headers
+
+
+def is_service_request(headers) -> bool:
+    token = headers.get(SERVICE_TOKEN_HEADER)
+    return bool(token and SERVICE_TOKEN) and hmac.compare_digest(token, SERVICE_TOKEN)
+
+
+# --- TỰ XÁC THỰC TOKEN (REQUEST KHÔNG ĐI QUA GATEWAY) ---
+_client = None
+
+
+def extract_token(authorization: Optional[str]) -> str:
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Missing Token")
+    return authorization.replace("Bearer ", "")
+
+
+def decode_token(token: str) -> dict:
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid Token")
+
+
+async def verify_remote(authorization: str) -> dict:
+    global _client
+    if _client is None:
+        # Import khi dùng: dịch vụ chỉ đọc header danh tính (user_service) không cần cài httpx
+        import httpx
+
+        from common import tracing
+        _client = httpx.AsyncClient(transport=tracing.httpx_transport())
+    res = await _client.get(USER_SERVICE_VERIFY_URL, headers={"Authorization": authorization})
+    if res.status_code != 200:
+        raise HTTPException(status_code=401, detail="Invalid Token")
+    return res.json()
+
+
+async def verify_token(authorization: Optional[str]) -> dict:
+    """Trả về claims của token. Lỗi mạng khi gọi /verify (httpx.RequestError) được ném lên cho caller."""
+    token = extract_token(authorization)
+    claims = claims_cache.get(token)
+    if claims is not None:
+        return claims
+
+    if SECRET_KEY:
+        claims = decode_token(token)
+    else:
+        claims = await verify_remote(authorization)
+
+    claims_cache.put(token, claims)
+    return claims
+
+
+async def get_identity(request) -> dict:
+    """Ưu tiên header danh tính từ gateway, không có thì tự xác thực token."""
+    claims = identity_from_headers(request.headers)
+    if claims is not None:
+        return claims
+    return await verify_token(request.headers.get("Authorization"))
+
+
+async def aclose():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,322 @@
+import asyncio
+import bisect
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+# --- METRICS (ĐỊNH DẠNG TEXT CỦA PROMETHEUS) ---
+# Cài đặt gọn tại chỗ: mỗi lần ghi chỉ tốn 1 lock + bisect, đủ nhẹ để bật trên production.
+
+# Chu kỳ đo độ trễ event loop (giây)
+LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", 0.05))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: Dict[Tuple, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, value: float = 1.0):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0.0) + value
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in list(self.values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge(Counter):
+    """Gauge ghi trực tiếp (set/inc/dec) hoặc đọc qua callback lúc scrape."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 callback: Optional[Callable[[], Dict[Tuple, float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, *labels, value: float):
+        with self.lock:
+            self.values[labels] = value
+
+    def dec(self, *labels, value: float = 1.0):
+        self.inc(*labels, value=-value)
+
+    def samples(self) -> Iterable[str]:
+        values = self.callback() if self.callback else dict(self.values)
+        for labels, value in values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [đếm theo từng bucket..., tổng, số lần]
+        self.values: Dict[Tuple, list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self) -> Iterable[str]:
+        for labels, series in list(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {series[-1]}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Thời gian xử lý request theo route template và status",
+    ("method", "route", "status"),
+))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "Số request đang xử lý",
+))
+DB_TIME = REGISTRY.register(Histogram(
+    "db_time_per_request_seconds", "Tổng thời gian chạy SQL trong 1 request", ("route",),
+))
+DB_QUERIES = REGISTRY.register(Counter(
+    "db_queries_total", "Số câu SQL đã chạy", ("route",),
+))
+KAFKA_CONSUME_LAG = REGISTRY.register(Histogram(
+    "kafka_consume_lag_seconds", "Độ trễ từ lúc message được ghi vào Kafka tới lúc consumer xử lý", ("topic",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0),
+))
+KAFKA_OFFSET_LAG = REGISTRY.register(Gauge(
+    "kafka_consumer_offset_lag", "Số message còn chờ trong partition (highwater - offset)", ("topic", "partition"),
+))
+DB_POOL_WAIT = REGISTRY.register(Histogram(
+    "db_pool_checkout_wait_seconds", "Thời gian chờ lấy kết nối từ connection pool", ("pool",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+))
+# pool -> engine, đọc trạng thái pool lúc scrape
+_pools: Dict[str, object] = {}
+
+
+def _pool_connections() -> Dict[Tuple, float]:
+    values = {}
+    for name, engine in _pools.items():
+        pool = engine.pool
+        if not hasattr(pool, "checkedout"):
+            continue
+        values[(name, "checked_out")] = pool.checkedout()
+        values[(name, "idle")] = pool.checkedin()
+        values[(name, "capacity")] = pool.size() + max(0, getattr(pool, "_max_overflow", 0))
+    return values
+
+
+def _pool_utilization() -> Dict[Tuple, float]:
+    connections = _pool_connections()
+    return {
+        (name,): connections[(name, "checked_out")] / connections[(name, "capacity")]
+        for name, state in connections if state == "capacity" and connections[(name, state)] > 0
+    }
+
+
+DB_POOL_CONNECTIONS = REGISTRY.register(Gauge(
+    "db_pool_connections", "Số kết nối trong pool theo trạng thái (checked_out/idle/capacity)", ("pool", "state"),
+    callback=_pool_connections,
+))
+DB_POOL_UTILIZATION = REGISTRY.register(Gauge(
+    "db_pool_utilization", "Tỉ lệ kết nối đang dùng trên sức chứa tối đa (pool_size + max_overflow)", ("pool",),
+    callback=_pool_utilization,
+))
+EVENT_LOOP_LAG = REGISTRY.register(Histogram(
+    "event_loop_lag_seconds", "Độ trễ của event loop: 1 lần asyncio.sleep bị chậm hơn hẹn bao lâu",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+))
+
+
+# --- ĐO ĐỘ TRỄ EVENT LOOP ---
+# Code đồng bộ (vd query DB bằng driver sync) chạy trong route async sẽ làm lần sleep này trễ theo
+async def _monitor_loop_lag():
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - started - LOOP_LAG_INTERVAL))
+
+
+# --- ĐO THỜI GIAN DB THEO REQUEST ---
+class _DbTimer:
+    __slots__ = ("seconds", "queries")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.queries = 0
+
+
+# ContextVar được copy sang threadpool của route sync nên cộng dồn vẫn đúng request
+_db_timer: ContextVar[Optional[_DbTimer]] = ContextVar("db_timer", default=None)
+
+
+def instrument_engine(engine):
+    """Gắn event SQLAlchemy để cộng thời gian từng câu SQL vào request hiện tại."""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+    instrument_pool(sync_engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        timer = _db_timer.get()
+        if timer is not None:
+            timer.seconds += time.perf_counter() - started
+            timer.queries += 1
+
+
+def instrument_pool(sync_engine):
+    """Đo thời gian chờ checkout và xuất trạng thái pool, nhãn pool = "<database>:<driver>"."""
+    name = f"{sync_engine.url.database}:{sync_engine.url.get_driver_name()}"
+    _pools[name] = sync_engine
+    pool = sync_engine.pool
+    do_get = pool._do_get
+
+    # _do_get là chỗ pool chờ kết nối rảnh (hoặc mở kết nối mới), bọc lại để bấm giờ
+    def timed_do_get():
+        started = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - started, name)
+
+    pool._do_get = timed_do_get
+
+
+def record_kafka_consume(msg, highwater: Optional[int] = None):
+    KAFKA_CONSUME_LAG.observe(max(0.0, time.time() - msg.timestamp / 1000), msg.topic)
+    if highwater is not None:
+        KAFKA_OFFSET_LAG.set(msg.topic, str(msg.partition), value=max(0, highwater - msg.offset - 1))
+
+
+# --- MIDDLEWARE ĐO LATENCY ---
+def route_template(scope) -> str:
+    # Gateway tự gắn route_template; app FastAPI thường thì tra ngược từ endpoint đã match
+    template = scope.get("route_template")
+    if template:
+        return template
+    endpoint = scope.get("endpoint")
+    app = scope.get("app")
+    if endpoint is None or app is None:
+        return "unmatched"
+    templates = getattr(app.state, "route_templates", None)
+    if templates is None:
+        templates = {}
+        for route in app.routes:
+            target = getattr(route, "endpoint", None) or getattr(route, "app", None)
+            templates.setdefault(target, route.path)
+        app.state.route_templates = templates
+    return templates.get(endpoint, "unmatched")
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.loop_monitor = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.loop_monitor is None:
+            # Khởi động khi có request đầu tiên (lúc này chắc chắn đã có event loop đang chạy)
+            self.loop_monitor = asyncio.ensure_future(_monitor_loop_lag())
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        timer = _DbTimer()
+        token = _db_timer.set(timer)
+        REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUESTS_IN_FLIGHT.dec()
+            _db_timer.reset(token)
+            route = route_template(scope)
+            REQUEST_LATENCY.observe(elapsed, scope["method"], route, str(status["code"]))
+            if timer.queries:
+                DB_TIME.observe(timer.seconds, route)
+                DB_QUERIES.inc(route, value=timer.queries)
+
+
+def instrument(app: FastAPI, engines: Iterable = ()):
+    """Gắn middleware đo latency + endpoint /metrics cho app, và event DB cho các engine."""
+    for engine in engines:
+        instrument_engine(engine)
+    app.add_middleware(MetricsMiddleware)
+
+    def metrics_endpoint():
+        return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
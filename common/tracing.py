@@ -0,0 +1,269 @@
+import importlib
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from common import metrics
+
+# --- CẤU HÌNH TRACING ---
+# TRACING_EXPORTER: none (mặc định) | console | file | "module:ham" (ham() trả về exporter tự viết)
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+# Tỉ lệ lấy mẫu cho trace mới; trace đến từ dịch vụ khác thì theo cờ sampled của traceparent
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", 1.0))
+
+TRACEPARENT_HEADER = "traceparent"
+SERVICE_NAME = os.getenv("SERVICE_NAME", "unknown")
+
+
+# --- SPAN & W3C TRACE CONTEXT ---
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "sampled",
+                 "start", "end", "attributes", "status")
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: Optional[str], sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.sampled = sampled
+        self.start = time.time()
+        self.end = None
+        self.attributes: Dict[str, object] = {}
+        self.status = "ok"
+
+    def set(self, key: str, value):
+        if self.sampled:
+            self.attributes[key] = value
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.end = time.time()
+        if error is not None:
+            self.status = "error"
+            self.set("error", repr(error))
+        if self.sampled:
+            exporter.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "service": SERVICE_NAME,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "duration_ms": round(((self.end or time.time()) - self.start) * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+# (trace_id, parent span_id, sampled)
+SpanContext = Tuple[str, str, bool]
+
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """'00-<trace_id 32 hex>-<span_id 16 hex>-<flags>' -> SpanContext, sai định dạng thì None."""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or parts[0] == "ff":
+        return None
+    try:
+        flags = int(parts[3][:2], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def new_span(name: str, kind: str = "internal", parent: Optional[SpanContext] = None) -> Span:
+    """Tạo span con của parent (từ header) hoặc của span hiện tại; không có thì mở trace mới."""
+    if parent is None:
+        active = _current.get()
+        if active is not None:
+            parent = (active.trace_id, active.span_id, active.sampled)
+    if parent is None:
+        return Span(name, kind, "%032x" % random.getrandbits(128), None, random.random() < TRACING_SAMPLE_RATE)
+    return Span(name, kind, parent[0], parent[1], parent[2])
+
+
+@contextmanager
+def start_span(name: str, kind: str = "internal", parent: Optional[SpanContext] = None, **attributes):
+    span = new_span(name, kind, parent)
+    for key, value in attributes.items():
+        span.set(key, value)
+    token = _current.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.finish(e)
+        raise
+    else:
+        span.finish()
+    finally:
+        _current.reset(token)
+
+
+# --- LAN TRUYỀN QUA HTTP (httpx) VÀ KAFKA ---
+def inject(headers: dict) -> dict:
+    span = _current.get()
+    if span is not None:
+        headers[TRACEPARENT_HEADER] = span.traceparent()
+    return headers
+
+
+def kafka_headers() -> List[Tuple[str, bytes]]:
+    span = _current.get()
+    return [(TRACEPARENT_HEADER, span.traceparent().encode("ascii"))] if span is not None else []
+
+
+def extract_kafka(headers) -> Optional[SpanContext]:
+    for key, value in headers or ():
+        if key == TRACEPARENT_HEADER:
+            return parse_traceparent(value.decode("ascii", "replace"))
+    return None
+
+
+class TracingTransport:
+    """Bọc transport của httpx: mỗi lần gửi (kể cả retry) là 1 client span, con của span đang chạy.
+    Span luôn kết thúc, kể cả khi lỗi kết nối/timeout (lúc đó status = error).
+    Với response stream, span kết thúc khi nhận xong header."""
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        if _current.get() is None:
+            return await self.transport.handle_async_request(request)
+        with start_span(f"{request.method} {request.url.host}", "client") as span:
+            span.set("http.url", str(request.url))
+            request.headers[TRACEPARENT_HEADER] = span.traceparent()
+            response = await self.transport.handle_async_request(request)
+            span.set("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                span.status = "error"
+            return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+    async def __aenter__(self):
+        await self.transport.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.transport.__aexit__(*exc_info)
+
+
+def httpx_transport(**kwargs) -> TracingTransport:
+    """Truyền vào httpx.AsyncClient(transport=...) để gắn traceparent cho request đi ra.
+    kwargs (limits, http2, retries...) đi thẳng vào httpx.AsyncHTTPTransport."""
+    # Import khi dùng: dịch vụ không gọi HTTP ra ngoài (user_service) không cần cài httpx
+    import httpx
+    return TracingTransport(httpx.AsyncHTTPTransport(**kwargs))
+
+
+# --- EXPORTER ---
+class NoopExporter:
+    def export(self, span: Span):
+        pass
+
+
+class ConsoleExporter:
+    def export(self, span: Span):
+        print(f"🔎 {json.dumps(span.to_dict(), ensure_ascii=False)}")
+
+
+class FileExporter:
+    """Ghi mỗi span 1 dòng JSON, dùng khi chạy thử để ghép trace giữa các dịch vụ."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False) + "\n"
+        with self.lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def create_exporter(name: str = TRACING_EXPORTER):
+    if name == "console":
+        return ConsoleExporter()
+    if name == "file":
+        return FileExporter(TRACING_FILE)
+    if ":" in name:
+        module, attr = name.split(":", 1)
+        return getattr(importlib.import_module(module), attr)()
+    return NoopExporter()
+
+
+exporter = create_exporter()
+
+
+def set_exporter(new_exporter):
+    global exporter
+    exporter = new_exporter
+
+
+# --- MIDDLEWARE (SPAN CHO REQUEST ĐI VÀO) ---
+class TracingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        parent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                parent = parse_traceparent(value.decode("latin-1"))
+                break
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                # Trả traceparent cho client để tra cứu trace của request này
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"traceparent", span.traceparent().encode("ascii"))]
+            await send(message)
+
+        with start_span(scope["method"], "server", parent) as span:
+            span.set("http.target", scope["path"])
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # Tên span theo route template (biết sau khi router/dispatcher đã match)
+                span.name = f"{scope['method']} {metrics.route_template(scope)}"
+                span.set("http.status_code", status["code"])
+                if status["code"] >= 500:
+                    span.status = "error"
+
+
+def instrument(app, service_name: str):
+    global SERVICE_NAME
+    SERVICE_NAME = os.getenv("SERVICE_NAME", service_name)
+    app.add_middleware(TracingMiddleware)
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { toast } from 'react-toastify';
 import { FaTrash, FaMinus, FaPlus, FaArrowLeft, FaShoppingBag } from "react-icons/fa"; 
@@ -13,8 +13,12 @@ function Cart() {
     const [couponCode, setCouponCode] = useState('');
     const [appliedCoupon, setAppliedCoupon] = useState(null);
     const navigate = useNavigate();
+    // Gom các lần bấm +/- / xóa món thành 1 lần PATCH /cart/batch
+    const pendingOps = useRef({});
+    const flushTimer = useRef(null);
 
     useEffect(() => { fetchCart(); }, []);
+    useEffect(() => () => { clearTimeout(flushTimer.current); flushPending(); }, []);
 
     useEffect(() => {
         if (appliedCoupon) {
@@ -25,24 +29,10 @@ function Cart() {
 
     const fetchCart = async () => {
         try {
+            // cart_service trả sẵn tên/giá/ảnh từng dòng + tạm tính, không cần gọi /foods/{id} cho từng món
             const cartRes = await api.get('/cart');
-            const items = cartRes.data;
-            if (items.length === 0) { setCartItems([]); return; }
-
-            const enrichedItems = await Promise.all(items.map(async (item) => {
-                try {
-                    const foodDetail = await api.get(`/foods/${item.food_id}`);
-                    return {
-                        ...item,
-                        name: foodDetail.data.name,
-                        price: foodDetail.data.price,
-                        image_url: foodDetail.data.image_url
-                    };
-                } catch (e) { return { ...item, name: "Món đã xóa", price: 0 }; }
-            }));
-
-            setCartItems(enrichedItems);
-            calculateSubTotal(enrichedItems);
+            setCartItems(cartRes.data.items);
+            setSubTotal(cartRes.data.subtotal);
         } catch (err) { console.error(err); }
     };
 
@@ -51,32 +41,42 @@ function Cart() {
         setSubTotal(total);
     };
 
-    const updateQuantity = async (foodId, newQty) => {
-        if (newQty < 1) return;
+    const flushPending = async () => {
+        const operations = Object.values(pendingOps.current);
+        pendingOps.current = {};
+        if (operations.length === 0) return;
         try {
-            await api.put('/cart', { food_id: foodId, quantity: newQty });
-            const updatedItems = cartItems.map(item => item.food_id === foodId ? { ...item, quantity: newQty } : item);
-            setCartItems(updatedItems);
-            calculateSubTotal(updatedItems);
-        } catch (err) { toast.error("Lỗi cập nhật"); }
+            await api.patch('/cart/batch', { operations });
+        } catch (err) { toast.error("Lỗi cập nhật"); fetchCart(); }
+    };
+
+    // Mỗi món chỉ giữ thao tác cuối cùng, gửi sau 400ms không bấm thêm
+    const queueOperation = (operation) => {
+        pendingOps.current[operation.food_id] = operation;
+        clearTimeout(flushTimer.current);
+        flushTimer.current = setTimeout(flushPending, 400);
     };
 
-    const removeItem = async (foodId) => {
+    const updateQuantity = (foodId, newQty) => {
+        if (newQty < 1) return;
+        queueOperation({ op: 'set', food_id: foodId, quantity: newQty });
+        const updatedItems = cartItems.map(item => item.food_id === foodId ? { ...item, quantity: newQty } : item);
+        setCartItems(updatedItems);
+        calculateSubTotal(updatedItems);
+    };
+
+    const removeItem = (foodId) => {
         if(!window.confirm("Xóa món này khỏi giỏ?")) return;
-        try {
-            // Lưu ý: API hiện tại của bạn là xóa hết. Nếu backend hỗ trợ xóa 1 món thì gọi API đó.
-            // Ở đây mình giả lập xóa trên giao diện trước
-            const updatedItems = cartItems.filter(item => item.food_id !== foodId);
-            setCartItems(updatedItems);
-            calculateSubTotal(updatedItems);
-            // Gọi API thực tế (nếu có): await api.delete(`/cart/${foodId}`); 
-            // Hiện tại dùng tạm xóa all nếu backend chưa update:
-            if(updatedItems.length === 0) await api.delete('/cart');
-        } catch(err) { toast.error("Lỗi xóa món"); }
+        queueOperation({ op: 'remove', food_id: foodId });
+        const updatedItems = cartItems.filter(item => item.food_id !== foodId);
+        setCartItems(updatedItems);
+        calculateSubTotal(updatedItems);
     };
 
     const clearCart = async () => {
         if (!window.confirm("Bạn chắc chắn muốn xóa hết giỏ hàng?")) return;
+        clearTimeout(flushTimer.current);
+        pendingOps.current = {};
         try {
             await api.delete('/cart');
             setCartItems([]); setSubTotal(0); setAppliedCoupon(null);
@@ -95,8 +95,10 @@ function Cart() {
         } catch (err) { setAppliedCoupon(null); toast.error("Mã không hợp lệ hoặc hết hạn"); }
     };
 
-    const handleCheckout = () => {
+    const handleCheckout = async () => {
         if (cartItems.length === 0) return toast.warning("Giỏ trống!");
+        clearTimeout(flushTimer.current);
+        await flushPending();
         navigate('/checkout', {
             state: { items: cartItems, coupon: appliedCoupon, final_price: totalPrice, branch_id: cartItems[0].branch_id }
         });
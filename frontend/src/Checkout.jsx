@@ -85,15 +85,15 @@ function Checkout() {
             
             // Gọi API tạo đơn
             const orderRes = await api.post('/checkout', orderPayload);
-            const { order_id } = orderRes.data; // Chỉ cần lấy ID đơn hàng mới
+            // Server tự tính giá từ bảng giá + mã giảm giá, dùng tổng tiền server trả về
+            const { order_id, total_price } = orderRes.data;
 
             toast.info("Đang chuyển sang thanh toán...");
             
-            // --- SỬA CHỖ NÀY: TRUYỀN THẲNG GIÁ TIỀN CŨ SANG ---
             navigate('/payment', { 
                 state: { 
                     order_id: order_id, 
-                    total_price: final_price // <--- Lấy biến final_price có sẵn (70000), không chờ backend
+                    total_price: total_price
                 } 
             });
 
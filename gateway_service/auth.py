@@ -0,0 +1,31 @@
+from typing import List, Optional, Tuple
+
+from jose import JWTError, jwt
+
+from common.auth import (ALGORITHM, IDENTITY_HEADER_NAMES, IDENTITY_SIGNING_KEY, SECRET_KEY, claims_cache,
+                         identity_headers as signed_identity_headers)
+
+# --- XÁC THỰC TẠI GATEWAY ---
+# Cùng SECRET_KEY/ALGORITHM với user_service. Không có key -> gateway không gắn danh tính,
+# backend tự xác thực token như cũ. Cách ký header danh tính nằm ở common/auth.py.
+
+
+def verify_bearer(authorization: str) -> Optional[dict]:
+    """Giải mã bearer token. Token sai/hết hạn -> None (để backend tự trả 401 nếu route cần auth)."""
+    if not SECRET_KEY or not IDENTITY_SIGNING_KEY:
+        return None
+    token = authorization.replace("Bearer ", "")
+    claims = claims_cache.get(token)
+    if claims is not None:
+        return claims
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    claims_cache.put(token, claims)
+    return claims
+
+
+def identity_headers(claims: dict) -> List[Tuple[bytes, bytes]]:
+    # Dạng header thô của ASGI scope
+    return [(name.encode("latin-1"), value.encode("latin-1")) for name, value in signed_identity_headers(claims).items()]
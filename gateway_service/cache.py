@@ -0,0 +1,157 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from singleflight import SingleFlight
+
+# --- CẤU HÌNH CACHE RESPONSE ---
+CACHE_ENABLED = os.getenv("GATEWAY_CACHE_ENABLED", "true").lower() == "true"
+CACHE_MAX_ENTRIES = int(os.getenv("GATEWAY_CACHE_MAX_ENTRIES", 1000))
+CACHE_MAX_BYTES = int(os.getenv("GATEWAY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_DEFAULT_TTL = float(os.getenv("GATEWAY_CACHE_DEFAULT_TTL", 30))
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    directives = {}
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition("=")
+        directives[name.strip().lower()] = arg.strip().strip('"') or None
+    return directives
+
+
+def cacheable_ttl(status_code: int, headers: dict, default_ttl: float) -> Optional[float]:
+    """TTL được phép lưu theo Cache-Control của upstream, None nếu không được cache."""
+    cache_control = parse_cache_control(headers.get("cache-control"))
+    if status_code != 200 or "no-store" in cache_control or "private" in cache_control:
+        return None
+    if "set-cookie" in headers:
+        return None
+    ttl = default_ttl
+    max_age = cache_control.get("s-maxage") or cache_control.get("max-age")
+    if max_age is not None and max_age.isdigit():
+        ttl = min(ttl, float(max_age))
+    if "no-cache" in cache_control:
+        # Được lưu nhưng lần nào cũng phải hỏi lại upstream, nên bắt buộc có ETag
+        if "etag" not in headers:
+            return None
+        ttl = 0
+    return ttl
+
+
+def resource_prefix(path: str) -> str:
+    """'/foods/search' -> '/foods'. Cache được nhóm theo segment đầu để invalidate."""
+    first = next((s for s in path.split("/") if s), "")
+    return f"/{first}"
+
+
+class CachedResponse:
+    __slots__ = ("status_code", "headers", "body", "etag", "upstream_etag", "expires_at", "prefix")
+
+    def __init__(self, status_code: int, headers: dict, body: bytes, ttl: float, prefix: str):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.upstream_etag = headers.get("etag")
+        # Upstream không gửi ETag thì gateway tự sinh (weak) để client vẫn dùng được If-None-Match
+        self.etag = self.upstream_etag or 'W/"%s"' % hashlib.sha1(body).hexdigest()[:20]
+        self.expires_at = time.monotonic() + ttl
+        self.prefix = prefix
+
+    @property
+    def fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+
+class ResponseCache:
+    """LRU cache (giới hạn số entry + tổng byte) cho các GET public, có TTL và gộp các miss đồng thời."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self.size_bytes = 0
+        self.flight = SingleFlight()
+        # Tăng mỗi lần invalidate 1 prefix: response đang tải dở từ trước đó sẽ không được lưu
+        self.generations: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(method: str, path: str, query: str) -> str:
+        # Chuẩn hóa query: sắp xếp tham số để ?a=1&b=2 và ?b=2&a=1 dùng chung entry
+        normalized = urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+        return f"{method} {path}?{normalized}"
+
+    def lookup(self, key: str) -> Tuple[Optional[CachedResponse], bool]:
+        """Trả về (entry, còn_hạn). Entry hết hạn vẫn trả về để revalidate bằng ETag."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None, False
+        self.entries.move_to_end(key)
+        return entry, entry.fresh
+
+    def store(self, key: str, entry: CachedResponse, generation: int) -> bool:
+        # Có invalidate xảy ra trong lúc đang tải -> bỏ, tránh lưu lại dữ liệu cũ
+        if generation != self.generations.get(entry.prefix, 0):
+            return False
+        if len(entry.body) > self.max_bytes:
+            return False
+        self._remove(key)
+        self.entries[key] = entry
+        self.size_bytes += len(entry.body)
+        while len(self.entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.evictions += 1
+        return True
+
+    def refresh(self, entry: CachedResponse, ttl: float):
+        entry.expires_at = time.monotonic() + ttl
+        self.revalidated += 1
+
+    def discard(self, key: str, entry: CachedResponse):
+        """Bỏ entry (vd upstream đổi sang no-store khi revalidate). Key đã được lưu entry mới thì giữ nguyên."""
+        if self.entries.get(key) is entry:
+            self._remove(key)
+
+    def _remove(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= len(entry.body)
+
+    def invalidate_prefix(self, prefix: str):
+        self.generations[prefix] = self.generations.get(prefix, 0) + 1
+        for key in [k for k, e in self.entries.items() if e.prefix == prefix]:
+            self._remove(key)
+        self.invalidations += 1
+
+    def generation(self, path: str) -> int:
+        return self.generations.get(resource_prefix(path), 0)
+
+    async def fetch(self, key: str, loader: Callable[[], Awaitable[CachedResponse]]) -> CachedResponse:
+        """Chỉ request đầu tiên gọi upstream, các request trùng key chờ kết quả của nó."""
+        return await self.flight.do(key, loader)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": CACHE_ENABLED,
+            "entries": len(self.entries),
+            "size_bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "coalesced": self.flight.shared,
+            "revalidated": self.revalidated,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -1,9 +1,164 @@
 import httpx
+import math
 import os
+from typing import Optional
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from upstream import UpstreamRegistry
+from resilience import CircuitOpenError, UpstreamPolicy
+from routing import Route, RouteConfig
+from cache import CACHE_DEFAULT_TTL, CACHE_ENABLED, CachedResponse, ResponseCache, cacheable_ttl, resource_prefix
+from singleflight import SingleFlight
+from ratelimit import LoadShedder, RateLimiter, create_bucket_store
+import auth
+from common import metrics
+from common import tracing
 
-app = FastAPI()
+# --- CẤU HÌNH URL DỊCH VỤ ---
+USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://user_service:8001")
+RESTAURANT_SERVICE_URL = os.getenv("RESTAURANT_SERVICE_URL", "http://restaurant_service:8002")
+ORDER_SERVICE_URL = os.getenv("ORDER_SERVICE_URL", "http://order_service:8003")
+PAYMENT_SERVICE_URL = os.getenv("PAYMENT_SERVICE_URL", "http://payment_service:8004")
+CART_SERVICE_URL = os.getenv("CART_SERVICE_URL", "http://cart_service:8005")
+NOTIFICATION_SERVICE_URL = os.getenv("NOTIFICATION_SERVICE_URL", "http://notification_service:8006")
+
+# --- TIMEOUT / RETRY / CIRCUIT BREAKER THEO TỪNG DỊCH VỤ ---
+# Ghi đè qua env theo tên dịch vụ, vd ORDER_SERVICE_READ_TIMEOUT=3, PAYMENT_SERVICE_MAX_RETRIES=0
+UPSTREAM_POLICIES = {
+    USER_SERVICE_URL: UpstreamPolicy.from_env("USER_SERVICE", read_timeout=10.0),  # /login băm bcrypt khá chậm
+    RESTAURANT_SERVICE_URL: UpstreamPolicy.from_env("RESTAURANT_SERVICE", read_timeout=30.0, write_timeout=30.0),  # upload ảnh
+    ORDER_SERVICE_URL: UpstreamPolicy.from_env("ORDER_SERVICE", read_timeout=5.0),
+    PAYMENT_SERVICE_URL: UpstreamPolicy.from_env("PAYMENT_SERVICE", read_timeout=10.0),
+    CART_SERVICE_URL: UpstreamPolicy.from_env("CART_SERVICE", read_timeout=5.0),
+    NOTIFICATION_SERVICE_URL: UpstreamPolicy.from_env("NOTIFICATION_SERVICE", read_timeout=5.0),
+}
+
+# Tên upstream dùng trong routes.json (file config có thể khai báo thêm/ghi đè)
+UPSTREAMS = {
+    "user_service": USER_SERVICE_URL,
+    "restaurant_service": RESTAURANT_SERVICE_URL,
+    "order_service": ORDER_SERVICE_URL,
+    "payment_service": PAYMENT_SERVICE_URL,
+    "cart_service": CART_SERVICE_URL,
+    "notification_service": NOTIFICATION_SERVICE_URL,
+}
+
+# --- BẢNG ĐỊNH TUYẾN (NẠP TỪ FILE CONFIG) ---
+ROUTES_FILE = os.getenv("GATEWAY_ROUTES_FILE", os.path.join(os.path.dirname(__file__), "routes.json"))
+ROUTES_RELOAD_INTERVAL = float(os.getenv("GATEWAY_ROUTES_RELOAD_INTERVAL", 5))
+route_config = RouteConfig(ROUTES_FILE, UPSTREAMS, ROUTES_RELOAD_INTERVAL)
+
+# --- CONNECTION POOL DÙNG CHUNG CHO TỪNG DỊCH VỤ ---
+upstreams = UpstreamRegistry()
+
+# --- GIỚI HẠN TẦN SUẤT (TOKEN BUCKET) & GIẢM TẢI ---
+rate_limiter = RateLimiter(create_bucket_store())
+load_shedder = LoadShedder()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for url in route_config.upstreams.values():
+        upstreams.register(url, policy=UPSTREAM_POLICIES.get(url))
+    yield
+    await upstreams.aclose()
+    await rate_limiter.aclose()
+
+app = FastAPI(lifespan=lifespan)
+
+# --- XÁC THỰC TẬP TRUNG TẠI GATEWAY ---
+class IdentityMiddleware:
+    """Giải mã bearer token đúng 1 lần mỗi request, gắn header danh tính đã ký
+    (x-user-id, x-user-role, x-user-branch-id, x-user-seller-mode, x-user-name) để backend dùng lại."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            # Bỏ mọi header danh tính do client tự gửi lên (chống giả mạo)
+            headers = [
+                (k, v) for k, v in scope["headers"]
+                if k.decode("latin-1") not in auth.IDENTITY_HEADER_NAMES
+            ]
+            authorization = next((v for k, v in headers if k == b"authorization"), None)
+            if authorization:
+                claims = auth.verify_bearer(authorization.decode("latin-1"))
+                if claims is not None:
+                    headers.extend(auth.identity_headers(claims))
+            # Sửa trực tiếp trên scope để các lớp ngoài (metrics) vẫn thấy route_template do dispatcher gắn
+            scope["headers"] = headers
+        await self.app(scope, receive, send)
+
+# --- BỘ ĐIỀU PHỐI PROXY (TẦNG ASGI) ---
+MUTATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+class ProxyDispatcher:
+    """Tra bảng route (trie) và proxy thẳng ở tầng ASGI, không qua router/dependency của FastAPI.
+    Path không có trong bảng route (vd /gateway/...) mới rơi xuống app FastAPI."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route, allowed = route_config.current().resolve(scope["method"], scope["path"])
+        if route is None and not allowed:
+            await self.app(scope, receive, send)
+            return
+
+        if route is None:
+            response = JSONResponse(
+                {"detail": "Method Not Allowed"}, status_code=405, headers={"Allow": ", ".join(allowed)}
+            )
+            await response(scope, receive, send)
+            return
+
+        # Chặn sớm trước khi tốn kết nối tới upstream
+        retry_after = await rate_limiter.check(route, scope)
+        if retry_after is not None:
+            response = JSONResponse(
+                {"detail": "Too Many Requests"}, status_code=429,
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+            await response(scope, receive, send)
+            return
+        if load_shedder.should_shed(upstreams.get(route.upstream)):
+            response = JSONResponse(
+                {"detail": "Service Overloaded"}, status_code=503, headers={"Retry-After": "1"}
+            )
+            await response(scope, receive, send)
+            return
+
+        scope["route_template"] = route.pattern
+        request = Request(scope, receive)
+        path = scope["path"].lstrip("/")
+        load_shedder.inflight += 1
+        try:
+            try:
+                if CACHE_ENABLED and "cache" in route.options and request.method == "GET":
+                    response = await cached_forward(route, path, request)
+                elif SINGLEFLIGHT_ENABLED and route.options.get("singleflight") and request.method in IDEMPOTENT_METHODS:
+                    response = await coalesced_forward(route, path, request)
+                else:
+                    response = await forward_request(route.upstream, path, request)
+                    # Route "read_only": POST chỉ để gửi body (vd kiểm tra lô coupon), không làm cache cũ đi
+                    read_only = route.options.get("read_only", False)
+                    if CACHE_ENABLED and request.method in MUTATING_METHODS and not read_only and response.status_code < 500:
+                        invalidate_cache(route, scope["path"])
+            except HTTPException as e:
+                response = JSONResponse({"detail": e.detail}, status_code=e.status_code)
+            await response(scope, receive, send)
+        finally:
+            load_shedder.inflight -= 1
+
+# Thứ tự thêm: middleware thêm sau nằm ngoài -> CORS -> Identity -> ProxyDispatcher -> FastAPI
+app.add_middleware(ProxyDispatcher)
+app.add_middleware(IdentityMiddleware)
 
 # --- CẤU HÌNH CORS ---
 app.add_middleware(
@@ -12,117 +167,212 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cho frontend đọc được cursor phân trang của GET /orders
+    expose_headers=["X-Next-Cursor"],
 )
 
-# --- CẤU HÌNH URL DỊCH VỤ ---
-USER_SERVICE_URL = "http://user_service:8001"
-RESTAURANT_SERVICE_URL = "http://restaurant_service:8002"
-ORDER_SERVICE_URL = "http://order_service:8003"
-PAYMENT_SERVICE_URL = "http://payment_service:8004"
-CART_SERVICE_URL = "http://cart_service:8005"
-NOTIFICATION_SERVICE_URL = "http://notification_service:8006"
+# --- METRICS (/metrics) ---
+metrics.instrument(app)
+
+# --- TRACING (traceparent W3C) ---
+tracing.instrument(app, "gateway_service")
 
 # --- HÀM PROXY ---
-async def forward_request(service_url: str, path: str, request: Request):
-    client = httpx.AsyncClient()
-    headers = dict(request.headers)
-    headers.pop("host", None)
-    headers.pop("content-length", None)
-    params = dict(request.query_params)
-    
+# Stream body 2 chiều (mặc định). Tắt bằng GATEWAY_STREAMING=false để quay về kiểu đọc hết body.
+STREAMING_ENABLED = os.getenv("GATEWAY_STREAMING", "true").lower() == "true"
+
+# Header chỉ có nghĩa trên từng chặng kết nối, không được chuyển tiếp
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "trailers", "transfer-encoding", "upgrade", "host",
+}
+
+def filter_headers(headers) -> dict:
+    return {k: v for k, v in headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+
+def has_body(request: Request) -> bool:
+    if "transfer-encoding" in request.headers:
+        return True
+    return request.headers.get("content-length", "0") != "0"
+
+async def stream_upstream(response: httpx.Response):
+    # aiter_raw: trả nguyên byte (kể cả nén) đúng với content-encoding/content-length của upstream.
+    # Chỉ đọc chunk tiếp theo khi client đã nhận xong chunk trước -> có backpressure.
     try:
-        body = await request.body()
-        url = f"{service_url}/{path}"
-        
-        response = await client.request(
+        async for chunk in response.aiter_raw():
+            yield chunk
+    finally:
+        await response.aclose()
+
+RETRYABLE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+async def open_upstream(service_url: str, path: str, request: Request, stream: bool, headers: Optional[dict] = None) -> httpx.Response:
+    """Gửi request sang upstream, trả về response ở chế độ stream (body chưa đọc)."""
+    pool = upstreams.get(service_url)
+    if headers is None:
+        headers = filter_headers(request.headers)
+
+    try:
+        if not has_body(request):
+            content = None
+        elif stream:
+            # Đẩy body của client sang upstream theo từng chunk (upload ảnh không bị giữ trong RAM)
+            content = request.stream()
+        else:
+            content = await request.body()
+
+        upstream_request = pool.client.build_request(
             method=request.method,
-            url=url,
+            url=f"/{path}",
             headers=headers,
-            params=params,
-            content=body
-        )
-        
-        return Response(
-            content=response.content,
-            status_code=response.status_code,
-            headers=dict(response.headers)
+            params=request.query_params.multi_items(),
+            content=content
         )
+        # Chỉ retry method idempotent không có body (body stream không gửi lại được)
+        retryable = request.method in RETRYABLE_METHODS and content is None
+        return await pool.send(upstream_request, stream=True, retryable=retryable)
+    except CircuitOpenError:
+        raise HTTPException(status_code=503, detail=f"Service Unavailable: {service_url} (circuit open)")
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail=f"Gateway Timeout: {service_url}")
     except httpx.ConnectError:
         raise HTTPException(status_code=503, detail=f"Service Unavailable: {service_url}")
     except Exception as e:
         print(f"Gateway Error: {e}")
         raise HTTPException(status_code=500, detail="Internal Gateway Error")
 
-# ==========================================
-# CÁC ROUTES ĐỊNH TUYẾN
-# ==========================================
-
-# 1. AUTHENTICATION (USER SERVICE) - [ĐÃ BỔ SUNG PHẦN NÀY]
-@app.api_route("/login", methods=["POST"])
-async def login(req: Request):
-    return await forward_request(USER_SERVICE_URL, "login", req)
-
-@app.api_route("/register", methods=["POST"])
-async def register(req: Request):
-    return await forward_request(USER_SERVICE_URL, "register", req)
-
-@app.api_route("/verify", methods=["GET"])
-async def verify(req: Request):
-    return await forward_request(USER_SERVICE_URL, "verify", req)
-
-@app.api_route("/users/{path:path}", methods=["GET", "POST", "PUT"])
-async def users_path(path: str, req: Request):
-    return await forward_request(USER_SERVICE_URL, f"users/{path}", req)
-
-# 2. PAYMENT SERVICE
-@app.api_route("/pay", methods=["POST"])
-async def pay(req: Request):
-    return await forward_request(PAYMENT_SERVICE_URL, "pay", req)
-
-@app.api_route("/payment-methods", methods=["GET", "POST"])
-async def payment_methods_root(req: Request):
-    return await forward_request(PAYMENT_SERVICE_URL, "payment-methods", req)
-
-# 3. ORDER SERVICE
-@app.api_route("/checkout", methods=["POST"])
-async def checkout(req: Request):
-    return await forward_request(ORDER_SERVICE_URL, "checkout", req)
-
-@app.api_route("/orders", methods=["GET"])
-async def orders_root(req: Request):
-    return await forward_request(ORDER_SERVICE_URL, "orders", req)
-
-@app.api_route("/orders/{path:path}", methods=["GET", "PUT", "DELETE"])
-async def orders_path(path: str, req: Request):
-    return await forward_request(ORDER_SERVICE_URL, f"orders/{path}", req)
-
-# 4. RESTAURANT SERVICE
-@app.api_route("/foods", methods=["GET", "POST"])
-async def foods_root(req: Request):
-    return await forward_request(RESTAURANT_SERVICE_URL, "foods", req)
-
-@app.api_route("/foods/{path:path}", methods=["GET", "PUT", "DELETE"])
-async def foods_path(path: str, req: Request):
-    return await forward_request(RESTAURANT_SERVICE_URL, f"foods/{path}", req)
-
-@app.api_route("/branches", methods=["GET", "POST"])
-async def branches_root(req: Request):
-    return await forward_request(RESTAURANT_SERVICE_URL, "branches", req)
-
-@app.api_route("/branches/{path:path}", methods=["GET"])
-async def branches_path(path: str, req: Request):
-    return await forward_request(RESTAURANT_SERVICE_URL, f"branches/{path}", req)
-
-@app.api_route("/coupons", methods=["GET", "POST"])
-async def coupons_root(req: Request):
-    return await forward_request(RESTAURANT_SERVICE_URL, "coupons", req)
-
-# 5. CART SERVICE
-@app.api_route("/cart", methods=["GET", "POST", "PUT", "DELETE"])
-async def cart_root(req: Request):
-    return await forward_request(CART_SERVICE_URL, "cart", req)
-
-# 6. NOTIFICATION
-@app.api_route("/notify", methods=["POST"])
-async def notify(req: Request):
-    return await forward_request(NOTIFICATION_SERVICE_URL, "notify", req)
\ No newline at end of file
+async def read_upstream(response: httpx.Response) -> bytes:
+    # Gom byte thô để header (content-encoding, content-length) vẫn khớp
+    try:
+        return b"".join([chunk async for chunk in stream_upstream(response)])
+    except httpx.HTTPError as e:
+        print(f"Gateway Error: {e}")
+        raise HTTPException(status_code=500, detail="Internal Gateway Error")
+
+async def forward_request(service_url: str, path: str, request: Request, stream: bool = STREAMING_ENABLED):
+    response = await open_upstream(service_url, path, request, stream)
+
+    if stream:
+        return StreamingResponse(
+            stream_upstream(response),
+            status_code=response.status_code,
+            headers=filter_headers(response.headers)
+        )
+
+    body = await read_upstream(response)
+    return Response(
+        content=body,
+        status_code=response.status_code,
+        headers=filter_headers(response.headers)
+    )
+
+# --- CACHE RESPONSE CHO CÁC API PUBLIC ---
+# Header điều kiện của client không gửi lên upstream: cache tự trả 304 dựa trên ETag của nó
+CONDITIONAL_HEADERS = {"if-none-match", "if-modified-since"}
+
+response_cache = ResponseCache()
+
+async def cached_forward(route: Route, path: str, request: Request):
+    """GET qua cache: còn hạn -> trả luôn; hết hạn -> revalidate bằng ETag; miss -> gộp về 1 lần gọi upstream."""
+    ttl = float(route.options["cache"].get("ttl", CACHE_DEFAULT_TTL))
+    key = response_cache.make_key(request.method, request.url.path, request.url.query)
+    entry, fresh = response_cache.lookup(key)
+
+    if fresh:
+        response_cache.hits += 1
+        status = "HIT"
+    else:
+        response_cache.misses += 1
+        status = "MISS"
+        stale = entry
+
+        async def load() -> CachedResponse:
+            generation = response_cache.generation(request.url.path)
+            headers = {k: v for k, v in filter_headers(request.headers).items() if k.lower() not in CONDITIONAL_HEADERS}
+            if stale is not None and stale.upstream_etag:
+                headers["if-none-match"] = stale.upstream_etag
+            response = await open_upstream(route.upstream, path, request, stream=False, headers=headers)
+            body = await read_upstream(response)
+            response_headers = filter_headers(response.headers)
+
+            if response.status_code == 304 and stale is not None:
+                allowed_ttl = cacheable_ttl(200, response_headers, ttl)
+                if allowed_ttl is None:
+                    # Upstream không cho cache nữa (no-store/private): bỏ entry cũ, lần sau hỏi lại từ đầu
+                    response_cache.discard(key, stale)
+                else:
+                    response_cache.refresh(stale, allowed_ttl)
+                return stale
+
+            allowed_ttl = cacheable_ttl(response.status_code, response_headers, ttl)
+            prefix = resource_prefix(request.url.path)
+            new_entry = CachedResponse(response.status_code, response_headers, body, allowed_ttl or 0, prefix)
+            if allowed_ttl is not None:
+                response_cache.store(key, new_entry, generation)
+            elif stale is not None:
+                # Response mới không được cache: không để entry cũ ở lại phục vụ tiếp
+                response_cache.discard(key, stale)
+            return new_entry
+
+        entry = await response_cache.fetch(key, load)
+
+    if entry.status_code == 200 and request.headers.get("if-none-match") == entry.etag:
+        return Response(status_code=304, headers={"etag": entry.etag, "x-cache": status})
+    headers = dict(entry.headers)
+    headers["etag"] = entry.etag
+    headers["x-cache"] = status
+    return Response(content=entry.body, status_code=entry.status_code, headers=headers)
+
+# --- GỘP CÁC GET TRÙNG NHAU ĐANG CHẠY (SINGLEFLIGHT), KHÔNG CẦN BẬT CACHE ---
+SINGLEFLIGHT_ENABLED = os.getenv("GATEWAY_SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+IDEMPOTENT_METHODS = {"GET", "HEAD"}
+
+upstream_flight = SingleFlight()
+
+async def coalesced_forward(route: Route, path: str, request: Request):
+    """Các GET giống hệt nhau đang chờ cùng lúc chỉ tạo 1 request lên upstream.
+    Mặc định key có cả header Authorization để không chia sẻ response giữa các user khác nhau;
+    route public có thể khai báo "singleflight": {"vary": []}."""
+    options = route.options["singleflight"]
+    vary = options.get("vary", ["authorization"]) if isinstance(options, dict) else ["authorization"]
+    key = ResponseCache.make_key(request.method, request.url.path, request.url.query)
+    key += "".join(f"\n{name}:{request.headers.get(name, '')}" for name in vary)
+
+    async def load():
+        response = await open_upstream(route.upstream, path, request, stream=False)
+        body = await read_upstream(response)
+        return response.status_code, filter_headers(response.headers), body
+
+    status_code, headers, body = await upstream_flight.do(key, load)
+    return Response(content=body, status_code=status_code, headers=headers)
+
+def invalidate_cache(route: Route, path: str):
+    # POST/PUT/DELETE vào 1 resource -> xóa cache cùng prefix (+ các prefix khai báo thêm trong route)
+    response_cache.invalidate_prefix(resource_prefix(path))
+    for prefix in route.options.get("invalidates", []):
+        response_cache.invalidate_prefix(prefix)
+
+# --- THỐNG KÊ CONNECTION POOL ---
+@app.get("/gateway/pools")
+def pool_stats():
+    return upstreams.stats()
+
+# --- THỐNG KÊ CACHE ---
+@app.get("/gateway/cache")
+def cache_stats():
+    return response_cache.stats()
+
+# --- THỐNG KÊ SINGLEFLIGHT ---
+@app.get("/gateway/singleflight")
+def singleflight_stats():
+    return {"enabled": SINGLEFLIGHT_ENABLED, **upstream_flight.stats()}
+
+# --- THỐNG KÊ RATE LIMIT & GIẢM TẢI ---
+@app.get("/gateway/load")
+def load_stats():
+    return {"rate_limited": rate_limiter.limited, **load_shedder.stats()}
+
+# --- BẢNG ROUTE ĐANG DÙNG ---
+@app.get("/gateway/routes")
+def route_table():
+    return [route.to_dict() for route in route_config.current().routes]
@@ -0,0 +1,156 @@
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+# --- CẤU HÌNH RATE LIMIT & LOAD SHEDDING ---
+# Có RATE_LIMIT_REDIS_URL -> mọi gateway replica dùng chung bucket trên Redis
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+# Chỉ tin X-Forwarded-For khi gateway đứng sau load balancer
+TRUST_FORWARDED_FOR = os.getenv("GATEWAY_TRUST_FORWARDED_FOR", "false").lower() == "true"
+# Số request gateway đang xử lý tối đa trước khi trả 503 ngay
+MAX_INFLIGHT = int(os.getenv("GATEWAY_MAX_INFLIGHT", 1000))
+# Bỏ qua độ trễ EWMA nếu upstream đã lâu không có request nào
+LATENCY_SAMPLE_MAX_AGE = float(os.getenv("GATEWAY_SHED_SAMPLE_MAX_AGE", 10))
+
+
+class InMemoryBucketStore:
+    """Token bucket trong RAM của 1 process, giới hạn số key (LRU)."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1) -> Tuple[bool, float]:
+        """Trả về (được phép, số giây nên chờ trước khi thử lại)."""
+        now = time.monotonic()
+        tokens, updated_at = self.buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self.buckets[key] = (tokens, now)
+        self.buckets.move_to_end(key)
+        while len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+
+class RedisBucketStore:
+    """Token bucket dùng chung giữa nhiều gateway, cập nhật nguyên tử bằng Lua script trên Redis."""
+
+    SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+else
+  retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(retry_after)}
+"""
+
+    def __init__(self, url: str):
+        # Chỉ cần gói redis khi thật sự bật store dùng chung
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.script = self.client.register_script(self.SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1) -> Tuple[bool, float]:
+        try:
+            allowed, retry_after = await self.script(keys=[f"ratelimit:{key}"], args=[rate, burst, cost])
+        except Exception as e:
+            # Redis lỗi thì cho qua (fail-open), không chặn toàn bộ traffic
+            print(f"⚠️ Rate limit store error: {e}")
+            return True, 0.0
+        return bool(int(allowed)), float(retry_after)
+
+    async def aclose(self):
+        await self.client.close()
+
+
+def create_bucket_store():
+    if RATE_LIMIT_REDIS_URL:
+        return RedisBucketStore(RATE_LIMIT_REDIS_URL)
+    return InMemoryBucketStore()
+
+
+def client_ip(scope) -> str:
+    if TRUST_FORWARDED_FOR:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class RateLimiter:
+    """Giới hạn theo route trong routes.json, vd:
+    "rate_limit": {"rate": 1, "burst": 5, "key": "user"}  (rate = token/giây)
+    key "user" dùng x-user-id do gateway gắn (chưa đăng nhập thì theo IP), key "ip" luôn theo IP."""
+
+    def __init__(self, store):
+        self.store = store
+        self.limited = 0
+
+    async def check(self, route, scope) -> Optional[float]:
+        """None nếu được qua, ngược lại là số giây Retry-After."""
+        options = route.options.get("rate_limit")
+        if not options:
+            return None
+        identity = None
+        if options.get("key", "user") == "user":
+            identity = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"x-user-id"), None)
+        identity = f"user:{identity}" if identity else f"ip:{client_ip(scope)}"
+
+        rate = float(options["rate"])
+        burst = float(options.get("burst", max(1.0, rate)))
+        allowed, retry_after = await self.store.take(f"{route.pattern}:{identity}", rate, burst)
+        if allowed:
+            return None
+        self.limited += 1
+        return retry_after
+
+    async def aclose(self):
+        if hasattr(self.store, "aclose"):
+            await self.store.aclose()
+
+
+class LoadShedder:
+    """Từ chối sớm (503) thay vì để request xếp hàng khi gateway quá tải hoặc upstream đang chậm."""
+
+    def __init__(self, max_inflight: int = MAX_INFLIGHT):
+        self.max_inflight = max_inflight
+        self.inflight = 0
+        self.shed = 0
+
+    def should_shed(self, pool) -> bool:
+        if self.inflight >= self.max_inflight:
+            self.shed += 1
+            return True
+        latency, age = pool.latency_ewma, time.monotonic() - pool.latency_updated_at
+        threshold = pool.policy.shed_latency
+        if threshold > 0 and latency > threshold and age < LATENCY_SAMPLE_MAX_AGE:
+            # Bỏ theo xác suất tỉ lệ với mức vượt ngưỡng, vẫn chừa ít request đi qua
+            # để EWMA được cập nhật khi upstream hồi phục
+            if random.random() < min(0.9, (latency - threshold) / threshold):
+                self.shed += 1
+                return True
+        return False
+
+    def stats(self) -> dict:
+        return {"inflight": self.inflight, "max_inflight": self.max_inflight, "shed": self.shed}
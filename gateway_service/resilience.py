@@ -0,0 +1,151 @@
+import os
+import random
+import time
+
+import httpx
+
+# --- NGÂN SÁCH RETRY TOÀN GATEWAY ---
+# Mỗi request "gửi" RETRY_BUDGET_RATIO token, mỗi lần retry "tiêu" 1 token
+# -> khi hệ thống lỗi diện rộng, số retry không thể vượt quá ~20% lưu lượng thật.
+RETRY_BUDGET_RATIO = float(os.getenv("GATEWAY_RETRY_BUDGET_RATIO", 0.2))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("GATEWAY_RETRY_BUDGET_MIN_PER_SECOND", 5))
+RETRY_BUDGET_MAX_TOKENS = float(os.getenv("GATEWAY_RETRY_BUDGET_MAX_TOKENS", 100))
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class UpstreamPolicy:
+    """Timeout, retry và ngưỡng circuit breaker cho một upstream.
+    Mọi giá trị đều ghi đè được qua env theo tên dịch vụ, vd ORDER_SERVICE_READ_TIMEOUT=3."""
+
+    def __init__(
+        self,
+        connect_timeout: float = 2.0,
+        read_timeout: float = 10.0,
+        write_timeout: float = 10.0,
+        pool_timeout: float = 2.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.05,
+        backoff_max: float = 1.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 10.0,
+        shed_latency: float = 2.0,
+    ):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.pool_timeout = pool_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # Độ trễ trung bình (EWMA, giây) vượt ngưỡng này thì gateway bắt đầu bỏ bớt request
+        self.shed_latency = shed_latency
+
+    @classmethod
+    def from_env(cls, prefix: str, **defaults) -> "UpstreamPolicy":
+        policy = cls(**defaults)
+        for name, value in vars(policy).items():
+            raw = os.getenv(f"{prefix}_{name.upper()}")
+            if raw is not None:
+                setattr(policy, name, type(value)(raw))
+        return policy
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout, read=self.read_timeout,
+            write=self.write_timeout, pool=self.pool_timeout,
+        )
+
+    def backoff(self, attempt: int) -> float:
+        # Exponential backoff với "full jitter" để các gateway không retry cùng nhịp
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """closed -> (lỗi liên tiếp >= ngưỡng) -> open -> (hết reset_timeout) -> half-open
+    -> (1 request thử thành công) -> closed / (thất bại) -> open."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_inflight = False
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """Chỉ kiểm tra trạng thái trong RAM, không đụng tới mạng."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self.probe_inflight = False
+        if self.state == self.HALF_OPEN:
+            if self.probe_inflight:
+                self.rejected += 1
+                return False
+            self.probe_inflight = True
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probe_inflight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_inflight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        # Request thử ở half-open kết thúc mà không xác định được thành/bại
+        self.probe_inflight = False
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures, "rejected": self.rejected}
+
+
+class RetryBudget:
+    def __init__(self, ratio: float, min_per_second: float, max_tokens: float):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.updated_at = time.monotonic()
+        self.exhausted = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self.updated_at) * self.min_per_second)
+        self.updated_at = now
+
+    def deposit(self):
+        self._refill()
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.exhausted += 1
+        return False
+
+    def stats(self) -> dict:
+        self._refill()
+        return {"tokens": round(self.tokens, 2), "exhausted": self.exhausted}
+
+
+retry_budget = RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MIN_PER_SECOND, RETRY_BUDGET_MAX_TOKENS)
@@ -0,0 +1,115 @@
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class Route:
+    """Một dòng trong bảng định tuyến: path pattern + method -> upstream.
+    Các key khác trong config (cache, timeout...) giữ nguyên trong `options`."""
+
+    def __init__(self, pattern: str, methods: List[str], upstream: str, options: Optional[dict] = None):
+        self.pattern = pattern
+        self.methods = {m.upper() for m in methods}
+        self.upstream = upstream
+        self.options = options or {}
+
+    def to_dict(self) -> dict:
+        return {"path": self.pattern, "methods": sorted(self.methods), "upstream": self.upstream, **self.options}
+
+
+class _Node:
+    __slots__ = ("children", "exact", "prefix")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.exact: List[Route] = []   # route khớp đúng path này
+        self.prefix: List[Route] = []  # route "/xxx/*": khớp mọi path con bên dưới
+
+
+class RouteTable:
+    """Trie theo từng segment của path. Match tốn O(số segment), không phụ thuộc số route."""
+
+    def __init__(self, routes: List[Route]):
+        self.routes = routes
+        self.root = _Node()
+        for route in routes:
+            self._add(route)
+
+    def _add(self, route: Route):
+        segments = [s for s in route.pattern.split("/") if s]
+        wildcard = bool(segments) and segments[-1] == "*"
+        if wildcard:
+            segments = segments[:-1]
+        node = self.root
+        for seg in segments:
+            node = node.children.setdefault(seg, _Node())
+        (node.prefix if wildcard else node.exact).append(route)
+
+    def _match(self, path: str) -> List[Route]:
+        node = self.root
+        best: List[Route] = []
+        for seg in (s for s in path.split("/") if s):
+            # Prefix ở node sâu hơn sẽ đè prefix ở node nông hơn
+            if node.prefix:
+                best = node.prefix
+            node = node.children.get(seg)
+            if node is None:
+                return best
+        return node.exact or best
+
+    def resolve(self, method: str, path: str) -> Tuple[Optional[Route], List[str]]:
+        """Trả về (route, []) nếu khớp; (None, allowed_methods) nếu path khớp nhưng sai method;
+        (None, []) nếu không có route nào (để FastAPI xử lý tiếp)."""
+        candidates = self._match(path)
+        for route in candidates:
+            if method in route.methods:
+                return route, []
+        allowed = sorted({m for route in candidates for m in route.methods})
+        return None, allowed
+
+
+class RouteConfig:
+    """Đọc bảng route từ file JSON, tự nạp lại khi file thay đổi (không cần deploy lại code)."""
+
+    def __init__(self, path: str, upstreams: Dict[str, str], reload_interval: float = 5.0):
+        self.path = path
+        self.default_upstreams = upstreams
+        self.reload_interval = reload_interval
+        self.upstreams: Dict[str, str] = dict(upstreams)
+        self.mtime = 0.0
+        self.checked_at = 0.0
+        self.table = RouteTable([])
+        self.load()
+
+    def load(self):
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        upstreams = {**self.default_upstreams, **data.get("upstreams", {})}
+
+        routes = []
+        for entry in data.get("routes", []):
+            entry = dict(entry)
+            pattern = entry.pop("path")
+            methods = entry.pop("methods")
+            name = entry.pop("upstream")
+            if name not in upstreams:
+                raise ValueError(f"Route {pattern}: upstream '{name}' chưa được khai báo")
+            routes.append(Route(pattern, methods, upstreams[name], entry))
+
+        self.upstreams = upstreams
+        self.table = RouteTable(routes)
+        self.mtime = os.path.getmtime(self.path)
+
+    def current(self) -> RouteTable:
+        now = time.monotonic()
+        if self.reload_interval > 0 and now - self.checked_at >= self.reload_interval:
+            self.checked_at = now
+            try:
+                if os.path.getmtime(self.path) != self.mtime:
+                    self.load()
+                    print(f"🔄 Gateway: Đã nạp lại bảng route từ {self.path}")
+            except Exception as e:
+                # Config lỗi thì giữ nguyên bảng cũ
+                print(f"⚠️ Gateway: Không nạp được bảng route mới: {e}")
+        return self.table
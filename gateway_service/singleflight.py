@@ -0,0 +1,36 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """Gộp các lời gọi trùng key đang chạy đồng thời: chỉ lời gọi đầu tiên thực sự chạy,
+    các lời gọi sau chờ và nhận chung kết quả (hoặc chung exception)."""
+
+    def __init__(self):
+        self.inflight: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self.inflight.get(key)
+        if task is None:
+            self.calls += 1
+            # Lời gọi chung chạy trong task riêng, không thuộc request nào: client đầu tiên
+            # ngắt kết nối chỉ hủy phần chờ của nó, các request khác vẫn nhận kết quả
+            task = asyncio.ensure_future(fn())
+            self.inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.shared += 1
+        # shield: mọi request (kể cả request đầu tiên) bị hủy cũng không hủy lời gọi chung
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        # Đánh dấu đã đọc exception để asyncio không cảnh báo khi mọi request chờ đã bị hủy
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {"inflight": len(self.inflight), "calls": self.calls, "shared": self.shared}
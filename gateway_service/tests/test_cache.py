@@ -0,0 +1,71 @@
+import asyncio
+
+import httpx
+import pytest
+from starlette.requests import Request
+
+import main
+from cache import ResponseCache
+from routing import Route
+
+ROUTE = Route("/foods", ["GET"], "http://restaurant", {"cache": {"ttl": 30}})
+
+
+def get_request() -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/foods", "query_string": b"",
+                    "headers": [], "scheme": "http", "server": ("gateway", 8000)})
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Thay upstream bằng danh sách response trả lần lượt."""
+    responses = []
+
+    async def open_upstream(service_url, path, request, stream, headers=None):
+        return responses.pop(0)
+
+    async def read_upstream(response):
+        return response.content
+
+    monkeypatch.setattr(main, "response_cache", ResponseCache())
+    monkeypatch.setattr(main, "open_upstream", open_upstream)
+    monkeypatch.setattr(main, "read_upstream", read_upstream)
+    return responses
+
+
+def expire_all():
+    for entry in main.response_cache.entries.values():
+        entry.expires_at = 0
+
+
+def forward():
+    return asyncio.run(main.cached_forward(ROUTE, "/foods", get_request()))
+
+
+def test_revalidated_304_keeps_entry(upstream):
+    upstream += [httpx.Response(200, content=b"[1]", headers={"etag": '"a"'}), httpx.Response(304)]
+    forward()
+    expire_all()
+
+    assert forward().body == b"[1]"
+    assert len(main.response_cache.entries) == 1
+
+
+def test_304_with_no_store_evicts_entry(upstream):
+    upstream += [httpx.Response(200, content=b"[1]", headers={"etag": '"a"'}),
+                 httpx.Response(304, headers={"cache-control": "no-store"})]
+    forward()
+    expire_all()
+
+    assert forward().body == b"[1]"
+    assert main.response_cache.entries == {}
+
+
+def test_uncacheable_200_evicts_stale_entry(upstream):
+    upstream += [httpx.Response(200, content=b"[1]", headers={"etag": '"a"'}),
+                 httpx.Response(200, content=b"[2]", headers={"cache-control": "private"})]
+    forward()
+    expire_all()
+
+    assert forward().body == b"[2]"
+    assert main.response_cache.entries == {}
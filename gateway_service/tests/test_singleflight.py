@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_waiters_share_result():
+    async def main():
+        flight = SingleFlight()
+        calls = 0
+
+        async def load():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "ok"
+
+        results = await asyncio.gather(*(flight.do("k", load) for _ in range(5)))
+        return results, calls, flight.stats()
+
+    results, calls, stats = asyncio.run(main())
+    assert results == ["ok"] * 5
+    assert calls == 1
+    assert stats == {"inflight": 0, "calls": 1, "shared": 4}
+
+
+def test_leader_cancelled_waiters_still_get_result():
+    async def main():
+        flight = SingleFlight()
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def load():
+            started.set()
+            await release.wait()
+            return "ok"
+
+        leader = asyncio.ensure_future(flight.do("k", load))
+        await started.wait()
+        waiters = [asyncio.ensure_future(flight.do("k", load)) for _ in range(3)]
+        await asyncio.sleep(0)
+
+        # Client của request đầu tiên ngắt kết nối
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        results = await asyncio.gather(*waiters)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return results, flight.stats()
+
+    results, stats = asyncio.run(main())
+    assert results == ["ok"] * 3
+    assert stats["inflight"] == 0
+
+
+def test_exception_is_shared():
+    async def main():
+        flight = SingleFlight()
+
+        async def load():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        return await asyncio.gather(*(flight.do("k", load) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, ValueError) for r in results)
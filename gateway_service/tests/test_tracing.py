@@ -0,0 +1,61 @@
+import asyncio
+
+import httpx
+import pytest
+
+from common import tracing
+
+
+class Collector:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+@pytest.fixture
+def spans():
+    collector = Collector()
+    previous = tracing.exporter
+    tracing.set_exporter(collector)
+    yield collector.spans
+    tracing.set_exporter(previous)
+
+
+def send(handler):
+    async def run():
+        transport = tracing.TracingTransport(httpx.MockTransport(handler))
+        async with httpx.AsyncClient(transport=transport) as client:
+            with tracing.start_span("test", parent=("a" * 32, "b" * 16, True)):
+                return await client.get("http://upstream/items")
+    return asyncio.run(run())
+
+
+def test_client_span_carries_traceparent_and_status(spans):
+    seen = {}
+
+    def handler(request):
+        seen["traceparent"] = request.headers.get("traceparent")
+        return httpx.Response(503)
+
+    send(handler)
+
+    client = next(span for span in spans if span.kind == "client")
+    assert seen["traceparent"] == client.traceparent()
+    assert client.parent_id is not None and client.end is not None
+    assert client.attributes["http.status_code"] == 503
+    assert client.status == "error"
+
+
+def test_client_span_finishes_on_connect_error(spans):
+    def handler(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    with pytest.raises(httpx.ConnectError):
+        send(handler)
+
+    client = next(span for span in spans if span.kind == "client")
+    assert client.end is not None
+    assert client.status == "error"
+    assert "ConnectError" in client.attributes["error"]
@@ -0,0 +1,169 @@
+import asyncio
+import os
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from common import tracing
+from resilience import CircuitBreaker, CircuitOpenError, UpstreamPolicy, retry_budget
+
+# HTTP/2 cần gói 'h2' (httpx[http2]). Không có thì tự quay về HTTP/1.1.
+try:
+    import h2  # noqa: F401
+    H2_AVAILABLE = True
+except ImportError:
+    H2_AVAILABLE = False
+
+# --- CẤU HÌNH CONNECTION POOL (ĐỌC TỪ BIẾN MÔI TRƯỜNG) ---
+MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", 100))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", 20))
+KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", 30))
+HTTP2_ENABLED = os.getenv("UPSTREAM_HTTP2", "true").lower() == "true"
+
+# Upstream trả các mã này coi như lỗi (tính vào circuit breaker, được retry)
+RETRYABLE_STATUS = {502, 503, 504}
+LATENCY_EWMA_ALPHA = 0.2
+
+
+class UpstreamPool:
+    """Một AsyncClient sống lâu (kèm connection pool) cho một dịch vụ phía sau."""
+
+    def __init__(
+        self,
+        base_url: str,
+        max_connections: int = MAX_CONNECTIONS,
+        max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = KEEPALIVE_EXPIRY,
+        http2: bool = HTTP2_ENABLED,
+        policy: Optional[UpstreamPolicy] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.policy = policy or UpstreamPolicy()
+        self.breaker = CircuitBreaker(self.policy.failure_threshold, self.policy.reset_timeout)
+        # Lưu ý: với URL http:// (không TLS) httpx vẫn nói HTTP/1.1,
+        # HTTP/2 chỉ được dùng khi backend hỗ trợ qua ALPN (https://).
+        self.http2 = http2 and H2_AVAILABLE
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        # limits/http2 nằm ở transport (client bỏ qua 2 tham số này khi đã truyền transport)
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url, timeout=self.policy.timeout(),
+            transport=tracing.httpx_transport(limits=self.limits, http2=self.http2),
+        )
+        self.requests_total = 0
+        self.errors_total = 0
+        self.retries_total = 0
+        self.latency_ewma = 0.0
+        self.latency_updated_at = 0.0
+
+    def observe_latency(self, seconds: float):
+        # Thời gian tới khi nhận header response, làm mượt bằng EWMA
+        self.latency_ewma += LATENCY_EWMA_ALPHA * (seconds - self.latency_ewma)
+        self.latency_updated_at = time.monotonic()
+
+    async def send(self, request: httpx.Request, stream: bool = False, retryable: bool = False) -> httpx.Response:
+        """Gửi qua circuit breaker. retryable=True chỉ dùng cho method idempotent có body gửi lại được."""
+        if not self.breaker.allow():
+            # Fail nhanh, không mở kết nối nào
+            raise CircuitOpenError(self.base_url)
+
+        retry_budget.deposit()
+        attempt = 0
+        while True:
+            self.requests_total += 1
+            started = time.perf_counter()
+            try:
+                response = await self.client.send(request, stream=stream)
+            except httpx.TransportError:
+                self.observe_latency(time.perf_counter() - started)
+                self.errors_total += 1
+                self.breaker.record_failure()
+                if not await self._before_retry(retryable, attempt):
+                    raise
+                attempt += 1
+                continue
+            except BaseException:
+                self.errors_total += 1
+                self.breaker.release()
+                raise
+            self.observe_latency(time.perf_counter() - started)
+
+            if response.status_code in RETRYABLE_STATUS:
+                self.breaker.record_failure()
+                if await self._before_retry(retryable, attempt, response):
+                    attempt += 1
+                    continue
+                return response
+
+            self.breaker.record_success()
+            return response
+
+    async def _before_retry(self, retryable: bool, attempt: int, response: Optional[httpx.Response] = None) -> bool:
+        if not retryable or attempt >= self.policy.max_retries:
+            return False
+        if not self.breaker.allow() or not retry_budget.withdraw():
+            return False
+        if response is not None:
+            await response.aclose()
+        self.retries_total += 1
+        await asyncio.sleep(self.policy.backoff(attempt))
+        return True
+
+    def stats(self) -> dict:
+        # httpx không public trạng thái pool, đọc từ httpcore nếu có
+        connections = []
+        transport = getattr(self.client, "_transport", None)
+        # Bỏ lớp TracingTransport để tới AsyncHTTPTransport thật
+        transport = getattr(transport, "transport", transport)
+        pool = getattr(transport, "_pool", None)
+        if pool is not None:
+            connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for c in connections if c.is_idle())
+        return {
+            "base_url": self.base_url,
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "connections": len(connections),
+            "idle_connections": idle,
+            "active_connections": len(connections) - idle,
+            "requests_total": self.requests_total,
+            "errors_total": self.errors_total,
+            "retries_total": self.retries_total,
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 1),
+            "circuit": self.breaker.stats(),
+        }
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class UpstreamRegistry:
+    """Quản lý các pool theo base URL. Tạo trong lifespan, đóng khi shutdown."""
+
+    def __init__(self):
+        self.pools: Dict[str, UpstreamPool] = {}
+
+    def register(self, base_url: str, **options) -> UpstreamPool:
+        key = base_url.rstrip("/")
+        if key not in self.pools:
+            self.pools[key] = UpstreamPool(key, **options)
+        return self.pools[key]
+
+    def get(self, base_url: str) -> UpstreamPool:
+        pool: Optional[UpstreamPool] = self.pools.get(base_url.rstrip("/"))
+        if pool is None:
+            pool = self.register(base_url)
+        return pool
+
+    def stats(self) -> dict:
+        return {"pools": [pool.stats() for pool in self.pools.values()], "retry_budget": retry_budget.stats()}
+
+    async def aclose(self):
+        for pool in self.pools.values():
+            await pool.aclose()
+        self.pools.clear()
@@ -3,6 +3,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Dict
 import uvicorn
 from pydantic import BaseModel
+from common import metrics
+from common import tracing
 
 app = FastAPI()
 
@@ -15,6 +17,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- METRICS (/metrics) ---
+metrics.instrument(app)
+
+# --- TRACING (traceparent W3C) ---
+tracing.instrument(app, "notification_service")
+
 # QUẢN LÝ KẾT NỐI
 class ConnectionManager:
     def __init__(self):
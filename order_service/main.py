@@ -1,18 +1,28 @@
+import base64
 import httpx
 import json
 import asyncio
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, load_only, selectinload
 from pydantic import BaseModel
 from typing import List, Optional
-from database import SessionLocal, engine, Base
+from database import AsyncSessionLocal, SessionLocal, engine, async_engine, run_migrations, warm_up, warm_up_async
 import models
+from common import auth
+from common import metrics
+from common import tracing
+import pricing
+from pricing import MENU_EVENTS_TOPIC, price_book
 from datetime import datetime
 from contextlib import asynccontextmanager
-from aiokafka import AIOKafkaConsumer
+from aiokafka import AIOKafkaConsumer, TopicPartition
 
-Base.metadata.create_all(bind=engine)
+run_migrations()
 
 # --- CẤU HÌNH KAFKA CONSUMER ---
 KAFKA_TOPIC = "order_paid"
@@ -34,49 +44,104 @@ async def consume_messages():
     
     try:
         async for msg in consumer:
-            try:
-                # 1. Đọc tin nhắn
-                payload = json.loads(msg.value.decode("utf-8"))
-                print(f"📥 Order Service: Nhận tin nhắn từ Kafka: {payload}")
+            metrics.record_kafka_consume(msg, consumer.highwater(TopicPartition(msg.topic, msg.partition)))
+            # Nối tiếp trace từ payment_service qua header traceparent của message
+            parent = tracing.extract_kafka(msg.headers)
+            with tracing.start_span(f"{msg.topic} process", "consumer", parent, topic=msg.topic) as span:
+                try:
+                    # 1. Đọc tin nhắn
+                    payload = json.loads(msg.value.decode("utf-8"))
+                    print(f"📥 Order Service: Nhận tin nhắn từ Kafka: {payload}")
                 
-                if payload.get("event") == "ORDER_PAID":
-                    order_id = payload.get("order_id")
+                    if payload.get("event") == "ORDER_PAID":
+                        order_id = payload.get("order_id")
                     
-                    # 2. Mở DB Session mới (Vì đang ở trong async task riêng biệt)
-                    db = SessionLocal()
-                    try:
-                        order = db.query(models.Order).options(joinedload(models.Order.items)).filter(models.Order.id == order_id).first()
-                        if order:
-                            # 3. Cập nhật trạng thái
-                            order.status = "PAID"
-                            db.commit()
-                            print(f"✅ DB Updated: Đơn #{order_id} đã chuyển sang PAID")
+                        # 2. Mở DB Session mới (Vì đang ở trong async task riêng biệt)
+                        async with AsyncSessionLocal() as db:
+                            result = await db.execute(
+                                select(models.Order).options(selectinload(models.Order.items)).where(models.Order.id == order_id)
+                            )
+                            order = result.scalars().first()
+                            if order:
+                                # 3. Cập nhật trạng thái
+                                order.status = "PAID"
+                                await db.commit()
+                                print(f"✅ DB Updated: Đơn #{order_id} đã chuyển sang PAID")
                             
-                            # 4. Gọi Notification (Bắn socket)
-                            notify_url = "http://notification_service:8006/notify"
-                            item_count = len(order.items)
-                            async with httpx.AsyncClient() as client:
-                                await client.post(notify_url, json={
-                                    "branch_id": order.branch_id,
-                                    "message": f"💰 (Kafka) Đơn #{order.id} ĐÃ THANH TOÁN: {item_count} món - {order.total_price:,.0f}đ"
-                                })
-                                print("🔔 Notification Sent via Kafka Flow")
-                        else:
-                            print(f"⚠️ Không tìm thấy đơn #{order_id} trong DB")
-                    finally:
-                        db.close()
+                                # 4. Gọi Notification (Bắn socket)
+                                notify_url = "http://notification_service:8006/notify"
+                                item_count = len(order.items)
+                                async with httpx.AsyncClient(transport=tracing.httpx_transport()) as client:
+                                    await client.post(notify_url, json={
+                                        "branch_id": order.branch_id,
+                                        "message": f"💰 (Kafka) Đơn #{order.id} ĐÃ THANH TOÁN: {item_count} món - {order.total_price:,.0f}đ"
+                                    })
+                                    print("🔔 Notification Sent via Kafka Flow")
+                            else:
+                                print(f"⚠️ Không tìm thấy đơn #{order_id} trong DB")
                         
-            except Exception as e:
-                print(f"❌ Lỗi xử lý tin nhắn: {e}")
+                except Exception as e:
+                    span.status = "error"
+                    span.set("error", repr(e))
+                    print(f"❌ Lỗi xử lý tin nhắn: {e}")
                 
     finally:
         await consumer.stop()
 
+async def consume_menu_events():
+    """Nghe menu_changed để cập nhật bảng giá. Không dùng group_id: replica nào cũng nhận đủ sự kiện."""
+    consumer = AIOKafkaConsumer(
+        MENU_EVENTS_TOPIC,
+        bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
+        auto_offset_reset='latest'
+    )
+    try:
+        await consumer.start()
+    except Exception as e:
+        print(f"⚠️ Price book: không kết nối được Kafka ({e}), chỉ làm mới định kỳ")
+        return
+    # Sự kiện xảy ra giữa lúc nạp bảng giá và lúc subscribe: tải lại 1 lần (304 nếu không đổi).
+    # Không dùng try_refresh: lifespan vừa nạp xong nên nó sẽ bỏ qua vì giới hạn tần suất
+    try:
+        await price_book.refresh()
+    except (httpx.HTTPError, ValueError, KeyError) as e:
+        print(f"⚠️ Price book refresh error: {e}")
+
+    try:
+        async for msg in consumer:
+            metrics.record_kafka_consume(msg, consumer.highwater(TopicPartition(msg.topic, msg.partition)))
+            parent = tracing.extract_kafka(msg.headers)
+            with tracing.start_span(f"{msg.topic} process", "consumer", parent, topic=msg.topic) as span:
+                try:
+                    price_book.apply_event(json.loads(msg.value.decode("utf-8")))
+                except Exception as e:
+                    span.status = "error"
+                    span.set("error", repr(e))
+                    print(f"❌ Lỗi xử lý sự kiện menu: {e}")
+    finally:
+        await consumer.stop()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Mở sẵn kết nối DB trước khi nhận request
+    warm_up()
+    await warm_up_async()
+    # Nạp bảng giá món trước khi nhận đơn (restaurant_service chưa lên thì nạp lúc có đơn đầu tiên)
+    try:
+        await price_book.refresh()
+        print(f"💰 Price book: {price_book.stats()}")
+    except Exception as e:
+        print(f"⚠️ Price book warm-up error: {e}")
     # Kích hoạt Consumer chạy nền
     asyncio.create_task(consume_messages())
+    menu_consumer = asyncio.create_task(consume_menu_events())
+    refresher = asyncio.create_task(pricing.run_refresher(price_book))
     yield
+    menu_consumer.cancel()
+    refresher.cancel()
+    await pricing.aclose()
+    await auth.aclose()
+    await async_engine.dispose()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -86,8 +151,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cho frontend đọc được cursor phân trang của GET /orders
+    expose_headers=["X-Next-Cursor"],
 )
 
+# --- METRICS (/metrics) ---
+metrics.instrument(app, engines=[engine, async_engine])
+
+# --- TRACING (traceparent W3C) ---
+tracing.instrument(app, "order_service")
+
 def get_db():
     db = SessionLocal()
     try:
@@ -95,6 +168,10 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 # --- DTOs ---
 class OrderItemResponse(BaseModel):
     food_id: int
@@ -122,13 +199,15 @@ class OrderResponse(BaseModel):
 class OrderItemCreate(BaseModel):
     food_id: int
     quantity: int
-    food_name: str
-    price: float
+    # Giá/tên do server tính từ bảng giá; client gửi giá thì phải khớp, không thì 409
+    food_name: Optional[str] = None
+    price: Optional[float] = None
     image_url: Optional[str] = None
     branch_id: Optional[int] = None 
 
 class OrderCreate(BaseModel):
-    user_id: int
+    # Chỉ dùng cho khách chưa đăng nhập; có token thì user lấy từ danh tính đã xác thực
+    user_id: Optional[int] = None
     branch_id: int
     items: List[OrderItemCreate]
     customer_name: str
@@ -139,14 +218,85 @@ class OrderCreate(BaseModel):
 
 # --- API ---
 
+# Phân trang keyset theo (created_at, id) giảm dần: trang sau lấy các đơn "cũ hơn" đơn cuối của trang trước,
+# nên chi phí mỗi trang không tăng theo độ dài lịch sử (khác OFFSET phải quét bỏ các dòng phía trước).
+# Chỉ phân trang khi client gửi limit hoặc cursor: Dashboard/OrderHistory cũ vẫn nhận đủ danh sách
+ORDERS_PAGE_DEFAULT = 50
+ORDERS_PAGE_MAX = 200
+ORDER_FIELDS = ("id", "user_id", "total_price", "status", "created_at", "customer_name",
+                "customer_phone", "delivery_address", "note")
+ORDER_ITEM_FIELDS = ("food_id", "food_name", "quantity", "price", "image_url")
+
+def encode_cursor(order) -> str:
+    raw = f"{order.created_at.isoformat()}|{order.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, order_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, UnicodeError):
+        raise HTTPException(400, "Invalid cursor")
+
 @app.get("/orders", response_model=List[OrderResponse])
-def get_orders(branch_id: Optional[int] = None, user_id: Optional[int] = None, db: Session = Depends(get_db)):
-    query = db.query(models.Order).options(joinedload(models.Order.items))
+def get_orders(
+    response: Response,
+    branch_id: Optional[int] = None, user_id: Optional[int] = None,
+    cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1),
+    include_items: bool = True, fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Trả các đơn (mới nhất trước). Có limit/cursor thì trả 1 trang, còn trang sau thì header X-Next-Cursor
+    chứa cursor cho lần gọi tiếp. fields=id,status,... chỉ lấy các cột đó; include_items=false bỏ danh sách món."""
+    paginate = limit is not None or cursor is not None
+    if paginate:
+        limit = min(limit or ORDERS_PAGE_DEFAULT, ORDERS_PAGE_MAX)
+    selected = None
+    if fields:
+        selected = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in selected if f not in ORDER_FIELDS]
+        if unknown:
+            raise HTTPException(400, f"Unknown fields: {', '.join(unknown)}")
+
+    query = db.query(models.Order)
     if branch_id:
         query = query.filter(models.Order.branch_id == branch_id)
     if user_id:
         query = query.filter(models.Order.user_id == user_id)
-    return query.order_by(models.Order.created_at.desc()).all()
+    if cursor:
+        created_at, order_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            models.Order.created_at < created_at,
+            and_(models.Order.created_at == created_at, models.Order.id < order_id),
+        ))
+    if selected:
+        # Luôn lấy id + created_at (cần cho cursor và để nạp món)
+        columns = set(selected) | {"id", "created_at"}
+        query = query.options(load_only(*(getattr(models.Order, name) for name in columns)))
+    if include_items:
+        # 1 câu IN (...) cho riêng các đơn của trang này, không nhân số dòng như JOIN
+        query = query.options(selectinload(models.Order.items))
+
+    query = query.order_by(models.Order.created_at.desc(), models.Order.id.desc())
+    # Lấy dư 1 dòng để biết còn trang sau hay không
+    orders = query.limit(limit + 1).all() if paginate else query.all()
+    headers = {}
+    if paginate and len(orders) > limit:
+        orders = orders[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(orders[-1])
+
+    if include_items and not selected:
+        response.headers.update(headers)
+        return orders
+
+    # Có chọn field: trả thẳng dict, tránh response_model tự điền lại các field đã bỏ
+    body = []
+    for order in orders:
+        row = {name: getattr(order, name) for name in (selected or ORDER_FIELDS)}
+        if include_items:
+            row["items"] = [{name: getattr(item, name) for name in ORDER_ITEM_FIELDS} for item in order.items]
+        body.append(row)
+    return JSONResponse(jsonable_encoder(body), headers=headers)
 
 @app.get("/orders/{order_id}", response_model=OrderResponse)
 def get_order_detail(order_id: int, db: Session = Depends(get_db)):
@@ -156,26 +306,49 @@ def get_order_detail(order_id: int, db: Session = Depends(get_db)):
     return order
 
 @app.put("/orders/{order_id}/status")
-async def update_order_status(order_id: int, status: str, db: Session = Depends(get_db)):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
+async def update_order_status(order_id: int, status: str, db: AsyncSession = Depends(get_async_db)):
+    order = await db.get(models.Order, order_id)
     if not order:
         raise HTTPException(404, "Order not found")
     order.status = status
-    db.commit()
+    await db.commit()
+    if status == "CANCELLED" and order.coupon_code:
+        # Đơn hủy thì trả lại lượt dùng mã
+        await pricing.release_coupon(order_id)
     return {"message": "Status updated", "status": order.status}
 
+async def discard_order(db: AsyncSession, order_id: int):
+    """Xóa đơn checkout dở (chưa trả về cho client nên không ai khác tham chiếu tới)."""
+    try:
+        await db.execute(delete(models.OrderItem).where(models.OrderItem.order_id == order_id))
+        await db.execute(delete(models.Order).where(models.Order.id == order_id))
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        print(f"⚠️ Không xóa được đơn checkout lỗi #{order_id}: {e}")
+
 @app.post("/checkout")
-async def create_order(payload: OrderCreate, db: Session = Depends(get_db)):
+async def create_order(payload: OrderCreate, request: Request, db: AsyncSession = Depends(get_async_db)):
     if not payload.items:
         raise HTTPException(400, "Cart is empty")
+    # Không tin user_id client gửi khi đã có danh tính đã xác thực: giới hạn lượt dùng mã theo user dựa vào đây.
+    # Dùng mã bắt buộc đăng nhập; khách chưa đăng nhập vẫn đặt đơn thường như trước
+    user = auth.identity_from_headers(request.headers)
+    if user is None and (payload.coupon_code or request.headers.get("authorization")):
+        user = await auth.get_identity(request)
+    user_id = user["id"] if user else payload.user_id
 
-    total_price = sum(item.price * item.quantity for item in payload.items)
+    # Giá lấy từ bảng giá trong RAM (không tin giá client gửi), không gọi remote cho từng món
+    lines, subtotal = await price_book.price_items(payload.items, payload.branch_id)
     
-    new_order = models.Order(
-        user_id=payload.user_id,
+    # 1 transaction: INSERT đơn (lấy id qua lastrowid) + 1 câu INSERT nhiều dòng cho món,
+    # lỗi giữa chừng thì session đóng sẽ rollback cả hai -> không còn đơn "mồ côi" thiếu món.
+    # COMMIT ngay, trước khi gọi restaurant_service: không giữ transaction mở qua lời gọi mạng
+    result = await db.execute(insert(models.Order).values(
+        user_id=user_id,
         user_name=payload.customer_name,
         branch_id=payload.branch_id,
-        total_price=total_price,
+        total_price=subtotal,
         status="PENDING",
         customer_name=payload.customer_name,
         customer_phone=payload.customer_phone,
@@ -184,21 +357,30 @@ async def create_order(payload: OrderCreate, db: Session = Depends(get_db)):
         coupon_code=payload.coupon_code,
         discount_amount=0,
         created_at=datetime.utcnow()
-    )
-    db.add(new_order)
-    db.commit()
-    db.refresh(new_order)
-
-    for item in payload.items:
-        db_item = models.OrderItem(
-            order_id=new_order.id,
-            food_id=item.food_id,
-            food_name=item.food_name,
-            image_url=item.image_url,
-            price=item.price,
-            quantity=item.quantity
-        )
-        db.add(db_item)
-    db.commit()
-
-    return { "message": "Order placed", "order_id": new_order.id, "total_price": total_price }
\ No newline at end of file
+    ))
+    order_id = result.inserted_primary_key[0]
+
+    await db.execute(insert(models.OrderItem).values([{"order_id": order_id, **line} for line in lines]))
+    await db.commit()
+
+    total_price = subtotal
+    if payload.coupon_code:
+        # Redeem idempotent theo order_id, 1 lần gọi cho cả đơn, restaurant_service giữ giới hạn lượt dùng.
+        # Lỗi (kể cả request bị hủy giữa chừng) thì bù trừ: trả lại lượt dùng (timeout/5xx vẫn có thể
+        # đã được ghi nhận) rồi bỏ đơn vừa tạo
+        try:
+            coupon = await pricing.redeem_coupon(payload.coupon_code, user, order_id, payload.branch_id)
+            discount_amount = subtotal * coupon["discount_percent"] / 100
+            total_price = subtotal - discount_amount
+            await db.execute(
+                update(models.Order).where(models.Order.id == order_id)
+                .values(discount_amount=discount_amount, total_price=total_price)
+            )
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            await pricing.release_coupon(order_id)
+            await discard_order(db, order_id)
+            raise
+
+    return { "message": "Order placed", "order_id": order_id, "total_price": total_price }
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""Baseline: schema order_db như khi còn tạo bằng Base.metadata.create_all.
+
+DB cũ đã có bảng thì bỏ qua, chỉ ghi nhận revision.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001_baseline"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def create_table(name, *columns, indexes=()):
+    if sa.inspect(op.get_bind()).has_table(name):
+        return
+    op.create_table(name, *columns)
+    for index_name, index_columns, unique in indexes:
+        op.create_index(index_name, name, index_columns, unique=unique)
+
+
+def upgrade():
+    create_table(
+        "orders",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer()),
+        sa.Column("user_name", sa.String(100)),
+        sa.Column("branch_id", sa.Integer()),
+        sa.Column("total_price", sa.Float()),
+        sa.Column("status", sa.String(50)),
+        sa.Column("customer_name", sa.String(100)),
+        sa.Column("customer_phone", sa.String(20)),
+        sa.Column("delivery_address", sa.String(255)),
+        sa.Column("note", sa.String(255), nullable=True),
+        sa.Column("coupon_code", sa.String(50), nullable=True),
+        sa.Column("discount_amount", sa.Float()),
+        sa.Column("created_at", sa.DateTime()),
+        indexes=[("ix_orders_id", ["id"], False), ("ix_orders_user_id", ["user_id"], False)],
+    )
+    create_table(
+        "order_items",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("order_id", sa.Integer(), sa.ForeignKey("orders.id")),
+        sa.Column("food_id", sa.Integer()),
+        sa.Column("food_name", sa.String(100)),
+        sa.Column("image_url", sa.String(500), nullable=True),
+        sa.Column("price", sa.Float()),
+        sa.Column("quantity", sa.Integer()),
+        indexes=[("ix_order_items_id", ["id"], False)],
+    )
+
+
+def downgrade():
+    op.drop_table("order_items")
+    op.drop_table("orders")
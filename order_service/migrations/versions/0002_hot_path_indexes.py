@@ -0,0 +1,39 @@
+"""Composite index cho các truy vấn nóng: GET /orders (lọc branch/user, sắp theo created_at, id) và nạp món theo order_id.
+
+Revision ID: 0002_hot_path_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002_hot_path_indexes"
+down_revision = "0001_baseline"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    # GET /orders?branch_id=...: WHERE branch_id ORDER BY created_at DESC, id DESC (+ điều kiện keyset)
+    ("ix_orders_branch_created", "orders", ["branch_id", "created_at", "id"]),
+    # GET /orders?user_id=...
+    ("ix_orders_user_created", "orders", ["user_id", "created_at", "id"]),
+    # GET /orders không lọc
+    ("ix_orders_created", "orders", ["created_at", "id"]),
+    # Dashboard lọc đơn theo trạng thái trong 1 chi nhánh
+    ("ix_orders_branch_status", "orders", ["branch_id", "status"]),
+    # selectinload(Order.items): WHERE order_id IN (...)
+    ("ix_order_items_order_id", "order_items", ["order_id"]),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in INDEXES:
+        # Bỏ qua index đã tạo tay trên DB trước đó
+        if name not in {index["name"] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,176 @@
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException
+
+from common import auth, tracing
+
+# --- CẤU HÌNH BẢNG GIÁ ---
+RESTAURANT_URL = os.getenv("RESTAURANT_URL", "http://restaurant_service:8002")
+# Làm mới cả bảng giá bằng ETag định kỳ, phòng khi lỡ sự kiện menu_changed
+PRICE_BOOK_REFRESH_SECONDS = float(os.getenv("PRICE_BOOK_REFRESH_SECONDS", 300))
+# Gặp món lạ / giá lệch thì hỏi lại restaurant_service, nhưng không dày hơn mức này
+PRICE_BOOK_MISS_REFRESH_SECONDS = float(os.getenv("PRICE_BOOK_MISS_REFRESH_SECONDS", 2))
+# Sai lệch cho phép giữa giá client gửi và giá bảng giá (làm tròn phía frontend)
+PRICE_TOLERANCE = 1.0
+MENU_EVENTS_TOPIC = "menu_changed"
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def restaurant_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(base_url=RESTAURANT_URL, timeout=5, transport=tracing.httpx_transport())
+    return _client
+
+
+class PriceBook:
+    """food_id -> {name, price, discount, final_price, image_url, branch_id} trong RAM.
+    Nạp từ /foods/snapshot lúc khởi động, cập nhật từng món theo sự kiện menu_changed."""
+
+    def __init__(self):
+        self.foods: Dict[int, dict] = {}
+        self.etag: Optional[str] = None
+        self.refreshed_at = 0.0
+        self.events = 0
+        self.lock: Optional[asyncio.Lock] = None
+
+    async def refresh(self):
+        # Tạo lock trong event loop đang chạy, không tạo lúc import module
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        started = self.refreshed_at
+        async with self.lock:
+            # Trong lúc chờ lock đã có lần làm mới khác xong -> dùng luôn kết quả đó, không tải lại
+            if self.refreshed_at != started:
+                return
+            headers = {"If-None-Match": self.etag} if self.etag else {}
+            res = await restaurant_client().get("/foods/snapshot", headers=headers)
+            self.refreshed_at = time.monotonic()
+            if res.status_code == 304:
+                return
+            res.raise_for_status()
+            self.foods = {food["id"]: food for food in res.json()["foods"]}
+            self.etag = res.headers.get("etag")
+
+    async def try_refresh(self) -> bool:
+        """Làm mới nếu lần trước đã đủ lâu. Lỗi thì giữ bảng giá đang có."""
+        if time.monotonic() - self.refreshed_at < PRICE_BOOK_MISS_REFRESH_SECONDS:
+            return False
+        try:
+            await self.refresh()
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            print(f"⚠️ Price book refresh error: {e}")
+            return False
+        return True
+
+    def apply_event(self, event: dict):
+        if event.get("event") == "FOOD_UPSERTED":
+            food = event["food"]
+            self.foods[food["id"]] = food
+        elif event.get("event") == "FOOD_DELETED":
+            self.foods.pop(event["food_id"], None)
+        else:
+            return
+        self.events += 1
+
+    def _price(self, items, branch_id: int) -> Tuple[List[dict], float, List[int]]:
+        lines, subtotal, stale = [], 0.0, []
+        for item in items:
+            food = self.foods.get(item.food_id)
+            if food is None:
+                raise HTTPException(400, f"Food {item.food_id} not found")
+            if food["branch_id"] != branch_id:
+                raise HTTPException(400, f"Food {item.food_id} does not belong to branch {branch_id}")
+            if item.quantity <= 0:
+                raise HTTPException(400, "Quantity must be positive")
+            price = food["final_price"]
+            if item.price is not None and abs(item.price - price) > PRICE_TOLERANCE:
+                stale.append(item.food_id)
+            lines.append({"food_id": item.food_id, "food_name": food["name"], "image_url": food["image_url"],
+                          "price": price, "quantity": item.quantity})
+            subtotal += price * item.quantity
+        return lines, subtotal, stale
+
+    async def price_items(self, items, branch_id: int) -> Tuple[List[dict], float]:
+        """Tính giá toàn bộ giỏ từ bảng giá trong RAM, không gọi restaurant_service cho từng món.
+        Giá client gửi lệch bảng giá -> 409 để frontend tải lại giỏ."""
+        if any(item.food_id not in self.foods for item in items):
+            await self.try_refresh()
+        try:
+            lines, subtotal, stale = self._price(items, branch_id)
+        except HTTPException:
+            # Món vừa tạo/đổi chi nhánh mà chưa nhận được sự kiện: hỏi lại 1 lần rồi tính lại
+            if not await self.try_refresh():
+                raise
+            lines, subtotal, stale = self._price(items, branch_id)
+        if stale and await self.try_refresh():
+            lines, subtotal, stale = self._price(items, branch_id)
+        if stale:
+            raise HTTPException(409, "Giá món đã thay đổi, vui lòng tải lại giỏ hàng "
+                                     f"(món: {', '.join(map(str, stale))})")
+        return lines, subtotal
+
+    def stats(self) -> dict:
+        return {"foods": len(self.foods), "etag": self.etag, "events": self.events}
+
+
+price_book = PriceBook()
+
+
+async def run_refresher(book: PriceBook, interval: float = PRICE_BOOK_REFRESH_SECONDS):
+    # Lần nạp đầu đã làm trong lifespan
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await book.refresh()
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            print(f"⚠️ Price book refresh error: {e}")
+
+
+# --- COUPON (restaurant_service giữ bộ đếm lượt dùng) ---
+def _error_detail(res: httpx.Response) -> str:
+    # 404/409 có thể đến từ proxy/gateway với body không phải JSON
+    try:
+        body = res.json()
+    except ValueError:
+        return res.text
+    if isinstance(body, dict) and body.get("detail"):
+        return str(body["detail"])
+    return res.text
+
+
+async def redeem_coupon(code: str, identity: dict, order_id: int, branch_id: int) -> dict:
+    """Ghi nhận 1 lượt dùng mã cho đơn. Gọi lại cùng order_id không bị tính 2 lần.
+    User gửi đi là danh tính đã ký (identity), restaurant_service dùng nó cho giới hạn lượt/user."""
+    try:
+        res = await restaurant_client().post("/coupons/redeem", headers=auth.service_headers(identity), json={
+            "code": code, "order_id": order_id, "branch_id": branch_id,
+        })
+    except httpx.HTTPError:
+        raise HTTPException(503, "Coupon service unavailable")
+    if res.status_code in (404, 409):
+        raise HTTPException(400, f"Mã giảm giá không dùng được: {_error_detail(res)}")
+    if res.status_code != 200:
+        raise HTTPException(503, "Coupon service unavailable")
+    return res.json()
+
+
+async def release_coupon(order_id: int):
+    """Trả lại lượt dùng mã (đơn hủy / tạo đơn lỗi). Lỗi chỉ log, không chặn luồng chính."""
+    try:
+        res = await restaurant_client().delete(f"/coupons/redeem/{order_id}", headers=auth.service_headers())
+        res.raise_for_status()
+    except httpx.HTTPError as e:
+        print(f"⚠️ Không trả lại được coupon của đơn #{order_id}: {e}")
+
+
+async def aclose():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
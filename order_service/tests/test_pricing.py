@@ -0,0 +1,37 @@
+import asyncio
+
+import httpx
+
+import pricing
+from pricing import PriceBook
+
+SNAPSHOT = {"version": "v1", "foods": [{"id": 1, "name": "Phở Bò", "price": 50000, "discount": 0,
+                                        "final_price": 50000, "image_url": None, "branch_id": 1}]}
+
+
+def test_concurrent_refreshes_fetch_once(monkeypatch):
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        # Giữ request lâu 1 chút để các lần refresh khác phải chờ lock
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json=SNAPSHOT, headers={"etag": '"v1"'})
+
+    async def run():
+        client = httpx.AsyncClient(base_url="http://restaurant", transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(pricing, "_client", client)
+        book = PriceBook()
+        try:
+            # Vòng làm mới định kỳ, cache miss và consumer cùng gọi 1 lúc
+            await asyncio.gather(*(book.refresh() for _ in range(10)))
+            await book.refresh()
+        finally:
+            await client.aclose()
+        return book
+
+    book = asyncio.run(run())
+
+    assert len(calls) == 2
+    assert calls[1].headers["if-none-match"] == '"v1"'
+    assert 1 in book.foods
@@ -1,9 +1,12 @@
 import json
 from fastapi import FastAPI, Depends, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import SessionLocal, engine, Base
+from database import AsyncSessionLocal, SessionLocal, engine, async_engine, run_migrations, warm_up, warm_up_async
 import models
+from common import metrics
+from common import tracing
 from pydantic import BaseModel
 from typing import List, Optional
 import uuid
@@ -11,7 +14,7 @@ from contextlib import asynccontextmanager
 from aiokafka import AIOKafkaProducer
 
 # Tạo bảng
-Base.metadata.create_all(bind=engine)
+run_migrations()
 
 # --- CẤU HÌNH KAFKA ---
 KAFKA_TOPIC = "order_paid"
@@ -23,12 +26,16 @@ producer = None
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global producer
+    # Mở sẵn kết nối DB trước khi nhận request
+    warm_up()
+    await warm_up_async()
     print("🚀 Payment Service: Đang khởi động Kafka Producer...")
     producer = AIOKafkaProducer(bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS)
     await producer.start()
     print("✅ Kafka Producer: Đã kết nối!")
     yield
     await producer.stop()
+    await async_engine.dispose()
     print("🛑 Kafka Producer: Đã ngắt kết nối")
 
 app = FastAPI(lifespan=lifespan)
@@ -41,6 +48,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- METRICS (/metrics) ---
+metrics.instrument(app, engines=[engine, async_engine])
+
+# --- TRACING (traceparent W3C) ---
+tracing.instrument(app, "payment_service")
+
 def get_db():
     db = SessionLocal()
     try:
@@ -48,6 +61,10 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 # --- MODELS ---
 class PaymentRequest(BaseModel):
     order_id: int
@@ -68,7 +85,7 @@ class CardResponse(CardCreate):
 
 # --- API THANH TOÁN (GỬI KAFKA) ---
 @app.post("/pay")
-async def process_payment(payload: PaymentRequest, db: Session = Depends(get_db)):
+async def process_payment(payload: PaymentRequest, db: AsyncSession = Depends(get_async_db)):
     print(f"💰 Payment Service: Nhận yêu cầu thanh toán đơn #{payload.order_id}")
 
     # 1. Lưu giao dịch vào DB Payment
@@ -80,7 +97,7 @@ async def process_payment(payload: PaymentRequest, db: Session = Depends(get_db)
         status="SUCCESS"
     )
     db.add(new_payment)
-    db.commit()
+    await db.commit()
     
     # 2. BẮN TIN NHẮN VÀO KAFKA (Thay vì gọi HTTP)
     message = {
@@ -93,8 +110,9 @@ async def process_payment(payload: PaymentRequest, db: Session = Depends(get_db)
     try:
         # Chuyển dict thành JSON bytes
         json_message = json.dumps(message).encode("utf-8")
-        # Gửi và chờ xác nhận từ Kafka Broker
-        await producer.send_and_wait(KAFKA_TOPIC, json_message)
+        # Gửi và chờ xác nhận từ Kafka Broker, kèm traceparent trong header để consumer nối tiếp trace
+        with tracing.start_span(f"{KAFKA_TOPIC} send", "producer", topic=KAFKA_TOPIC):
+            await producer.send_and_wait(KAFKA_TOPIC, json_message, headers=tracing.kafka_headers())
         print(f"📨 Payment Service: Đã bắn tin nhắn vào Kafka -> {message}")
     except Exception as e:
         print(f"❌ Kafka Error: {e}")
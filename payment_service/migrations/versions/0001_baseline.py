@@ -0,0 +1,51 @@
+"""Baseline: schema payment_db như khi còn tạo bằng Base.metadata.create_all.
+
+DB cũ đã có bảng thì bỏ qua, chỉ ghi nhận revision.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001_baseline"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def create_table(name, *columns, indexes=()):
+    if sa.inspect(op.get_bind()).has_table(name):
+        return
+    op.create_table(name, *columns)
+    for index_name, index_columns, unique in indexes:
+        op.create_index(index_name, name, index_columns, unique=unique)
+
+
+def upgrade():
+    create_table(
+        "payments",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("order_id", sa.Integer()),
+        sa.Column("amount", sa.Float()),
+        sa.Column("transaction_id", sa.String(100), unique=True),
+        sa.Column("status", sa.String(50)),
+        sa.Column("created_at", sa.DateTime()),
+        indexes=[("ix_payments_id", ["id"], False), ("ix_payments_order_id", ["order_id"], False)],
+    )
+    create_table(
+        "payment_methods",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer()),
+        sa.Column("card_number", sa.String(20)),
+        sa.Column("card_holder", sa.String(100)),
+        sa.Column("expiry_date", sa.String(10)),
+        sa.Column("bank_name", sa.String(50)),
+        indexes=[("ix_payment_methods_id", ["id"], False), ("ix_payment_methods_user_id", ["user_id"], False)],
+    )
+
+
+def downgrade():
+    op.drop_table("payment_methods")
+    op.drop_table("payments")
@@ -0,0 +1,114 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import select
+
+import models
+
+# --- CẤU HÌNH CACHE COUPON ---
+COUPON_CACHE_TTL = float(os.getenv("COUPON_CACHE_TTL", 300))
+# Mã không tồn tại/hết hạn: cache ngắn để gõ sai liên tục không dội xuống MySQL
+COUPON_NEGATIVE_TTL = float(os.getenv("COUPON_NEGATIVE_TTL", 30))
+COUPON_CACHE_MAX_ENTRIES = int(os.getenv("COUPON_CACHE_MAX_ENTRIES", 10000))
+# Số coupon còn hiệu lực nạp sẵn lúc khởi động
+COUPON_PRELOAD_LIMIT = int(os.getenv("COUPON_PRELOAD_LIMIT", 1000))
+BATCH_MAX_CODES = 100
+
+COUPON_FIELDS = ("id", "code", "discount_percent", "branch_id", "start_date", "end_date", "is_active",
+                 "max_uses", "per_user_limit")
+
+
+def valid_coupon_filter(now: datetime):
+    # Cùng điều kiện với check_coupon trước đây
+    return (models.Coupon.is_active == True, models.Coupon.end_date > now)  # noqa: E712
+
+
+class CouponCache:
+    """code -> coupon (dict) hoặc None (negative), LRU. TTL của entry dương không vượt quá end_date."""
+
+    def __init__(self, maxsize: int = COUPON_CACHE_MAX_ENTRIES):
+        self.maxsize = maxsize
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+
+    def _put(self, code: str, coupon: Optional[dict]):
+        if coupon is None:
+            ttl = COUPON_NEGATIVE_TTL
+        else:
+            ttl = min(COUPON_CACHE_TTL, (coupon["end_date"] - datetime.utcnow()).total_seconds())
+        if ttl <= 0:
+            return
+        self.entries[code] = (coupon, time.monotonic() + ttl)
+        self.entries.move_to_end(code)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def _get(self, code: str):
+        """(True, coupon|None) nếu có trong cache và còn hạn, ngược lại (False, None)."""
+        entry = self.entries.get(code)
+        if entry is None:
+            return False, None
+        coupon, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self.entries[code]
+            return False, None
+        self.entries.move_to_end(code)
+        self.hits += 1
+        if coupon is None:
+            self.negative_hits += 1
+        return True, coupon
+
+    async def _load(self, db, codes: Iterable[str]) -> Dict[str, dict]:
+        rows = await db.execute(
+            select(models.Coupon).where(models.Coupon.code.in_(list(codes)), *valid_coupon_filter(datetime.utcnow()))
+            .order_by(models.Coupon.id)
+        )
+        found = {}
+        for coupon in rows.scalars():
+            # Trùng code thì lấy bản ghi đầu tiên như .first() trước đây
+            found.setdefault(coupon.code, {name: getattr(coupon, name) for name in COUPON_FIELDS})
+        return found
+
+    async def get_many(self, db, codes: Iterable[str]) -> Dict[str, Optional[dict]]:
+        """Tra nhiều mã, các mã chưa có trong cache gom vào 1 câu SELECT ... IN."""
+        result, missing = {}, []
+        for code in dict.fromkeys(codes):
+            cached, coupon = self._get(code)
+            if cached:
+                result[code] = coupon
+            else:
+                missing.append(code)
+        if missing:
+            self.misses += len(missing)
+            found = await self._load(db, missing)
+            for code in missing:
+                result[code] = found.get(code)
+                self._put(code, result[code])
+        return result
+
+    async def get(self, db, code: str) -> Optional[dict]:
+        return (await self.get_many(db, [code]))[code]
+
+    async def preload(self, db, limit: int = COUPON_PRELOAD_LIMIT):
+        rows = await db.execute(
+            select(models.Coupon).where(*valid_coupon_filter(datetime.utcnow()))
+            .order_by(models.Coupon.id).limit(limit)
+        )
+        for coupon in rows.scalars():
+            if coupon.code not in self.entries:
+                self._put(coupon.code, {name: getattr(coupon, name) for name in COUPON_FIELDS})
+
+    def invalidate(self, code: str):
+        self.entries.pop(code, None)
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "hits": self.hits, "negative_hits": self.negative_hits,
+                "misses": self.misses}
+
+
+coupon_cache = CouponCache()
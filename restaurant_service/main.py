@@ -1,24 +1,68 @@
+import asyncio
 import httpx
 import shutil
 import os
 import uuid
 from datetime import datetime
 from typing import List, Optional
-from collections import defaultdict
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Depends, HTTPException, Request, File, UploadFile, Form, Query
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, File, UploadFile, Form, Query
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
-from database import SessionLocal, engine, Base
+from database import AsyncSessionLocal, SessionLocal, engine, async_engine, run_migrations, warm_up, warm_up_async
 import models
+from common import metrics
+from common import tracing
+from common import auth
+from search import OPTIONS_SORTS, SEARCH_INDEX_REFRESH_SECONDS, food_index, food_options, normalize
+from coupons import BATCH_MAX_CODES, coupon_cache, valid_coupon_filter
+from menu import menu_events, menu_snapshot
+import reviews
 
 # 1. TẠO BẢNG DỮ LIỆU (Nếu chưa có)
-Base.metadata.create_all(bind=engine)
+run_migrations()
 
-app = FastAPI()
+async def rebuild_search_index():
+    async with AsyncSessionLocal() as db:
+        await food_index.rebuild(db)
+    print(f"🔎 Search index: {food_index.stats()}")
+
+async def refresh_search_index():
+    while True:
+        await asyncio.sleep(SEARCH_INDEX_REFRESH_SECONDS)
+        try:
+            await rebuild_search_index()
+        except Exception as e:
+            print(f"⚠️ Search index refresh error: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Mở sẵn kết nối DB trước khi nhận request
+    warm_up()
+    await warm_up_async()
+    # Dựng chỉ mục tìm kiếm món trước khi nhận request, sau đó làm mới định kỳ
+    await rebuild_search_index()
+    refresher = asyncio.create_task(refresh_search_index())
+    # Nạp sẵn các coupon đang còn hiệu lực vào cache
+    async with AsyncSessionLocal() as db:
+        await coupon_cache.preload(db)
+    # Producer sự kiện menu_changed (order_service nghe để cập nhật bảng giá)
+    await menu_events.start()
+    yield
+    refresher.cancel()
+    await menu_events.stop()
+    await auth.aclose()
+    await reviews.aclose()
+    await async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
 
 # 2. CẤU HÌNH CORS (Để Frontend React gọi được API)
 app.add_middleware(
@@ -29,6 +73,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- METRICS (/metrics) ---
+metrics.instrument(app, engines=[engine, async_engine])
+
+# --- TRACING (traceparent W3C) ---
+tracing.instrument(app, "restaurant_service")
+
 # 3. CẤU HÌNH THƯ MỤC CHỨA ẢNH UPLOAD
 os.makedirs("static", exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -41,20 +91,16 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 async def verify_user(request: Request):
-    token = request.headers.get("Authorization")
-    if not token: 
-        raise HTTPException(401, "Missing Token")
-    
     try:
-        async with httpx.AsyncClient() as client:
-            # Gọi sang User Service để check token
-            # Đảm bảo 'user_service' là tên container hoặc localhost:8001 tùy môi trường của bạn
-            service_url = "http://user_service:8001/verify" 
-            res = await client.get(service_url, headers={"Authorization": token})
-            if res.status_code != 200: 
-                raise HTTPException(401, "Invalid Token from Auth Service")
-            return res.json()
+        # Dùng danh tính gateway đã ký; không có thì giải mã JWT tại chỗ (có cache)
+        return await auth.get_identity(request)
+    except HTTPException:
+        raise
     except httpx.RequestError:
         print("⚠️ Dev Mode: User Service Unavailable (Bypass Auth)")
         # Trả về user giả để test khi không chạy User Service
@@ -75,6 +121,26 @@ class CouponCreate(BaseModel):
     start_date: datetime
     end_date: datetime
     is_active: bool = True
+    max_uses: Optional[int] = None
+    per_user_limit: Optional[int] = None
+
+class ReviewItem(BaseModel):
+    food_id: int
+    score: int
+
+class ReviewCreate(BaseModel):
+    order_id: int
+    rating_general: int
+    comment: Optional[str] = None
+    items: List[ReviewItem] = []
+
+class CouponBatchCheck(BaseModel):
+    codes: List[str]
+
+class CouponRedeem(BaseModel):
+    code: str
+    order_id: int
+    branch_id: Optional[int] = None
 
 class FoodSearchResponse(BaseModel):
     name: str
@@ -89,11 +155,10 @@ class FoodSearchResponse(BaseModel):
 # API CHI NHÁNH (BRANCH)
 # ==========================================
 @app.post("/branches")
-async def create_branch(branch: BranchCreate, db: Session = Depends(get_db)):
+async def create_branch(branch: BranchCreate, db: AsyncSession = Depends(get_async_db)):
     new_branch = models.Branch(name=branch.name, address=branch.address, phone=branch.phone)
     db.add(new_branch)
-    db.commit()
-    db.refresh(new_branch)
+    await db.commit()
     return new_branch
 
 @app.get("/branches")
@@ -110,15 +175,17 @@ def get_branch_detail(branch_id: int, db: Session = Depends(get_db)):
 # API COUPON (MÃ GIẢM GIÁ)
 # ==========================================
 @app.post("/coupons")
-async def create_coupon(coupon: CouponCreate, db: Session = Depends(get_db)):
+async def create_coupon(coupon: CouponCreate, db: AsyncSession = Depends(get_async_db)):
     new_coupon = models.Coupon(
         code=coupon.code, discount_percent=coupon.discount_percent,
         branch_id=coupon.branch_id, start_date=coupon.start_date,
-        end_date=coupon.end_date, is_active=coupon.is_active
+        end_date=coupon.end_date, is_active=coupon.is_active,
+        max_uses=coupon.max_uses, per_user_limit=coupon.per_user_limit, used_count=0
     )
     db.add(new_coupon)
-    db.commit()
-    db.refresh(new_coupon)
+    await db.commit()
+    # Xóa entry cũ (thường là negative "mã không tồn tại") để mã mới dùng được ngay
+    coupon_cache.invalidate(new_coupon.code)
     return new_coupon
 
 @app.get("/coupons")
@@ -130,70 +197,172 @@ def get_coupons(branch_id: Optional[int] = None, db: Session = Depends(get_db)):
     return query.all()
 
 @app.get("/coupons/check/{code}")
-def check_coupon(code: str, db: Session = Depends(get_db)):
-    now = datetime.utcnow()
-    coupon = db.query(models.Coupon).filter(
-        models.Coupon.code == code, models.Coupon.is_active == True, models.Coupon.end_date > now
-    ).first()
+async def check_coupon(code: str, db: AsyncSession = Depends(get_async_db)):
+    # Cache trong RAM (cả mã sai), chỉ xuống DB khi mã chưa có trong cache hoặc đã hết TTL
+    coupon = await coupon_cache.get(db, code)
     if not coupon: raise HTTPException(404, "Coupon invalid")
     return coupon
 
+@app.post("/coupons/check")
+async def check_coupons(payload: CouponBatchCheck, db: AsyncSession = Depends(get_async_db)):
+    """Kiểm tra nhiều mã trong 1 lần gọi: {code: coupon hoặc null nếu không hợp lệ}."""
+    if len(payload.codes) > BATCH_MAX_CODES:
+        raise HTTPException(400, f"At most {BATCH_MAX_CODES} codes per request")
+    return await coupon_cache.get_many(db, payload.codes)
+
+async def _redemption_for_order(db: AsyncSession, order_id: int, code: str):
+    row = (await db.execute(
+        select(models.CouponUsage, models.Coupon).join(models.Coupon)
+        .where(models.CouponUsage.order_id == order_id)
+    )).first()
+    if row is None:
+        return None
+    usage, coupon = row
+    if coupon.code != code:
+        raise HTTPException(409, "Order already redeemed another coupon")
+    return {"message": "Coupon already redeemed", "order_id": order_id, "coupon_id": coupon.id,
+            "code": coupon.code, "discount_percent": coupon.discount_percent}
+
+def require_service(request: Request):
+    # API nội bộ: docker-compose mở cổng 8002 ra ngoài nên không thể chỉ dựa vào mạng nội bộ
+    if not auth.is_service_request(request.headers):
+        raise HTTPException(403, "Internal API")
+
+@app.post("/coupons/redeem")
+async def redeem_coupon(payload: CouponRedeem, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Ghi nhận 1 lượt dùng mã cho đơn hàng (gọi nội bộ lúc checkout). Idempotent theo order_id.
+    User lấy từ header danh tính đã ký (order_service chuyển tiếp), không lấy từ body."""
+    require_service(request)
+    identity = auth.identity_from_headers(request.headers)
+    if identity is None:
+        raise HTTPException(401, "Missing user identity")
+    user_id = identity["id"]
+    coupon = await coupon_cache.get(db, payload.code)
+    if not coupon or (payload.branch_id and coupon["branch_id"] != payload.branch_id):
+        # Mã có thể đã hết hạn sau lần redeem trước của chính đơn này -> vẫn trả kết quả cũ
+        replay = await _redemption_for_order(db, payload.order_id, payload.code)
+        if replay: return replay
+        raise HTTPException(404, "Coupon invalid")
+
+    # Cả 3 bước nằm trong 1 transaction, không bước nào đọc-rồi-ghi nên không cần khóa bi quan:
+    # 1. INSERT coupon_usages (order_id unique) -> đơn đã redeem thì IntegrityError, trả kết quả cũ
+    # 2. Bộ đếm theo user: UPDATE ... WHERE used_count < per_user_limit
+    # 3. Bộ đếm của mã: UPDATE ... WHERE used_count < max_uses. Dòng coupon là hot row nên để cuối,
+    #    khóa dòng chỉ giữ từ đây tới COMMIT
+    now = datetime.utcnow()
+    try:
+        await db.execute(insert(models.CouponUsage).values(
+            coupon_id=coupon["id"], user_id=user_id, order_id=payload.order_id, used_at=now
+        ))
+        if coupon["per_user_limit"] is not None:
+            await db.execute(insert(models.CouponUserCounter).prefix_with("IGNORE").values(
+                coupon_id=coupon["id"], user_id=user_id, used_count=0
+            ))
+            result = await db.execute(
+                update(models.CouponUserCounter)
+                .where(models.CouponUserCounter.coupon_id == coupon["id"],
+                       models.CouponUserCounter.user_id == user_id,
+                       models.CouponUserCounter.used_count < coupon["per_user_limit"])
+                .values(used_count=models.CouponUserCounter.used_count + 1)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 0:
+                await db.rollback()
+                raise HTTPException(409, "Coupon usage limit per user reached")
+        result = await db.execute(
+            update(models.Coupon)
+            .where(models.Coupon.id == coupon["id"], *valid_coupon_filter(now),
+                   or_(models.Coupon.max_uses.is_(None), models.Coupon.used_count < models.Coupon.max_uses))
+            .values(used_count=models.Coupon.used_count + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            await db.rollback()
+            # Hết lượt hoặc vừa bị tắt: bỏ entry trong cache để /coupons/check báo đúng sau TTL âm
+            coupon_cache.invalidate(payload.code)
+            raise HTTPException(409, "Coupon fully redeemed")
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        replay = await _redemption_for_order(db, payload.order_id, payload.code)
+        if replay: return replay
+        raise
+
+    return {"message": "Coupon redeemed", "order_id": payload.order_id, "coupon_id": coupon["id"],
+            "code": payload.code, "discount_percent": coupon["discount_percent"]}
+
+@app.delete("/coupons/redeem/{order_id}")
+async def release_coupon(order_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Trả lại lượt dùng khi đơn bị hủy / checkout thất bại. Gọi lặp lại không sao."""
+    require_service(request)
+    usage = (await db.execute(
+        select(models.CouponUsage).where(models.CouponUsage.order_id == order_id).with_for_update()
+    )).scalar_one_or_none()
+    if usage is None:
+        return {"message": "Nothing to release"}
+
+    await db.execute(delete(models.CouponUsage).where(models.CouponUsage.id == usage.id))
+    await db.execute(
+        update(models.CouponUserCounter)
+        .where(models.CouponUserCounter.coupon_id == usage.coupon_id,
+               models.CouponUserCounter.user_id == usage.user_id,
+               models.CouponUserCounter.used_count > 0)
+        .values(used_count=models.CouponUserCounter.used_count - 1)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        update(models.Coupon)
+        .where(models.Coupon.id == usage.coupon_id, models.Coupon.used_count > 0)
+        .values(used_count=models.Coupon.used_count - 1)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return {"message": "Coupon released", "order_id": order_id}
+
 # ==========================================
 # API TÌM KIẾM & OPTIONS (DÀNH CHO KHÁCH HÀNG - SHOP.JSX)
 # ==========================================
 
+SEARCH_PAGE_DEFAULT = 50
+SEARCH_PAGE_MAX = 200
+
 @app.get("/foods/search", response_model=List[FoodSearchResponse])
-def search_food(q: Optional[str] = Query(None), db: Session = Depends(get_db)):
-    """Tìm kiếm và gom nhóm món ăn theo tên để hiển thị min/max price"""
-    query = db.query(models.Food)
-    if q and q.strip() != "":
-        query = query.filter(models.Food.name.ilike(f"%{q}%"))
-    
-    raw_foods = query.all()
-    grouped = defaultdict(list)
-    for food in raw_foods:
-        grouped[food.name].append(food)
-
-    results = []
-    for name, items in grouped.items():
-        prices = [f.price for f in items]
-        image = next((f.image_url for f in items if f.image_url), None)
-        min_p = min(prices) if prices else 0
-        max_p = max(prices) if prices else 0
-        branch_cnt = len(set(f.branch_id for f in items))
-        
-        results.append(FoodSearchResponse(
-            name=name,
-            image_url=image,
-            min_price=min_p,
-            max_price=max_p,
-            branch_count=branch_cnt
-        ))
+async def search_food(
+    response: Response, q: Optional[str] = Query(None),
+    limit: int = Query(SEARCH_PAGE_DEFAULT, ge=1), offset: int = Query(0, ge=0)
+):
+    """Tìm món theo tiền tố từ, không phân biệt dấu ("pho bo" khớp "Phở Bò"), gom theo tên,
+    xếp theo độ khớp rồi điểm đánh giá. Tổng số món khớp nằm ở header X-Total-Count."""
+    # Tra chỉ mục trong RAM (không đụng DB), chạy trên event loop cùng các lần cập nhật chỉ mục
+    total, results = food_index.search(q, min(limit, SEARCH_PAGE_MAX), offset)
+    response.headers["X-Total-Count"] = str(total)
     return results
 
 @app.get("/foods/options")
-def get_food_options(name: str = Query(...), db: Session = Depends(get_db)):
-    """Lấy danh sách các quán bán món này (cho Modal chọn quán)"""
-    foods = db.query(models.Food).filter(models.Food.name == name).all()
-    options = []
-    for f in foods:
-        branch_name = f.branch.name if f.branch else "Chi nhánh ẩn"
-        options.append({
-            "food_id": f.id,
-            "branch_id": f.branch_id,
-            "branch_name": branch_name,
-            "image_url": f.image_url,
-            "final_price": f.price * (1 - f.discount/100) if f.discount else f.price,
-            "original_price": f.price,
-            "discount": f.discount
-        })
-    return options
+async def get_food_options(
+    name: str = Query(...), sort: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=SEARCH_PAGE_MAX), offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Lấy danh sách các quán bán món này (cho Modal chọn quán). sort=price|-price theo giá sau giảm."""
+    if sort is not None and sort not in OPTIONS_SORTS:
+        raise HTTPException(400, "sort must be 'price' or '-price'")
+    return await food_options(db, name, sort, limit, offset)
 
 # ==========================================
 # API QUẢN LÝ MÓN ĂN (DÀNH CHO CHỦ QUÁN - DASHBOARD)
 # ==========================================
 
 # 1. API Lấy danh sách món (Đã sửa lỗi 405 Method Not Allowed)
+@app.get("/foods/snapshot")
+async def get_menu_snapshot(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Toàn bộ món (giá, giảm giá, tên, ảnh) cho dịch vụ khác cache lại. Gửi If-None-Match = ETag
+    lần trước, thực đơn chưa đổi thì nhận 304 không có body."""
+    etag, body = await menu_snapshot.get(db)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
 @app.get("/foods")
 def get_foods(branch_id: Optional[int] = Query(None), db: Session = Depends(get_db)):
     query = db.query(models.Food)
@@ -213,7 +382,7 @@ def get_food_detail(food_id: int, db: Session = Depends(get_db)):
 async def create_food(
     request: Request, name: str = Form(...), price: float = Form(...),
     discount: int = Form(0), branch_id: int = Form(...),
-    image: Optional[UploadFile] = File(None), db: Session = Depends(get_db)
+    image: Optional[UploadFile] = File(None), db: AsyncSession = Depends(get_async_db)
 ):
     user = await verify_user(request)
     if user.get('role') != 'seller': raise HTTPException(403, "Forbidden")
@@ -231,8 +400,10 @@ async def create_food(
         discount=discount, image_url=image_url
     )
     db.add(new_food)
-    db.commit()
-    db.refresh(new_food)
+    await db.commit()
+    food_index.upsert_food(new_food)
+    menu_snapshot.invalidate()
+    await menu_events.food_changed(new_food)
     return new_food
 
 # 4. Cập nhật món (Thêm vào cho đầy đủ, phòng khi cần dùng)
@@ -240,10 +411,10 @@ async def create_food(
 async def update_food(
     food_id: int, request: Request, name: str = Form(...),
     price: float = Form(...), discount: int = Form(0),
-    image: Optional[UploadFile] = File(None), db: Session = Depends(get_db)
+    image: Optional[UploadFile] = File(None), db: AsyncSession = Depends(get_async_db)
 ):
     await verify_user(request)
-    food = db.query(models.Food).filter(models.Food.id == food_id).first()
+    food = await db.get(models.Food, food_id)
     if not food: raise HTTPException(404, "Not found")
     
     food.name = name
@@ -257,15 +428,57 @@ async def update_food(
         with open(fpath, "wb") as buffer: shutil.copyfileobj(image.file, buffer)
         food.image_url = f"/static/{fname}"
     
-    db.commit()
+    await db.commit()
+    food_index.upsert_food(food)
+    menu_snapshot.invalidate()
+    await menu_events.food_changed(food)
     return food
 
 # 5. Xóa món
 @app.delete("/foods/{food_id}")
-async def delete_food(food_id: int, request: Request, db: Session = Depends(get_db)):
+async def delete_food(food_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
     await verify_user(request)
-    item = db.query(models.Food).filter(models.Food.id == food_id).first()
+    item = await db.get(models.Food, food_id)
     if not item: raise HTTPException(404, "Not found")
-    db.delete(item)
-    db.commit()
-    return {"message": "Deleted"}
\ No newline at end of file
+    await db.delete(item)
+    await db.commit()
+    food_index.remove_food(food_id)
+    menu_snapshot.invalidate()
+    await menu_events.food_deleted(food_id)
+    return {"message": "Deleted"}
+
+# ==========================================
+# API ĐÁNH GIÁ (REVIEW) - KHÁCH HÀNG CHẤM ĐIỂM MÓN SAU KHI NHẬN ĐƠN
+# ==========================================
+@app.post("/reviews")
+async def create_review(payload: ReviewCreate, request: Request, db: AsyncSession = Depends(get_async_db)):
+    user = await verify_user(request)
+    scores = [item for item in payload.items if 1 <= item.score <= 5]
+    if not 1 <= payload.rating_general <= 5 or len(scores) != len(payload.items):
+        raise HTTPException(400, "Score must be between 1 and 5")
+
+    food_ids = [item.food_id for item in payload.items]
+    # Chỉ chủ đơn được đánh giá, đơn phải hoàn tất và món phải nằm trong đơn (điểm này đi vào xếp hạng tìm kiếm)
+    reviews.check_reviewable(await reviews.fetch_order(payload.order_id), user.get("id"), food_ids)
+    branch_id = None
+    if food_ids:
+        branch_id = (await db.execute(
+            select(models.Food.branch_id).where(models.Food.id.in_(food_ids)).limit(1)
+        )).scalar()
+
+    review = models.OrderReview(
+        user_id=user.get("id"), user_name=user.get("name") or user.get("sub"),
+        order_id=payload.order_id, branch_id=branch_id,
+        rating_general=payload.rating_general, comment=payload.comment,
+        details=[models.FoodRating(food_id=item.food_id, score=item.score) for item in payload.items],
+    )
+    db.add(review)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # order_id là unique: mỗi đơn chỉ đánh giá 1 lần
+        raise HTTPException(409, "Order already reviewed")
+
+    for item in payload.items:
+        food_index.add_rating(item.food_id, item.score)
+    return {"message": "Review created", "review_id": review.id}
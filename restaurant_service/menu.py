@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import time
+from typing import Optional, Tuple
+
+from aiokafka import AIOKafkaProducer
+from sqlalchemy import select
+
+import models
+from common import tracing
+
+# --- CẤU HÌNH SNAPSHOT THỰC ĐƠN ---
+# Snapshot giá/tên món cho các dịch vụ khác (cart_service) tự cache; build lại tối đa mỗi TTL giây
+# (sửa món trên chính replica này thì build lại ngay)
+MENU_SNAPSHOT_TTL = float(os.getenv("MENU_SNAPSHOT_TTL", 30))
+# Sự kiện thêm/sửa/xóa món để order_service cập nhật bảng giá ngay, không chờ lần làm mới định kỳ
+KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092")
+MENU_EVENTS_TOPIC = "menu_changed"
+
+
+def final_price(price: Optional[float], discount: Optional[int]) -> float:
+    # Cùng công thức với final_price của /foods/options
+    price = price or 0
+    return price * (100 - discount) / 100 if discount and discount > 0 else price
+
+
+def food_entry(food) -> dict:
+    """1 món trong snapshot và trong sự kiện menu_changed (order_service dùng để tính giá)."""
+    return {"id": food.id, "name": food.name, "price": food.price or 0, "discount": food.discount or 0,
+            "final_price": final_price(food.price, food.discount), "image_url": food.image_url,
+            "branch_id": food.branch_id}
+
+
+class MenuSnapshot:
+    """JSON đã serialize sẵn của toàn bộ món + ETag = hash nội dung, nên mọi replica cho cùng
+    1 thực đơn trả cùng ETag và client chỉ tải lại khi thực đơn thật sự đổi."""
+
+    def __init__(self):
+        self.body: Optional[bytes] = None
+        self.etag: Optional[str] = None
+        self.expires_at = 0.0
+
+    async def get(self, db) -> Tuple[str, bytes]:
+        if self.body is None or self.expires_at <= time.monotonic():
+            foods = (await db.execute(select(models.Food).order_by(models.Food.id))).scalars().all()
+            payload = [food_entry(food) for food in foods]
+            content = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            version = hashlib.sha1(content).hexdigest()[:16]
+            self.etag = f'"{version}"'
+            self.body = b'{"version":"' + version.encode() + b'","foods":' + content + b"}"
+            self.expires_at = time.monotonic() + MENU_SNAPSHOT_TTL
+        return self.etag, self.body
+
+    def invalidate(self):
+        self.expires_at = 0.0
+
+
+menu_snapshot = MenuSnapshot()
+
+
+class MenuEvents:
+    """Producer cho topic menu_changed. Kafka lỗi thì chỉ log: bên nhận vẫn tự làm mới theo ETag định kỳ."""
+
+    def __init__(self):
+        self.producer: Optional[AIOKafkaProducer] = None
+
+    async def start(self):
+        producer = AIOKafkaProducer(bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS)
+        try:
+            await producer.start()
+        except Exception as e:
+            print(f"⚠️ Menu events: không kết nối được Kafka ({e}), bỏ qua sự kiện menu_changed")
+            return
+        self.producer = producer
+
+    async def publish(self, event: dict):
+        if self.producer is None:
+            return
+        try:
+            with tracing.start_span(f"{MENU_EVENTS_TOPIC} send", "producer", topic=MENU_EVENTS_TOPIC):
+                await self.producer.send_and_wait(
+                    MENU_EVENTS_TOPIC, json.dumps(event).encode("utf-8"), headers=tracing.kafka_headers()
+                )
+        except Exception as e:
+            print(f"❌ Menu events Kafka error: {e}")
+
+    async def food_changed(self, food):
+        await self.publish({"event": "FOOD_UPSERTED", "food": food_entry(food)})
+
+    async def food_deleted(self, food_id: int):
+        await self.publish({"event": "FOOD_DELETED", "food_id": food_id})
+
+    async def stop(self):
+        if self.producer is not None:
+            await self.producer.stop()
+
+
+menu_events = MenuEvents()
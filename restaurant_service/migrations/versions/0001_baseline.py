@@ -0,0 +1,96 @@
+"""Baseline: schema restaurant_db như khi còn tạo bằng Base.metadata.create_all.
+
+DB cũ đã có bảng thì bỏ qua, chỉ ghi nhận revision.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001_baseline"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def create_table(name, *columns, indexes=()):
+    if sa.inspect(op.get_bind()).has_table(name):
+        return
+    op.create_table(name, *columns)
+    for index_name, index_columns, unique in indexes:
+        op.create_index(index_name, name, index_columns, unique=unique)
+
+
+def upgrade():
+    create_table(
+        "branches",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(100)),
+        sa.Column("address", sa.String(200)),
+        sa.Column("phone", sa.String(20)),
+        indexes=[("ix_branches_id", ["id"], False), ("ix_branches_name", ["name"], False)],
+    )
+    create_table(
+        "foods",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(100)),
+        sa.Column("price", sa.Float()),
+        sa.Column("discount", sa.Integer()),
+        sa.Column("image_url", sa.String(500), nullable=True),
+        sa.Column("branch_id", sa.Integer(), sa.ForeignKey("branches.id")),
+        indexes=[("ix_foods_id", ["id"], False), ("ix_foods_name", ["name"], False)],
+    )
+    create_table(
+        "coupons",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("code", sa.String(50)),
+        sa.Column("discount_percent", sa.Integer()),
+        sa.Column("branch_id", sa.Integer(), sa.ForeignKey("branches.id")),
+        sa.Column("start_date", sa.DateTime()),
+        sa.Column("end_date", sa.DateTime()),
+        sa.Column("is_active", sa.Boolean()),
+        indexes=[("ix_coupons_id", ["id"], False), ("ix_coupons_code", ["code"], False)],
+    )
+    create_table(
+        "coupon_usages",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer()),
+        sa.Column("coupon_id", sa.Integer(), sa.ForeignKey("coupons.id")),
+        sa.Column("used_at", sa.DateTime()),
+        indexes=[("ix_coupon_usages_id", ["id"], False), ("ix_coupon_usages_user_id", ["user_id"], False)],
+    )
+    create_table(
+        "order_reviews",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer()),
+        sa.Column("user_name", sa.String(100)),
+        sa.Column("order_id", sa.Integer()),
+        sa.Column("branch_id", sa.Integer()),
+        sa.Column("rating_general", sa.Integer()),
+        sa.Column("comment", sa.String(500)),
+        sa.Column("created_at", sa.DateTime()),
+        indexes=[
+            ("ix_order_reviews_id", ["id"], False),
+            ("ix_order_reviews_order_id", ["order_id"], True),
+            ("ix_order_reviews_branch_id", ["branch_id"], False),
+        ],
+    )
+    create_table(
+        "food_ratings",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("review_id", sa.Integer(), sa.ForeignKey("order_reviews.id")),
+        sa.Column("food_id", sa.Integer(), sa.ForeignKey("foods.id")),
+        sa.Column("score", sa.Integer()),
+        indexes=[("ix_food_ratings_id", ["id"], False)],
+    )
+
+
+def downgrade():
+    op.drop_table("food_ratings")
+    op.drop_table("order_reviews")
+    op.drop_table("coupon_usages")
+    op.drop_table("coupons")
+    op.drop_table("foods")
+    op.drop_table("branches")
@@ -0,0 +1,33 @@
+"""Composite index cho các truy vấn nóng: GET /foods?branch_id và GET /coupons/check/{code}.
+
+Revision ID: 0002_hot_path_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002_hot_path_indexes"
+down_revision = "0001_baseline"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    # GET /foods?branch_id=...
+    ("ix_foods_branch_id", "foods", ["branch_id"]),
+    # GET /coupons/check/{code}: WHERE code = ? AND is_active AND end_date > now
+    ("ix_coupons_code_active_end", "coupons", ["code", "is_active", "end_date"]),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in INDEXES:
+        # Bỏ qua index đã tạo tay trên DB trước đó
+        if name not in {index["name"] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,38 @@
+"""Giới hạn lượt dùng coupon: max_uses/per_user_limit/used_count, bộ đếm theo user, order_id cho coupon_usages.
+
+Revision ID: 0003_coupon_redemption
+Revises: 0002_hot_path_indexes
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003_coupon_redemption"
+down_revision = "0002_hot_path_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("coupons", sa.Column("max_uses", sa.Integer(), nullable=True))
+    op.add_column("coupons", sa.Column("per_user_limit", sa.Integer(), nullable=True))
+    op.add_column("coupons", sa.Column("used_count", sa.Integer(), nullable=False, server_default="0"))
+
+    op.add_column("coupon_usages", sa.Column("order_id", sa.Integer(), nullable=True))
+    op.create_index("ix_coupon_usages_order_id", "coupon_usages", ["order_id"], unique=True)
+
+    op.create_table(
+        "coupon_user_counters",
+        sa.Column("coupon_id", sa.Integer(), sa.ForeignKey("coupons.id"), primary_key=True),
+        sa.Column("user_id", sa.Integer(), primary_key=True),
+        sa.Column("used_count", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade():
+    op.drop_table("coupon_user_counters")
+    op.drop_index("ix_coupon_usages_order_id", table_name="coupon_usages")
+    op.drop_column("coupon_usages", "order_id")
+    op.drop_column("coupons", "used_count")
+    op.drop_column("coupons", "per_user_limit")
+    op.drop_column("coupons", "max_uses")
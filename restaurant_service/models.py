@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Boolean, DateTime, Index
 from sqlalchemy.orm import relationship
 from database import Base
 import datetime
@@ -22,12 +22,14 @@ class Food(Base):
     
     image_url = Column(String(500), nullable=True) 
     
-    branch_id = Column(Integer, ForeignKey("branches.id"))
+    branch_id = Column(Integer, ForeignKey("branches.id"), index=True)
     branch = relationship("Branch", back_populates="foods")
     reviews = relationship("FoodRating", back_populates="food")
 
 class Coupon(Base):
     __tablename__ = "coupons"
+    # Khớp migration 0002_hot_path_indexes
+    __table_args__ = (Index("ix_coupons_code_active_end", "code", "is_active", "end_date"),)
     id = Column(Integer, primary_key=True, index=True)
     code = Column(String(50), index=True)
     discount_percent = Column(Integer)
@@ -39,6 +41,11 @@ class Coupon(Base):
     
     is_active = Column(Boolean, default=True)
 
+    # Giới hạn lượt dùng: None = không giới hạn. used_count tăng bằng UPDATE có điều kiện (không COUNT(*))
+    max_uses = Column(Integer, nullable=True)
+    per_user_limit = Column(Integer, nullable=True)
+    used_count = Column(Integer, nullable=False, default=0, server_default="0")
+
     branch = relationship("Branch", back_populates="coupons")
     # Quan hệ với bảng lịch sử dùng
     usages = relationship("CouponUsage", back_populates="coupon")
@@ -49,10 +56,19 @@ class CouponUsage(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, index=True) # ID của User bên user_service
     coupon_id = Column(Integer, ForeignKey("coupons.id"))
+    # Mỗi đơn chỉ dùng 1 mã, unique để redeem lặp lại cùng order_id là idempotent
+    order_id = Column(Integer, unique=True, index=True, nullable=True)
     used_at = Column(DateTime, default=datetime.datetime.utcnow)
     
     coupon = relationship("Coupon", back_populates="usages")
 
+# Bộ đếm lượt dùng theo (coupon, user) để kiểm tra per_user_limit bằng 1 UPDATE có điều kiện
+class CouponUserCounter(Base):
+    __tablename__ = "coupon_user_counters"
+    coupon_id = Column(Integer, ForeignKey("coupons.id"), primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    used_count = Column(Integer, nullable=False, default=0, server_default="0")
+
 # --- CÁC BẢNG REVIEW ---
 class OrderReview(Base):
     __tablename__ = "order_reviews"
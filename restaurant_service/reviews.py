@@ -0,0 +1,49 @@
+import os
+from typing import Iterable, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from common import auth, tracing
+
+# --- KIỂM TRA QUYỀN ĐÁNH GIÁ ---
+# Đơn hàng nằm ở order_service: chỉ chủ đơn, đơn đã hoàn tất, và chỉ các món có trong đơn mới được chấm điểm
+ORDER_SERVICE_URL = os.getenv("ORDER_SERVICE_URL", "http://order_service:8003")
+REVIEWABLE_STATUS = "COMPLETED"
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+async def fetch_order(order_id: int) -> Optional[dict]:
+    """Đơn hàng (kèm items) từ order_service, không có thì None."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(base_url=ORDER_SERVICE_URL, timeout=5, transport=tracing.httpx_transport())
+    try:
+        res = await _client.get(f"/orders/{order_id}", headers=auth.service_headers())
+    except httpx.HTTPError:
+        raise HTTPException(503, "Order service unavailable")
+    if res.status_code == 404:
+        return None
+    if res.status_code != 200:
+        raise HTTPException(503, "Order service unavailable")
+    return res.json()
+
+
+def check_reviewable(order: Optional[dict], user_id: int, food_ids: Iterable[int]):
+    if order is None:
+        raise HTTPException(404, "Order not found")
+    if order.get("user_id") != user_id:
+        raise HTTPException(403, "Not your order")
+    if order.get("status") != REVIEWABLE_STATUS:
+        raise HTTPException(409, "Order is not completed yet")
+    ordered = {item["food_id"] for item in order.get("items") or []}
+    if any(food_id not in ordered for food_id in food_ids):
+        raise HTTPException(400, "Food is not in this order")
+
+
+async def aclose():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
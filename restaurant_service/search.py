@@ -0,0 +1,246 @@
+import heapq
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import case, func, or_, select
+
+import models
+
+# --- CẤU HÌNH CHỈ MỤC TÌM KIẾM ---
+# Chỉ mục nằm trong RAM của từng process; rebuild định kỳ để các replica khác đồng bộ thay đổi của nhau
+SEARCH_INDEX_REFRESH_SECONDS = float(os.getenv("SEARCH_INDEX_REFRESH_SECONDS", 300))
+# Độ dài tiền tố tối đa được đánh chỉ mục cho mỗi từ (từ dài hơn thì lọc thêm khi tra)
+MAX_PREFIX = 12
+
+
+def normalize(text: str) -> str:
+    """'Phở Bò  Đặc biệt' -> 'pho bo dac biet' (bỏ dấu tiếng Việt, chữ thường, gộp khoảng trắng)."""
+    text = unicodedata.normalize("NFD", text or "").replace("đ", "d").replace("Đ", "D")
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+class Dish:
+    """Một món gom theo tên chuẩn hóa, kèm số liệu tổng hợp của mọi chi nhánh bán món đó."""
+    __slots__ = ("key", "name", "foods", "min_price", "max_price", "image_url",
+                 "branch_count", "rating_sum", "rating_count")
+
+    def __init__(self, key: str, name: str):
+        self.key = key
+        self.name = name
+        # food_id -> (price, branch_id, image_url)
+        self.foods: Dict[int, Tuple[float, int, Optional[str]]] = {}
+        self.rating_sum = 0
+        self.rating_count = 0
+        self.recompute()
+
+    def recompute(self):
+        prices = [price for price, _, _ in self.foods.values()]
+        self.min_price = min(prices) if prices else 0
+        self.max_price = max(prices) if prices else 0
+        self.image_url = next((image for _, _, image in self.foods.values() if image), None)
+        self.branch_count = len({branch_id for _, branch_id, _ in self.foods.values()})
+
+    @property
+    def avg_rating(self) -> float:
+        return round(self.rating_sum / self.rating_count, 2) if self.rating_count else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "image_url": self.image_url,
+            "min_price": self.min_price,
+            "max_price": self.max_price,
+            "avg_rating": self.avg_rating,
+            "review_count": self.rating_count,
+            "branch_count": self.branch_count,
+        }
+
+
+class FoodSearchIndex:
+    """Chỉ mục ngược theo tiền tố từ: prefix -> tập món. Tra 1 truy vấn chỉ đụng tới các món khớp,
+    không quét bảng foods. Được cập nhật ngay khi thêm/sửa/xóa món hoặc có đánh giá mới."""
+
+    def __init__(self):
+        self.dishes: Dict[str, Dish] = {}
+        self.prefixes: Dict[str, Set[str]] = {}
+        self.food_dish: Dict[int, str] = {}
+        # food_id -> (tổng điểm, số lượt đánh giá)
+        self.food_ratings: Dict[int, Tuple[int, int]] = {}
+        # Thêm/sửa/xóa món xảy ra trong lúc rebuild đang chờ DB, áp lại lên chỉ mục mới trước khi đổi
+        # (đặt lại cùng 1 trạng thái nên áp lặp không sao; điểm đánh giá chỉ lấy từ câu SELECT)
+        self.pending: Optional[list] = None
+
+    # --- CẬP NHẬT ---
+    def _index_dish(self, dish: Dish):
+        for token in dish.key.split():
+            for end in range(1, min(len(token), MAX_PREFIX) + 1):
+                self.prefixes.setdefault(token[:end], set()).add(dish.key)
+
+    def _unindex_dish(self, dish: Dish):
+        for token in dish.key.split():
+            for end in range(1, min(len(token), MAX_PREFIX) + 1):
+                keys = self.prefixes.get(token[:end])
+                if keys is not None:
+                    keys.discard(dish.key)
+                    if not keys:
+                        del self.prefixes[token[:end]]
+
+    def upsert_food(self, food):
+        if self.pending is not None:
+            self.pending.append(("upsert_food", food))
+        self._remove_food(food.id)
+        key = normalize(food.name)
+        if not key:
+            return
+        dish = self.dishes.get(key)
+        if dish is None:
+            dish = self.dishes[key] = Dish(key, food.name)
+            self._index_dish(dish)
+        dish.foods[food.id] = (food.price or 0, food.branch_id, food.image_url or None)
+        total, count = self.food_ratings.get(food.id, (0, 0))
+        dish.rating_sum += total
+        dish.rating_count += count
+        dish.recompute()
+        self.food_dish[food.id] = key
+
+    def remove_food(self, food_id: int):
+        if self.pending is not None:
+            self.pending.append(("remove_food", food_id))
+        self._remove_food(food_id)
+
+    def _remove_food(self, food_id: int):
+        key = self.food_dish.pop(food_id, None)
+        dish = self.dishes.get(key) if key else None
+        if dish is None:
+            return
+        dish.foods.pop(food_id, None)
+        total, count = self.food_ratings.get(food_id, (0, 0))
+        dish.rating_sum -= total
+        dish.rating_count -= count
+        if not dish.foods:
+            self._unindex_dish(dish)
+            del self.dishes[key]
+        else:
+            dish.recompute()
+
+    def add_rating(self, food_id: int, score: int):
+        # Không đưa vào pending: rating đã commit trước câu SELECT tổng hợp của rebuild sẽ bị cộng 2 lần.
+        # Rating đến giữa lúc rebuild thì chỉ thiếu tới lần rebuild sau, không bao giờ bị đếm trùng
+        total, count = self.food_ratings.get(food_id, (0, 0))
+        self.food_ratings[food_id] = (total + score, count + 1)
+        dish = self.dishes.get(self.food_dish.get(food_id, ""))
+        if dish is not None:
+            dish.rating_sum += score
+            dish.rating_count += 1
+
+    async def rebuild(self, db):
+        """Dựng lại toàn bộ từ DB (lúc khởi động và định kỳ), đổi chỉ mục mới vào 1 lần."""
+        self.pending = []
+        try:
+            ratings = await db.execute(
+                select(models.FoodRating.food_id, func.sum(models.FoodRating.score), func.count(models.FoodRating.id))
+                .group_by(models.FoodRating.food_id)
+            )
+            foods = (await db.execute(select(models.Food))).scalars().all()
+        except BaseException:
+            self.pending = None
+            raise
+
+        fresh = FoodSearchIndex()
+        fresh.food_ratings = {food_id: (int(total or 0), count) for food_id, total, count in ratings}
+        for food in foods:
+            fresh.upsert_food(food)
+        for name, *args in self.pending:
+            getattr(fresh, name)(*args)
+        self.pending = None
+        self.dishes, self.prefixes = fresh.dishes, fresh.prefixes
+        self.food_dish, self.food_ratings = fresh.food_dish, fresh.food_ratings
+
+    # --- TRA CỨU ---
+    def _candidates(self, tokens: List[str]) -> Set[str]:
+        sets = []
+        for token in tokens:
+            keys = self.prefixes.get(token[:MAX_PREFIX])
+            if not keys:
+                return set()
+            if len(token) > MAX_PREFIX:
+                keys = {k for k in keys if any(t.startswith(token) for t in k.split())}
+            sets.append(keys)
+        sets.sort(key=len)
+        result = set(sets[0])
+        for keys in sets[1:]:
+            result &= keys
+        return result
+
+    def search(self, q: Optional[str], limit: int, offset: int = 0) -> Tuple[int, List[dict]]:
+        """Trả về (tổng số món khớp, 1 trang kết quả đã xếp hạng)."""
+        query = normalize(q or "")
+        if not query:
+            keys = self.dishes.keys()
+        else:
+            keys = self._candidates(query.split())
+
+        def rank(key: str):
+            dish = self.dishes[key]
+            # Khớp nguyên tên > tên bắt đầu bằng truy vấn > khớp tiền tố từng từ; sau đó theo đánh giá
+            match = 0 if key == query else 1 if query and key.startswith(query) else 2
+            return match, -dish.avg_rating, -dish.rating_count, -dish.branch_count, key
+
+        top = heapq.nsmallest(offset + limit, keys, key=rank)
+        return len(keys), [self.dishes[key].to_dict() for key in top[offset:]]
+
+    def stats(self) -> dict:
+        return {"dishes": len(self.dishes), "foods": len(self.food_dish), "prefixes": len(self.prefixes)}
+
+
+food_index = FoodSearchIndex()
+
+
+# --- CÁC QUÁN BÁN 1 MÓN (/foods/options) ---
+OPTIONS_SORTS = {"price": "asc", "-price": "desc"}
+
+
+async def food_options(db, name: str, sort: Optional[str] = None, limit: Optional[int] = None,
+                       offset: int = 0, index: FoodSearchIndex = food_index) -> List[dict]:
+    """Mọi chi nhánh bán món `name` kèm giá sau giảm, trong đúng 1 câu SELECT dù có bao nhiêu quán."""
+    # Cùng cách gom món với /foods/search: "Pho bo" và "Phở Bò" là 1 món
+    dish = index.dishes.get(normalize(name))
+    match = models.Food.name == name
+    if dish is not None:
+        match = or_(match, models.Food.id.in_(list(dish.foods)))
+
+    # 1 câu JOIN lấy luôn tên chi nhánh + giá sau giảm, không lazy load branch cho từng món
+    final_price = case(
+        (models.Food.discount > 0, models.Food.price * (100 - models.Food.discount) / 100),
+        else_=models.Food.price,
+    ).label("final_price")
+    query = (
+        select(models.Food.id, models.Food.branch_id, models.Branch.name, models.Food.image_url,
+               final_price, models.Food.price, models.Food.discount)
+        .outerjoin(models.Branch, models.Branch.id == models.Food.branch_id)
+        .where(match)
+    )
+    if sort:
+        column = final_price.asc() if OPTIONS_SORTS[sort] == "asc" else final_price.desc()
+        query = query.order_by(column, models.Food.id)
+    else:
+        query = query.order_by(models.Food.id)
+    if limit:
+        query = query.limit(limit).offset(offset)
+
+    rows = await db.execute(query)
+    return [
+        {
+            "food_id": food_id,
+            "branch_id": branch_id,
+            "branch_name": branch_name or "Chi nhánh ẩn",
+            "image_url": image_url,
+            "final_price": price_after,
+            "original_price": price,
+            "discount": discount
+        }
+        for food_id, branch_id, branch_name, image_url, price_after, price, discount in rows
+    ]
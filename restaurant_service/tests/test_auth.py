@@ -0,0 +1,62 @@
+import importlib.util
+import os
+import time
+
+import pytest
+
+from common import auth
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def gateway_auth(monkeypatch):
+    """auth.py của gateway (nạp theo đường dẫn, thư mục gateway không nằm trong sys.path của test)."""
+    spec = importlib.util.spec_from_file_location("gateway_auth", os.path.join(ROOT, "gateway_service", "auth.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # sign() đọc khóa lúc gọi nên đổi ở common.auth là đủ cho cả gateway lẫn backend
+    monkeypatch.setattr(auth, "IDENTITY_SIGNING_KEY", "test-key")
+    return module
+
+
+def forwarded(gateway_auth, claims: dict) -> dict:
+    # Starlette giải mã header bằng latin-1
+    return {name.decode("latin-1"): value.decode("latin-1") for name, value in gateway_auth.identity_headers(claims)}
+
+
+def test_signed_identity_carries_user_name(gateway_auth):
+    claims = {"sub": "khach1@gmail.com", "name": "Nguyễn Văn A", "id": 7, "role": "buyer", "exp": time.time() + 60}
+
+    identity = auth.identity_from_headers(forwarded(gateway_auth, claims))
+
+    assert identity["id"] == 7
+    assert identity["name"] == "Nguyễn Văn A"
+
+
+def test_token_without_name_falls_back_to_email(gateway_auth):
+    claims = {"sub": "khach1@gmail.com", "id": 7, "role": "buyer", "exp": time.time() + 60}
+
+    identity = auth.identity_from_headers(forwarded(gateway_auth, claims))
+
+    assert identity["name"] == "khach1@gmail.com"
+
+
+def test_tampered_name_is_rejected(gateway_auth):
+    claims = {"sub": "khach1@gmail.com", "name": "A", "id": 7, "role": "buyer", "exp": time.time() + 60}
+    headers = forwarded(gateway_auth, claims)
+    headers["x-user-name"] = "B"
+
+    assert auth.identity_from_headers(headers) is None
+
+
+def test_service_headers_carry_token_and_signed_user(gateway_auth, monkeypatch):
+    monkeypatch.setattr(auth, "SERVICE_TOKEN", "service-secret")
+    headers = auth.service_headers({"id": 7, "role": "buyer", "exp": time.time() + 60})
+
+    assert auth.is_service_request(headers)
+    assert auth.identity_from_headers(headers)["id"] == 7
+    assert not auth.is_service_request({**headers, auth.SERVICE_TOKEN_HEADER: "guess"})
+    assert not auth.is_service_request({})
+    # Client tự gửi token dịch vụ qua gateway thì bị bỏ
+    assert auth.SERVICE_TOKEN_HEADER in gateway_auth.IDENTITY_HEADER_NAMES
@@ -0,0 +1,62 @@
+import asyncio
+
+import aiosqlite  # noqa: F401  (thiếu thì test phải lỗi, không được skip: pip install -r requirements-test.txt)
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+import models
+from database import Base
+from search import FoodSearchIndex, food_options
+
+
+def run_options(food_count: int, **kwargs):
+    """Tạo food_count chi nhánh cùng bán "Phở Bò" (tên viết khác nhau), gọi food_options và
+    đếm số câu SQL nó chạy bằng listener before_cursor_execute."""
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                for i in range(food_count):
+                    branch = models.Branch(name=f"Chi nhánh {i + 1}")
+                    db.add(models.Food(name="Phở Bò" if i % 2 == 0 else "pho bo", price=50000 + i * 1000,
+                                       discount=10 if i % 3 == 0 else 0, branch=branch))
+                await db.commit()
+                index = FoodSearchIndex()
+                await index.rebuild(db)
+
+                statements = []
+
+                def count(conn, cursor, statement, parameters, context, executemany):
+                    statements.append(statement)
+
+                event.listen(engine.sync_engine, "before_cursor_execute", count)
+                try:
+                    options = await food_options(db, "Phở Bò", index=index, **kwargs)
+                finally:
+                    event.remove(engine.sync_engine, "before_cursor_execute", count)
+            return options, statements
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+def test_query_count_does_not_grow_with_branches():
+    one, one_statements = run_options(1)
+    many, many_statements = run_options(25)
+
+    assert len(one) == 1
+    assert len(many) == 25
+    assert len(one_statements) == len(many_statements) == 1
+
+
+def test_options_have_branch_name_and_final_price():
+    options, _ = run_options(3, sort="-price")
+
+    assert [o["branch_name"] for o in options] == ["Chi nhánh 3", "Chi nhánh 2", "Chi nhánh 1"]
+    assert options[0]["final_price"] == 52000
+    assert options[2]["final_price"] == pytest.approx(45000)
+    assert options[2]["original_price"] == 50000
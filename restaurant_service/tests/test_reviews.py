@@ -0,0 +1,50 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import reviews
+
+ORDER = {"id": 5, "user_id": 7, "status": "COMPLETED", "items": [{"food_id": 1}, {"food_id": 2}]}
+
+
+def status_of(order, user_id, food_ids):
+    with pytest.raises(HTTPException) as e:
+        reviews.check_reviewable(order, user_id, food_ids)
+    return e.value.status_code
+
+
+def test_owner_can_review_foods_in_completed_order():
+    reviews.check_reviewable(ORDER, 7, [1, 2])
+
+
+def test_review_is_rejected_for_other_users_and_foreign_foods():
+    assert status_of(None, 7, [1]) == 404
+    assert status_of(ORDER, 8, [1]) == 403
+    assert status_of({**ORDER, "status": "SHIPPING"}, 7, [1]) == 409
+    assert status_of(ORDER, 7, [1, 3]) == 400
+
+
+def test_fetch_order_sends_service_token(monkeypatch):
+    seen = {}
+
+    def handler(request):
+        seen["token"] = request.headers.get(reviews.auth.SERVICE_TOKEN_HEADER)
+        if request.url.path == "/orders/5":
+            return httpx.Response(200, json=ORDER)
+        return httpx.Response(404, json={"detail": "Order not found"})
+
+    async def run():
+        monkeypatch.setattr(reviews.auth, "SERVICE_TOKEN", "service-secret")
+        monkeypatch.setattr(reviews, "_client", httpx.AsyncClient(base_url="http://order",
+                                                                 transport=httpx.MockTransport(handler)))
+        try:
+            return await reviews.fetch_order(5), await reviews.fetch_order(6)
+        finally:
+            await reviews.aclose()
+
+    found, missing = asyncio.run(run())
+
+    assert found == ORDER and missing is None
+    assert seen["token"] == "service-secret"
@@ -0,0 +1,50 @@
+import asyncio
+
+import aiosqlite  # noqa: F401
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+import models
+from database import Base
+from search import FoodSearchIndex
+
+
+class RacingSession:
+    """Bọc AsyncSession: ngay trước câu SELECT đầu tiên của rebuild, request /reviews vừa commit xong
+    gọi add_rating cho đúng rating mà câu SELECT sẽ thấy."""
+
+    def __init__(self, db, on_first_execute):
+        self.db = db
+        self.on_first_execute = on_first_execute
+
+    async def execute(self, *args, **kwargs):
+        if self.on_first_execute is not None:
+            self.on_first_execute()
+            self.on_first_execute = None
+        return await self.db.execute(*args, **kwargs)
+
+
+def test_rating_during_rebuild_is_not_counted_twice():
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                food = models.Food(name="Phở Bò", price=50000, discount=0, branch=models.Branch(name="CN 1"))
+                db.add(food)
+                await db.commit()
+                index = FoodSearchIndex()
+                await index.rebuild(db)
+
+                db.add(models.FoodRating(food_id=food.id, score=4))
+                await db.commit()
+                await index.rebuild(RacingSession(db, lambda: index.add_rating(food.id, 4)))
+            return index
+        finally:
+            await engine.dispose()
+
+    index = asyncio.run(run())
+
+    _, results = index.search("pho", 10)
+    assert results[0]["review_count"] == 1
+    assert results[0]["avg_rating"] == 4
@@ -13,7 +13,44 @@ DB_NAME = "user_db"
 
 SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# --- CẤU HÌNH CONNECTION POOL ---
+# Các dịch vụ dùng chung 1 MySQL: tổng (POOL_SIZE + MAX_OVERFLOW) x số engine của mọi dịch vụ
+# phải nhỏ hơn max_connections của MySQL (mặc định 151).
+POOL_SIZE = int(os.getenv("USER_DB_POOL_SIZE", 5))
+MAX_OVERFLOW = int(os.getenv("USER_DB_MAX_OVERFLOW", 5))
+# Số giây chờ kết nối rảnh trước khi báo lỗi (thay vì treo request)
+POOL_TIMEOUT = float(os.getenv("USER_DB_POOL_TIMEOUT", 10))
+# Mở lại kết nối cũ hơn N giây, phải nhỏ hơn wait_timeout của MySQL
+POOL_RECYCLE = int(os.getenv("USER_DB_POOL_RECYCLE", 1800))
+# Ping trước khi dùng để bỏ kết nối MySQL đã tự đóng
+POOL_PRE_PING = os.getenv("USER_DB_POOL_PRE_PING", "true").lower() == "true"
+# Số kết nối mở sẵn lúc khởi động
+POOL_WARMUP = int(os.getenv("USER_DB_POOL_WARMUP", 2))
+
+POOL_OPTIONS = dict(
+    pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT,
+    pool_recycle=POOL_RECYCLE, pool_pre_ping=POOL_PRE_PING,
+)
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **POOL_OPTIONS)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+
+def warm_up(count: int = POOL_WARMUP):
+    """Mở sẵn kết nối rồi trả về pool để request đầu tiên không phải chờ kết nối + handshake MySQL."""
+    connections = [engine.connect() for _ in range(min(count, POOL_SIZE))]
+    for connection in connections:
+        connection.close()
+
+
+def run_migrations():
+    """alembic upgrade head: tạo bảng/index còn thiếu (thay cho Base.metadata.create_all)."""
+    from alembic import command
+    from alembic.config import Config
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    config = Config(os.path.join(here, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(here, "migrations"))
+    command.upgrade(config, "head")
@@ -1,7 +1,10 @@
-from fastapi import FastAPI, Depends, HTTPException, Header
+from fastapi import FastAPI, Depends, HTTPException, Header, Request
 from sqlalchemy.orm import Session
-from database import SessionLocal, engine, Base
+from database import SessionLocal, engine, run_migrations, warm_up
 import models
+from common import auth
+from common import metrics
+from common import tracing
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
@@ -9,14 +12,27 @@ from pydantic import BaseModel, validator
 from typing import List, Optional
 import os
 import re
+from contextlib import asynccontextmanager
 
 SECRET_KEY = os.getenv("SECRET_KEY", "chuoi_mac_dinh_phong_khi_quen_set_env")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
-Base.metadata.create_all(bind=engine)
+run_migrations()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Mở sẵn kết nối DB trước khi nhận request
+    warm_up()
+    yield
+
+app = FastAPI(lifespan=lifespan)
+
+# --- METRICS (/metrics) ---
+metrics.instrument(app, engines=[engine])
+
+# --- TRACING (traceparent W3C) ---
+tracing.instrument(app, "user_service")
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def get_db():
@@ -145,6 +161,7 @@ def login(req: LoginRequest, db: Session = Depends(get_db)):
     
     token_data = {
         "sub": user.email, 
+        "name": user.name,
         "id": user.id, 
         "role": user.role,
         "branch_id": user.managed_branch_id,
@@ -171,7 +188,10 @@ def verify_token(authorization: str = Header(None)):
     except JWTError: raise HTTPException(401, "Invalid Token")
 
 # --- API ADDRESS ---
-def get_current_user_id(authorization: str):
+def get_current_user_id(authorization: str, headers=None):
+    # Gateway đã xác thực và ký header danh tính -> không cần giải mã lại token
+    identity = auth.identity_from_headers(headers) if headers is not None else None
+    if identity: return identity["id"]
     if not authorization: return None
     token = authorization.replace("Bearer ", "")
     try:
@@ -180,8 +200,8 @@ def get_current_user_id(authorization: str):
     except: return None
 
 @app.post("/users/addresses", response_model=AddressResponse)
-def add_address(addr: AddressCreate, authorization: str = Header(None), db: Session = Depends(get_db)):
-    user_id = get_current_user_id(authorization)
+def add_address(addr: AddressCreate, request: Request, authorization: str = Header(None), db: Session = Depends(get_db)):
+    user_id = get_current_user_id(authorization, request.headers)
     if not user_id: raise HTTPException(401, "Invalid Token")
     
     # [MỚI] Lưu thêm cột name
@@ -198,8 +218,8 @@ def add_address(addr: AddressCreate, authorization: str = Header(None), db: Sess
     return new_addr
 
 @app.get("/users/addresses", response_model=List[AddressResponse])
-def get_my_addresses(authorization: str = Header(None), db: Session = Depends(get_db)):
-    user_id = get_current_user_id(authorization)
+def get_my_addresses(request: Request, authorization: str = Header(None), db: Session = Depends(get_db)):
+    user_id = get_current_user_id(authorization, request.headers)
     if not user_id: raise HTTPException(401, "Invalid Token")
     return db.query(models.UserAddress).filter(models.UserAddress.user_id == user_id).all()
 
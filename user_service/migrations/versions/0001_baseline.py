@@ -0,0 +1,54 @@
+"""Baseline: schema user_db như khi còn tạo bằng Base.metadata.create_all.
+
+DB cũ đã có bảng thì bỏ qua, chỉ ghi nhận revision.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001_baseline"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def create_table(name, *columns, indexes=()):
+    if sa.inspect(op.get_bind()).has_table(name):
+        return
+    op.create_table(name, *columns)
+    for index_name, index_columns, unique in indexes:
+        op.create_index(index_name, name, index_columns, unique=unique)
+
+
+def upgrade():
+    create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(100)),
+        sa.Column("email", sa.String(100)),
+        sa.Column("hashed_password", sa.String(200)),
+        sa.Column("role", sa.String(20)),
+        sa.Column("seller_mode", sa.String(20), nullable=True),
+        sa.Column("managed_branch_id", sa.Integer(), nullable=True),
+        sa.Column("phone", sa.String(20), nullable=True),
+        sa.Column("address", sa.String(255), nullable=True),
+        indexes=[("ix_users_id", ["id"], False), ("ix_users_email", ["email"], True)],
+    )
+    create_table(
+        "user_addresses",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("title", sa.String(50)),
+        sa.Column("name", sa.String(100)),
+        sa.Column("address", sa.String(255)),
+        sa.Column("phone", sa.String(20)),
+        indexes=[("ix_user_addresses_id", ["id"], False)],
+    )
+
+
+def downgrade():
+    op.drop_table("user_addresses")
+    op.drop_table("users")